@@ -4,26 +4,33 @@ from __future__ import annotations
 
 import base64
 import hashlib
+from functools import lru_cache
 
 from cryptography.fernet import Fernet, InvalidToken
 from django.conf import settings
 
 
-def _derive_key() -> bytes:
-    digest = hashlib.sha256(settings.SECRET_KEY.encode()).digest()
+def _derive_key(secret_key: str) -> bytes:
+    digest = hashlib.sha256(secret_key.encode()).digest()
     return base64.urlsafe_b64encode(digest)
 
 
+@lru_cache(maxsize=4)
+def _fernet(secret_key: str) -> Fernet:
+    # Ключ выводится один раз на SECRET_KEY, а не на каждое (рас)шифрование.
+    return Fernet(_derive_key(secret_key))
+
+
 def encrypt(plaintext: str) -> str:
     if not plaintext:
         return ""
-    return Fernet(_derive_key()).encrypt(plaintext.encode()).decode()
+    return _fernet(settings.SECRET_KEY).encrypt(plaintext.encode()).decode()
 
 
 def decrypt(ciphertext: str) -> str:
     if not ciphertext:
         return ""
     try:
-        return Fernet(_derive_key()).decrypt(ciphertext.encode()).decode()
+        return _fernet(settings.SECRET_KEY).decrypt(ciphertext.encode()).decode()
     except InvalidToken:
         return ""
@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import TraderProfile
+from .token_provider import invalidate_admin_token
+
+
+@receiver(post_save, sender=TraderProfile)
+@receiver(post_delete, sender=TraderProfile)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """Токен профиля мог измениться — процессы перечитают его после коммита."""
+    transaction.on_commit(invalidate_admin_token)
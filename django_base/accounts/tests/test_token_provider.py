@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class AdminTokenProviderTests(TestCase):
+    def setUp(self):
+        from accounts import token_provider
+        cache.clear()
+        token_provider._entry = None
+        self.addCleanup(setattr, token_provider, "_entry", None)
+
+    def _admin_profile(self, token):
+        from accounts.models import TraderProfile
+        user = get_user_model().objects.create_user(username="admin", password="x")
+        profile = TraderProfile(user=user)
+        profile.tinkoff_token = token
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        return profile
+
+    def test_token_cached_until_profile_changes(self):
+        from accounts.token_provider import get_admin_token
+        profile = self._admin_profile("t.first")
+
+        self.assertEqual(get_admin_token(), "t.first")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_admin_token(), "t.first")
+
+        profile.tinkoff_token = "t.second"
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertEqual(get_admin_token(), "t.second")
+
+    def test_missing_profile_cached_as_none(self):
+        from accounts.token_provider import get_admin_token
+        self.assertIsNone(get_admin_token())
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_admin_token())
+
+    @override_settings(ADMIN_TOKEN_CACHE_TTL=0)
+    def test_ttl_expiry_reloads(self):
+        from accounts.token_provider import get_admin_token
+        self._admin_profile("t.first")
+        get_admin_token()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_admin_token(), "t.first")
+
+
+class EncryptionTests(SimpleTestCase):
+    def test_roundtrip_with_memoized_fernet(self):
+        from accounts.encryption import _fernet, decrypt, encrypt
+        ciphertext = encrypt("secret")
+        self.assertEqual(decrypt(ciphertext), "secret")
+        with override_settings(SECRET_KEY="other-key"):
+            self.assertEqual(decrypt(ciphertext), "")
+        self.assertIs(_fernet("k"), _fernet("k"))
@@ -0,0 +1,61 @@
+"""
+Расшифрованный T-Invest токен admin-пользователя с кешем на процесс.
+
+Фоновые задачи берут токен на каждый запуск; без кеша это каждый раз запрос
+``TraderProfile`` + ``User`` и расшифровка Fernet. Токен живёт в памяти
+процесса ``settings.ADMIN_TOKEN_CACHE_TTL`` секунд. Сохранение или удаление
+профиля (``accounts.signals``) повышает версию в общем кеше — все процессы
+перечитывают токен при следующем обращении, не дожидаясь TTL.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+ADMIN_USERNAME = "admin"
+
+_VERSION_KEY = "accounts:admin_token:version"
+
+_lock = threading.Lock()
+# (токен, версия, monotonic-время истечения)
+_entry: tuple[str | None, int, float] | None = None
+
+
+def _load_admin_token() -> str | None:
+    from accounts.models import TraderProfile
+    try:
+        profile = TraderProfile.objects.select_related("user").get(user__username=ADMIN_USERNAME)
+    except TraderProfile.DoesNotExist:
+        return None
+    return profile.tinkoff_token or None
+
+
+def get_admin_token() -> str | None:
+    """T-Invest токен admin-пользователя или ``None``, если он не задан."""
+    global _entry
+    version = cache.get(_VERSION_KEY, 0)
+    now = time.monotonic()
+    with _lock:
+        entry = _entry
+    if entry is not None and entry[1] == version and now < entry[2]:
+        return entry[0]
+
+    token = _load_admin_token()
+    with _lock:
+        _entry = (token, version, now + settings.ADMIN_TOKEN_CACHE_TTL)
+    return token
+
+
+def invalidate_admin_token() -> None:
+    """Сбросить закэшированный токен во всех процессах."""
+    global _entry
+    with _lock:
+        _entry = None
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.set(_VERSION_KEY, 1, None)
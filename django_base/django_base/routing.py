@@ -1,7 +1,8 @@
 from django.urls import re_path
 
-from instruments.consumers import CandleSyncConsumer
+from instruments.consumers import CandleStreamConsumer, CandleSyncConsumer
 
 websocket_urlpatterns = [
     re_path(r"ws/candles-sync/(?P<ticker>[A-Z0-9._-]+)/$", CandleSyncConsumer.as_asgi()),
+    re_path(r"ws/candles/$", CandleStreamConsumer.as_asgi()),
 ]
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from datetime import date, timedelta
 from typing import List
+from celery.schedules import crontab
 from decouple import config, Csv
 import os
 from pathlib import Path
@@ -212,6 +213,11 @@ CACHES = {
 # Path to candle CSV storage
 CANDLES_ROOT = Path(BASE_DIR).parent / "uploads" / "candles"
 
+# Бэкенд хранения свечей: "csv" (дневные CSV) | "binary" (записи фиксированной
+# ширины на тикер-месяц). Перед переключением на binary перенести данные:
+# python manage.py convert_candles_storage
+CANDLES_STORAGE_BACKEND = config("CANDLES_STORAGE_BACKEND", default="csv")
+
 # === Свечи: глубина истории по умолчанию ===
 CANDLES_HISTORY_START_YEAR = config(
     "CANDLES_HISTORY_START_YEAR",
@@ -219,13 +225,46 @@ CANDLES_HISTORY_START_YEAR = config(
     cast=int,
 )
 CANDLES_SYNC_LOCK_TTL = 21600  # 6 часов
+# Heartbeat live-ленты stream_candles: пока он не истёк, sync_candles_round
+# не опрашивает T-Invest по тикерам ленты. Больше интервала ping стрима.
+CANDLES_LIVE_HEARTBEAT_TTL = 300  # секунд
+# Бюджет одного раунда sync_candles_round: меньше периода Beat (300 с),
+# не успевшие тикеры переходят в следующий раунд.
+CANDLES_SYNC_ROUND_BUDGET = config("CANDLES_SYNC_ROUND_BUDGET", default=240, cast=int)
+
+# Расшифрованный T-Invest токен admin в памяти процесса (accounts/token_provider.py);
+# смена токена в профиле сбрасывает его во всех процессах сразу.
+ADMIN_TOKEN_CACHE_TTL = 300  # секунд
+
+# === T-Invest: загрузка свечей ===
+# Квота GetCandles на токен (запросов в минуту) и число одновременных
+# суточных запросов (instruments/tinkoff_async.py).
+TINKOFF_CANDLES_RPM = config("TINKOFF_CANDLES_RPM", default=600, cast=int)
+TINKOFF_CANDLES_CONCURRENCY = config("TINKOFF_CANDLES_CONCURRENCY", default=8, cast=int)
+# Квоты сервисов T-Invest на токен, запросов в минуту — общие для всех
+# воркеров (instruments/tinkoff_ratelimit.py, состояние в Redis).
+TINKOFF_RATE_LIMITS = {
+    "market_data": TINKOFF_CANDLES_RPM,
+    "instruments": config("TINKOFF_INSTRUMENTS_RPM", default=200, cast=int),
+    "users": config("TINKOFF_USERS_RPM", default=100, cast=int),
+}
 
 # Celery Beat periodic tasks
 CELERY_BEAT_SCHEDULE = {
-    "update-today-candles": {
-        "task": "instruments.tasks.update_today_candles",
+    # Один раунд догрузки за сегодня на все тикеры (вместо fan-out
+    # update_today_candles); tick пропускается, пока идёт предыдущий.
+    "sync-candles-round": {
+        "task": "instruments.tasks.sync_candles_round",
         "schedule": 300.0,  # every 5 minutes
     },
+    "sync-instrument-uids": {
+        "task": "instruments.tasks.sync_instrument_uids",
+        "schedule": crontab(hour=6, minute=30),  # до открытия торгов
+    },
+    "compact-candles-storage": {
+        "task": "instruments.tasks.compact_candles_storage",
+        "schedule": crontab(hour=3, minute=30),  # ночью, вне торговой сессии
+    },
 }
 
 # Easy Thumbnails settings
@@ -7,6 +7,8 @@ from .models import (
     SubIndustry,
     FuturesAssetCodeMapping,
     Futures,
+    TradingCalendarDay,
+    EmptyCandleDay,
 )
 
 
@@ -91,4 +93,20 @@ class FuturesAdmin(admin.ModelAdmin):
     search_fields = ('ticker', 'name', 'base_asset__ticker')
     readonly_fields = ('created_at', 'updated_at')
     ordering = ('base_asset', 'expiration_date')
-    autocomplete_fields = ('base_asset',)
\ No newline at end of file
+    autocomplete_fields = ('base_asset',)
+
+
+@admin.register(TradingCalendarDay)
+class TradingCalendarDayAdmin(admin.ModelAdmin):
+    list_display = ('date', 'is_trading', 'note')
+    list_filter = ('is_trading',)
+    search_fields = ('note',)
+    ordering = ('-date',)
+
+
+@admin.register(EmptyCandleDay)
+class EmptyCandleDayAdmin(admin.ModelAdmin):
+    list_display = ('ticker', 'date', 'created_at')
+    search_fields = ('ticker',)
+    readonly_fields = ('created_at',)
+    ordering = ('ticker', '-date')
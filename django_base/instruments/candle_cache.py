@@ -0,0 +1,221 @@
+"""
+Версионированные ключи кэша ответов CandleDataView.
+
+У каждого тикер-месяца есть счётчик версии ``candles:ver:{TICKER}:{YYYY-MM}``
+(без TTL). Ключ ответа включает сумму версий месяцев окна, поэтому
+инвалидация после записи свечей — ``INCR`` счётчиков затронутых месяцев вместо
+``delete_pattern`` (SCAN по всему keyspace Redis); окна, не задевающие эти
+месяцы, остаются в кэше. Старые записи просто истекают по своему TTL.
+
+Отсутствующий (новый или вытесненный) счётчик инициализируется текущим
+временем в микросекундах — сумма версий окна только растёт и не совпадает
+ни с одной прежней.
+
+Под ответами — кэш блоков баров ``read_cached_candle_records``: байты
+CANDLE_DTYPE за день (интервалы < 1h) или месяц (от 1h) по каждому
+стандартному интервалу. Произвольное окно собирается из блоков, поэтому
+сдвиг графика назад переиспользует уже прочитанные дни. Закрытые блоки
+хранятся без TTL и переживают синхронизацию текущего дня: инвалидация
+удаляет только блоки затронутых дней (``delete_many`` по известным ключам).
+У каждого блока свой счётчик версии ``candles:blkver:...``, входящий в ключ
+блока: инвалидация удаляет счётчик, и блок, прочитанный из хранилища до неё,
+но записанный в кэш после, оседает под старой версией и больше не читается.
+Обслуживание, переписывающее хранилище тикера целиком (уплотнение,
+пересборка свёрток, конвертация), сбрасывает весь его кэш —
+``invalidate_ticker_candles_cache``.
+"""
+
+from __future__ import annotations
+
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from django.core.cache import cache
+
+from instruments.candle_storage import (
+    CANDLE_DTYPE,
+    ROLLUP_INTERVALS,
+    CandleStorage,
+    _slice_days,
+    empty_records,
+    get_candle_storage,
+)
+
+# Интервалы, для которых кэшируются блоки (бары не пересекают границу суток).
+BLOCK_INTERVALS: tuple[int, ...] = (1, *ROLLUP_INTERVALS)
+
+# TTL блока, включающего сегодняшний день (ещё дописывается).
+LIVE_BLOCK_TTL = 300
+
+# Блоков в одном get_many при сборке окна от till_date назад.
+_BLOCK_BATCH = 31
+
+
+def _version_key(ticker: str, year: int, month: int) -> str:
+    return f"candles:ver:{ticker.upper()}:{year}-{month:02d}"
+
+
+def _month_keys(ticker: str, from_date: date, till_date: date) -> list[str]:
+    keys = []
+    year, month = from_date.year, from_date.month
+    while (year, month) <= (till_date.year, till_date.month):
+        keys.append(_version_key(ticker, year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+
+def _fresh_version() -> int:
+    return time.time_ns() // 1000
+
+
+def candles_cache_key(ticker: str, from_date: date, till_date: date, *parts) -> str:
+    """Ключ кэша окна [from_date, till_date]; ``parts`` — интервал, формат и т.п."""
+    keys = _month_keys(ticker, from_date, till_date)
+    versions = cache.get_many(keys)
+    missing = [k for k in keys if k not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _fresh_version(), None)
+        versions.update(cache.get_many(missing))
+    generation = sum(versions.values())
+    suffix = ":".join(str(p) for p in parts)
+    return f"candles:{ticker}:{from_date}:{till_date}:{suffix}:v{generation}"
+
+
+def invalidate_candles_cache(ticker: str, from_date: date, till_date: date) -> None:
+    """Сделать устаревшими закэшированные окна и блоки, задевающие [from_date, till_date]."""
+    for key in _month_keys(ticker, from_date, till_date):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh_version(), None)
+    version_keys = {
+        _block_version_key(ticker, interval, first): (interval, first)
+        for interval in BLOCK_INTERVALS
+        for first, _ in _iter_blocks(interval, from_date, till_date)
+    }
+    versions = cache.get_many(list(version_keys))
+    cache.delete_many([
+        *version_keys,
+        *(_block_key(ticker, *version_keys[key], version) for key, version in versions.items()),
+    ])
+
+
+def invalidate_ticker_candles_cache(ticker: str, storage: CandleStorage | None = None) -> None:
+    """Сбросить кэш тикера за всю историю ``storage`` (1-мин ряд и «родные» свёртки)."""
+    storage = storage or get_candle_storage()
+    spans = [storage.date_span(ticker), *storage.native_spans(ticker).values()]
+    spans = [span for span in spans if span is not None]
+    if spans:
+        invalidate_candles_cache(ticker, min(s[0] for s in spans), max(s[1] for s in spans))
+
+
+# ---------------------------------------------------------------------------
+# Блоки баров
+# ---------------------------------------------------------------------------
+
+def _block_bounds(interval: int, day: date) -> tuple[date, date]:
+    if interval < 60:
+        return day, day
+    first = day.replace(day=1)
+    nxt = date(first.year + 1, 1, 1) if first.month == 12 else date(first.year, first.month + 1, 1)
+    return first, nxt - timedelta(days=1)
+
+
+def _iter_blocks(interval: int, from_date: date, till_date: date, reverse: bool = False):
+    """Границы блоков, покрывающих [from_date, till_date]."""
+    if reverse:
+        current = till_date
+        while current >= from_date:
+            first, last = _block_bounds(interval, current)
+            yield first, last
+            current = first - timedelta(days=1)
+        return
+    current = from_date
+    while current <= till_date:
+        first, last = _block_bounds(interval, current)
+        yield first, last
+        current = last + timedelta(days=1)
+
+
+def _block_version_key(ticker: str, interval: int, first: date) -> str:
+    return f"candles:blkver:{ticker.upper()}:{interval}:{first.isoformat()}"
+
+
+def _block_key(ticker: str, interval: int, first: date, version: int) -> str:
+    return f"candles:blk:{ticker.upper()}:{interval}:{first.isoformat()}:v{version}"
+
+
+def _block_versions(ticker: str, interval: int, firsts: list[date]) -> dict[date, int]:
+    """Текущие версии блоков; отсутствующие счётчики инициализируются."""
+    keys = {first: _block_version_key(ticker, interval, first) for first in firsts}
+    versions = cache.get_many(list(keys.values()))
+    missing = [k for k in keys.values() if k not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _fresh_version(), None)
+        versions.update(cache.get_many(missing))
+    return {first: versions[key] for first, key in keys.items()}
+
+
+def read_cached_candle_records(
+    ticker: str,
+    from_date: date,
+    till_date: date,
+    interval: int = 1,
+    limit: int | None = None,
+) -> np.ndarray:
+    """
+    ``read_candle_records`` через кэш блоков: окно собирается из блоков от
+    till_date назад (с ``limit`` — пока не наберётся ``limit`` баров),
+    недостающие блоки читаются из хранилища одним запросом на пачку.
+    Нестандартные интервалы читаются напрямую.
+    """
+    from instruments.candles import read_candle_records
+
+    if interval not in BLOCK_INTERVALS:
+        return read_candle_records(ticker, from_date, till_date, interval, limit)
+
+    today = date.today()
+    blocks = _iter_blocks(interval, from_date, till_date, reverse=True)
+    parts: list[np.ndarray] = []
+    have = 0
+    while limit is None or have < limit:
+        batch = [b for _, b in zip(range(_BLOCK_BATCH), blocks)]
+        if not batch:
+            break
+        # Версии читаются до хранилища: инвалидация между чтением и записью
+        # сменит версию, и записанный ниже блок останется недостижимым.
+        versions = _block_versions(ticker, interval, [first for first, _ in batch])
+        keys = {first: _block_key(ticker, interval, first, versions[first]) for first, _ in batch}
+        cached = cache.get_many(list(keys.values()))
+
+        missing = [(first, last) for first, last in batch if keys[first] not in cached]
+        if missing:
+            # batch идёт от новых блоков к старым.
+            records = read_candle_records(ticker, missing[-1][0], missing[0][1], interval)
+            closed, live = {}, {}
+            for first, last in missing:
+                payload = _slice_days(records, first, last).tobytes()
+                cached[keys[first]] = payload
+                (live if last >= today else closed)[keys[first]] = payload
+            if closed:
+                cache.set_many(closed, None)
+            if live:
+                cache.set_many(live, LIVE_BLOCK_TTL)
+
+        for first, _ in batch:
+            block = np.frombuffer(cached[keys[first]], dtype=CANDLE_DTYPE)
+            block = _slice_days(block, from_date, till_date)
+            if len(block):
+                parts.append(block)
+                have += len(block)
+
+    if not parts:
+        return empty_records()
+    parts.reverse()
+    records = np.concatenate(parts) if len(parts) > 1 else parts[0]
+    if limit is not None and len(records) > limit:
+        records = records[len(records) - limit:]
+    return records
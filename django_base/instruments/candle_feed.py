@@ -0,0 +1,158 @@
+"""
+Live-лента 1-мин свечей из MarketDataStream T-Invest.
+
+``manage.py stream_candles`` держит один стрим с подпиской на минутные свечи
+всех активных инструментов (``waiting_close`` — приходят только закрытые
+бары). Каждый бар сразу дописывается в хранилище и рассылается в группу
+Channels ``live_group(ticker)`` событием ``candle.bar``::
+
+    {"type": "candle.bar", "ticker": "SBER",
+     "candle": {"time": ts, "open": ..., "high": ..., "low": ..., "close": ..., "volume": ...}}
+
+``time`` — как в ``CandleDataView`` (секунды, московское время как UTC).
+
+Пока лента жива (heartbeat в кеше со списком тикеров подписки), периодический
+``sync_candles_round`` не опрашивает T-Invest по этим тикерам; после
+переподключения пропуск за сегодня добивается обычной догрузкой. Новые бары
+сегодняшнего дня, сохранённые догрузкой, рассылаются тем же событием
+(``publish_bars``).
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from tinkoff.invest import CandleInstrument, SubscriptionInterval
+
+from instruments.candle_cache import invalidate_candles_cache
+from instruments.candle_storage import ts_to_day
+from instruments.candles import save_candle_records
+from instruments.tinkoff_async import candle_records
+from instruments.tinkoff_candles import tinkoff_client
+
+logger = logging.getLogger(__name__)
+
+LIVE_HEARTBEAT_KEY = "candles:live_stream"
+# Баров за одну рассылку не больше: остальное клиент дочитает через CandleDataView.
+LIVE_BROADCAST_MAX = 60
+# Не чаще, чем раз в столько секунд, обновлять heartbeat.
+_HEARTBEAT_EVERY = 30
+
+
+def live_group(ticker: str) -> str:
+    """Группа Channels с закрытыми барами тикера."""
+    return f"candles_live_{ticker.upper()}"
+
+
+def live_tickers() -> set[str]:
+    """Тикеры, которые сейчас приходят из ``stream_candles`` (heartbeat не истёк)."""
+    return set(cache.get(LIVE_HEARTBEAT_KEY) or ())
+
+
+def _bar(record: np.void) -> dict[str, Any]:
+    return {
+        "time": int(record["ts"]),
+        "open": float(record["open"]),
+        "high": float(record["high"]),
+        "low": float(record["low"]),
+        "close": float(record["close"]),
+        "volume": int(record["volume"]),
+    }
+
+
+def publish_bars(ticker: str, records: np.ndarray, layer=None) -> None:
+    """Разослать бары (по возрастанию ts) в ``live_group(ticker)`` событиями ``candle.bar``."""
+    layer = layer or get_channel_layer()
+    if layer is None:
+        return
+    ticker = ticker.upper()
+    for record in records[-LIVE_BROADCAST_MAX:]:
+        event = {"type": "candle.bar", "ticker": ticker, "candle": _bar(record)}
+        async_to_sync(layer.group_send)(live_group(ticker), event)
+
+
+def ingest_candle(ticker: str, records: np.ndarray, layer=None) -> None:
+    """
+    Дописать закрытый бар (массив CANDLE_DTYPE из одной записи,
+    ``candle_records``) и разослать его. Штатный тик — дозапись в конец
+    партиции дня без DataFrame и без перезаписи манифеста.
+    """
+    ticker = ticker.upper()
+    save_candle_records(ticker, records)
+    day = ts_to_day(records["ts"][0])
+    invalidate_candles_cache(ticker, day, day)
+    cache.delete(f"candles:last_saved:{ticker}")
+    publish_bars(ticker, records, layer)
+
+
+class CandleFeed:
+    """Разбор ответов MarketDataStream: uid → тикер, закрытые бары — в ``ingest_candle``."""
+
+    def __init__(self, tickers_by_uid: dict[str, str], layer=None):
+        self.tickers_by_uid = tickers_by_uid
+        self.layer = layer or get_channel_layer()
+        self.bars = 0
+        # Тикеры, бар которых не записался: их снова опрашивает sync_candles_round.
+        self.degraded: set[str] = set()
+        self._heartbeat_at = 0.0
+
+    def subscriptions(self) -> list:
+        return [
+            CandleInstrument(
+                instrument_id=uid,
+                interval=SubscriptionInterval.SUBSCRIPTION_INTERVAL_ONE_MINUTE,
+            )
+            for uid in self.tickers_by_uid
+        ]
+
+    def _touch(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self._heartbeat_at >= _HEARTBEAT_EVERY:
+            tickers = sorted(set(self.tickers_by_uid.values()) - self.degraded)
+            cache.set(LIVE_HEARTBEAT_KEY, tickers, settings.CANDLES_LIVE_HEARTBEAT_TTL)
+            self._heartbeat_at = now
+
+    def handle(self, response) -> None:
+        """Один ``MarketDataResponse`` стрима."""
+        self._touch()
+
+        status = getattr(response, "subscribe_candles_response", None)
+        if status is not None:
+            for sub in status.candles_subscriptions:
+                if getattr(sub.subscription_status, "name", None) != "SUBSCRIPTION_STATUS_SUCCESS":
+                    logger.warning("candle subscription %s: %s", sub.instrument_uid, sub.subscription_status)
+
+        candle = getattr(response, "candle", None)
+        if candle is None:
+            return
+        ticker = self.tickers_by_uid.get(candle.instrument_uid)
+        if ticker is None:
+            return
+        try:
+            ingest_candle(ticker, candle_records([candle]), self.layer)
+            self.bars += 1
+        except Exception as exc:
+            # Стрим из-за одной записи не рвём: тикер уходит на опрос
+            # sync_candles_round, который и догрузит бар.
+            logger.error("live candle %s %s: %s", ticker, candle.time, exc)
+            if ticker not in self.degraded:
+                self.degraded.add(ticker)
+                self._touch(force=True)
+
+    def run(self, token: str) -> None:
+        """Подписаться и обрабатывать стрим до его закрытия или ошибки."""
+        with tinkoff_client(token) as client:
+            stream = client.create_market_data_stream()
+            stream.candles.waiting_close().subscribe(self.subscriptions())
+            try:
+                for response in stream:
+                    self.handle(response)
+            finally:
+                stream.stop()
@@ -0,0 +1,98 @@
+"""
+Манифест 1-мин ряда тикера: по каждому дню с данными — число баров, первый и
+последний ``ts``.
+
+Файл ``{TICKER}/.manifest.{backend}.json`` ведёт сам писатель хранилища
+(``CandleStorage.write`` под блокировкой тикера), поэтому поиск пропусков и
+последней сохранённой свечи (``instruments.candles_gaps``) не открывает файлы
+свечей. Формат::
+
+    {"version": 1, "days": {"2026-05-04": [rows, first_ts, last_ts], ...}}
+
+Манифест — производные данные: на время записи файл удаляется, и при его
+отсутствии (старое дерево, авария посреди записи) он строится заново по
+партициям. Дозапись в конец уже начатого дня (live-тик) манифест не трогает:
+набор дней от неё не меняется, ``rows``/``last_ts`` такого дня уточняет
+``CandleStorage.compact``, а последний ts ``CandleStorage.last_datetime``
+дочитывает из хвоста партиции.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST_VERSION = 1
+
+_SECONDS_PER_DAY = 86400
+_EPOCH = date(1970, 1, 1)
+
+
+def _day_stats(records: np.ndarray) -> dict[date, list[int]]:
+    """{день: [rows, first_ts, last_ts]} по отсортированному массиву CANDLE_DTYPE."""
+    if not len(records):
+        return {}
+    ts = records["ts"]
+    days, starts, counts = np.unique(ts // _SECONDS_PER_DAY, return_index=True, return_counts=True)
+    return {
+        _EPOCH + timedelta(days=int(day)): [int(count), int(ts[start]), int(ts[start + count - 1])]
+        for day, start, count in zip(days.tolist(), starts.tolist(), counts.tolist())
+    }
+
+
+class CandleManifest:
+    """Статистика по дням 1-мин ряда; ``days`` — {день: [rows, first_ts, last_ts]}."""
+
+    def __init__(self, days: dict[date, list[int]] | None = None):
+        self.days: dict[date, list[int]] = days or {}
+
+    @classmethod
+    def load(cls, path: Path) -> CandleManifest | None:
+        """Прочитать манифест; ``None`` — файла нет или он не читается."""
+        try:
+            payload = json.loads(path.read_bytes())
+            if payload.get("version") != MANIFEST_VERSION:
+                return None
+            return cls({date.fromisoformat(day): stats for day, stats in payload["days"].items()})
+        except (OSError, ValueError, KeyError, AttributeError):
+            return None
+
+    def to_bytes(self) -> bytes:
+        days = {day.isoformat(): self.days[day] for day in sorted(self.days)}
+        return json.dumps({"version": MANIFEST_VERSION, "days": days}, separators=(",", ":")).encode()
+
+    # --- обновление ---------------------------------------------------------
+
+    def replace_days(self, records: np.ndarray) -> None:
+        """Дни из ``records`` переписаны целиком (новая партиция или merge)."""
+        self.days.update(_day_stats(records))
+
+    def add_appended(self, appended: np.ndarray, previous: np.ndarray | None) -> None:
+        """
+        Бары дописаны в конец партиции; ``previous`` — заменённый последний
+        бар (тот же ts, что у ``appended[0]``) — не добавляет строку.
+        """
+        stats = _day_stats(appended)
+        replaced = int(previous["ts"][0]) // _SECONDS_PER_DAY if previous is not None else None
+        for day, (rows, first_ts, last_ts) in stats.items():
+            if (day - _EPOCH).days == replaced:
+                rows -= 1
+            current = self.days.get(day)
+            if current is None:
+                self.days[day] = [rows, first_ts, last_ts]
+            else:
+                self.days[day] = [current[0] + rows, min(current[1], first_ts), max(current[2], last_ts)]
+
+    # --- запросы ------------------------------------------------------------
+
+    def days_present(self, start: date, end: date) -> set[date]:
+        return {day for day, stats in self.days.items() if start <= day <= end and stats[0] > 0}
+
+    def last_datetime(self) -> datetime | None:
+        """Последний ts ряда (московское время, naive)."""
+        if not self.days:
+            return None
+        return datetime(1970, 1, 1) + timedelta(seconds=self.days[max(self.days)][2])
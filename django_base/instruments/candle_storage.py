@@ -0,0 +1,942 @@
+"""
+Бэкенды хранения минутных свечей.
+
+- CsvCandleStorage    — исторический формат ``{TICKER}/{YYYY}/{MM}/{DD}.csv``
+- BinaryCandleStorage — бинарный формат ``{TICKER}/{YYYY}/{MM}.bin``: массив
+  записей фиксированной ширины (CANDLE_DTYPE) на тикер-месяц; читается через
+  ``numpy.memmap``, диапазон находится бинарным поиском по ``ts``
+
+Оба бэкенда работают с одним представлением — структурированным numpy-массивом
+CANDLE_DTYPE, отсортированным по ``ts``. ``ts`` — московское время в секундах,
+объявленное «как UTC» (то же значение, что уходит в lightweight-charts).
+
+Вместе с 1-мин рядом при записи поддерживаются свёртки ROLLUP_INTERVALS
+(5m … 1D) в ``{TICKER}/rollups/{interval}/`` — чтение крупных таймфреймов
+берёт готовые бары вместо ресемплинга минут. Длинную историю без 1-мин ряда
+можно записать в свёртку напрямую свечами из API (``write(..., interval=)``):
+такие «родные» диапазоны помнит ``rollups/.native.json``, и пересборка свёрток
+их сохраняет.
+
+Файлы переписываются атомарно (временный файл + ``os.replace``), дозапись
+терпит оборванный хвост; писатели одного тикера сериализуются блокировкой
+``{TICKER}/.lock`` (``CandleStorage.lock``). Писатель ведёт манифест дней
+1-мин ряда (``instruments.candle_manifest``) — служебные запросы
+``days_present``/``last_datetime`` отвечают по нему, не читая партиций.
+
+Активный бэкенд выбирается через ``settings.CANDLES_STORAGE_BACKEND``
+(``csv`` | ``binary``); перевод существующего дерева —
+``manage.py convert_candles_storage``.
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from instruments.candle_manifest import CandleManifest
+
+try:
+    import fcntl
+except ImportError:  # не POSIX: межпроцессная блокировка недоступна
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CANDLE_COLUMNS = ["datetime", "open", "high", "low", "close", "volume", "value"]
+
+CANDLE_DTYPE = np.dtype([
+    ("ts", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<i8"),
+    ("value", "<f8"),
+])
+
+_SECONDS_PER_DAY = 86400
+_EPOCH = date(1970, 1, 1)
+
+
+# ---------------------------------------------------------------------------
+# Пути
+# ---------------------------------------------------------------------------
+
+def _candles_root() -> Path:
+    """Корень хранилища свечей (настраивается через settings.CANDLES_ROOT)."""
+    root = getattr(settings, "CANDLES_ROOT", None)
+    if root:
+        return Path(root)
+    return Path(settings.BASE_DIR).parent / "uploads" / "candles"
+
+
+def candle_dir(ticker: str, year: int, month: int) -> Path:
+    """Директория ``{root}/{TICKER}/{YYYY}/{MM}``."""
+    return _candles_root() / ticker.upper() / str(year) / f"{month:02d}"
+
+
+def candle_path(ticker: str, dt: date) -> Path:
+    """Путь к CSV файлу дневных свечей: ``…/{DD}.csv``."""
+    return candle_dir(ticker, dt.year, dt.month) / f"{dt.day:02d}.csv"
+
+
+# ---------------------------------------------------------------------------
+# Конвертации records ⇄ DataFrame
+# ---------------------------------------------------------------------------
+
+def day_to_ts(day: date) -> int:
+    """Начало дня ``day`` в секундах (шкала ``ts``)."""
+    return (day - _EPOCH).days * _SECONDS_PER_DAY
+
+
+def ts_to_day(ts: int) -> date:
+    return _EPOCH + timedelta(days=int(ts) // _SECONDS_PER_DAY)
+
+
+def empty_records() -> np.ndarray:
+    return np.empty(0, dtype=CANDLE_DTYPE)
+
+
+def frame_to_records(df: pd.DataFrame) -> np.ndarray:
+    """DataFrame со столбцами CANDLE_COLUMNS → массив CANDLE_DTYPE (без сортировки)."""
+    records = np.empty(len(df), dtype=CANDLE_DTYPE)
+    if not len(df):
+        return records
+    dt = pd.to_datetime(df["datetime"]).to_numpy().astype("datetime64[s]")
+    records["ts"] = dt.view("i8")
+    for col in ("open", "high", "low", "close", "value"):
+        records[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).to_numpy(dtype="f8")
+    records["volume"] = pd.to_numeric(df["volume"], errors="coerce").fillna(0).to_numpy(dtype="i8")
+    return records
+
+
+def records_to_frame(records: np.ndarray) -> pd.DataFrame:
+    """Массив CANDLE_DTYPE → DataFrame со столбцами CANDLE_COLUMNS."""
+    return pd.DataFrame({
+        "datetime": records["ts"].astype("datetime64[s]").astype("datetime64[ns]"),
+        "open": records["open"],
+        "high": records["high"],
+        "low": records["low"],
+        "close": records["close"],
+        "volume": records["volume"],
+        "value": records["value"],
+    })
+
+
+def merge_records(*parts: np.ndarray) -> np.ndarray:
+    """Склеить массивы, отсортировать по ts и убрать дубликаты (побеждает последний)."""
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return empty_records()
+    combined = np.concatenate(parts) if len(parts) > 1 else np.asarray(parts[0])
+    order = np.argsort(combined["ts"], kind="stable")
+    ordered = combined[order]
+    ts = ordered["ts"]
+    keep = np.ones(len(ordered), dtype=bool)
+    keep[:-1] = ts[1:] != ts[:-1]
+    return ordered[keep]
+
+
+def dedupe_records(records: np.ndarray) -> np.ndarray:
+    """
+    Убрать повторы ts в неубывающем массиве (следы дозаписи), оставив
+    последнюю версию бара. Без повторов возвращает исходный массив (view).
+    """
+    if len(records) < 2:
+        return records
+    ts = records["ts"]
+    repeated = ts[1:] == ts[:-1]
+    if not repeated.any():
+        return records
+    keep = np.ones(len(records), dtype=bool)
+    keep[:-1] = ~repeated
+    return records[keep]
+
+
+def _changed_tail(existing: np.ndarray, chunk: np.ndarray) -> np.ndarray | None:
+    """
+    Часть ``chunk``, которую достаточно дописать в конец ``existing``, если
+    ``chunk`` повторяет сохранённые бары и отличается лишь последним из них
+    (пересылка текущего дня). ``None`` — нужен merge.
+    """
+    ts = existing["ts"]
+    pos = bisect.bisect_left(ts, int(chunk["ts"][0]))
+    stored = existing[pos:]
+    if len(chunk) < len(stored):
+        return None
+    head = chunk[:len(stored)]
+    if not np.array_equal(head["ts"], stored["ts"]) or not (head[:-1] == stored[:-1]).all():
+        return None
+    if len(stored) and head[-1] == stored[-1]:
+        return chunk[len(stored):]
+    return chunk[max(len(stored) - 1, 0):]
+
+
+def _slice_days(records: np.ndarray, from_date: date, till_date: date) -> np.ndarray:
+    """Срез отсортированного массива по дням [from_date, till_date] (view, без копии)."""
+    # bisect, а не np.searchsorted: тот делает contiguous-копию страйдового
+    # столбца ts, т.е. читает всю партицию целиком.
+    ts = records["ts"]
+    lo = bisect.bisect_left(ts, day_to_ts(from_date))
+    hi = bisect.bisect_left(ts, day_to_ts(till_date + timedelta(days=1)), lo)
+    return records[lo:hi]
+
+
+def resample_records(records: np.ndarray, interval: int) -> np.ndarray:
+    """
+    Агрегировать отсортированные свечи в бары ``interval`` минут.
+
+    Границы баров кратны ``interval`` от полуночи — для интервалов, делящих
+    сутки, это совпадает с ``resample_candles`` (pandas, origin='start_day').
+    """
+    if interval <= 1 or not len(records):
+        return records
+    if _SECONDS_PER_DAY % (interval * 60):
+        raise ValueError(f"interval {interval} does not divide a day")
+    step = interval * 60
+    buckets = records["ts"] // step * step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(records)] - 1
+
+    out = np.empty(len(starts), dtype=CANDLE_DTYPE)
+    out["ts"] = buckets[starts]
+    out["open"] = records["open"][starts]
+    out["high"] = np.maximum.reduceat(records["high"], starts)
+    out["low"] = np.minimum.reduceat(records["low"], starts)
+    out["close"] = records["close"][ends]
+    out["volume"] = np.add.reduceat(records["volume"], starts)
+    out["value"] = np.add.reduceat(records["value"], starts)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Запись файлов
+# ---------------------------------------------------------------------------
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    """
+    Заменить файл целиком: временный файл рядом + ``os.replace``. Процесс,
+    убитый посреди записи (SoftTimeLimitExceeded, OOM), оставляет старую
+    версию файла, а не усечённую.
+    """
+    mode = path.stat().st_mode & 0o777 if path.exists() else 0o644
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def _write_once(fh, data: bytes) -> None:
+    """Дозапись мимо буфера Python: кусок уходит в файл одним write(), а не порциями."""
+    fh.flush()
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fh.fileno(), view):]
+
+
+def _last_byte(path: Path) -> bytes:
+    with open(path, "rb") as fh:
+        fh.seek(-1, os.SEEK_END)
+        return fh.read(1)
+
+
+# ---------------------------------------------------------------------------
+# Партиции
+# ---------------------------------------------------------------------------
+
+# Ряды-свёртки, поддерживаемые при записи 1-мин свечей
+# (совпадают с instruments.candles._RESAMPLE_FREQS без raw-интервала).
+ROLLUP_INTERVALS: tuple[int, ...] = (5, 15, 30, 60, 240, 1440)
+
+_DAY, _MONTH, _YEAR = "day", "month", "year"
+
+
+def _period_key(period: str, day: date) -> tuple[int, ...]:
+    if period == _DAY:
+        return (day.year, day.month, day.day)
+    if period == _MONTH:
+        return (day.year, day.month)
+    return (day.year,)
+
+
+def _key_bounds(key: tuple[int, ...]) -> tuple[date, date]:
+    """Первый и последний день, покрываемые партицией."""
+    if len(key) == 3:
+        day = date(*key)
+        return day, day
+    if len(key) == 2:
+        year, month = key
+        nxt = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        return date(year, month, 1), nxt - timedelta(days=1)
+    return date(key[0], 1, 1), date(key[0], 12, 31)
+
+
+def _iter_period_keys(period: str, from_date: date, till_date: date) -> Iterator[tuple[int, ...]]:
+    current = from_date
+    while current <= till_date:
+        key = _period_key(period, current)
+        yield key
+        current = _key_bounds(key)[1] + timedelta(days=1)
+
+
+# ---------------------------------------------------------------------------
+# Бэкенды
+# ---------------------------------------------------------------------------
+
+class CandleStorage:
+    """
+    Базовый бэкенд: каждый ряд тикера (1 мин и свёртки ROLLUP_INTERVALS)
+    разбит на партиции-файлы по дням, месяцам или годам.
+
+    Подкласс задаёт период партиции для интервала (``_period``), расширение
+    файлов (``suffix``) и сериализацию (``_load``/``_dump``). Раскладка:
+
+    - 1 мин:   ``{TICKER}/{YYYY}[/{MM}[/{DD}]]{suffix}``
+    - свёртки: ``{TICKER}/rollups/{interval}/{YYYY}[/{MM}[/{DD}]]{suffix}``
+
+    Чтение, запись с merge, поддержка свёрток и служебные запросы реализованы
+    здесь поверх массивов CANDLE_DTYPE.
+    """
+
+    name = ""
+    suffix = ""
+
+    def _period(self, interval: int) -> str:
+        raise NotImplementedError
+
+    def _load(self, path: Path) -> np.ndarray:
+        raise NotImplementedError
+
+    def _dump(self, path: Path, records: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def _append(self, path: Path, records: np.ndarray) -> None:
+        """Дописать отсортированные записи в конец существующей партиции."""
+        raise NotImplementedError
+
+    # --- раскладка ----------------------------------------------------------
+
+    def _ticker_root(self, ticker: str) -> Path:
+        return _candles_root() / ticker.upper()
+
+    def _rollups_root(self, ticker: str) -> Path:
+        return self._ticker_root(ticker) / "rollups"
+
+    def _series_root(self, ticker: str, interval: int) -> Path:
+        if interval == 1:
+            return self._ticker_root(ticker)
+        return self._rollups_root(ticker) / str(interval)
+
+    def _partition_key(self, day: date, interval: int) -> tuple[int, ...]:
+        return _period_key(self._period(interval), day)
+
+    def _iter_keys(self, from_date: date, till_date: date, interval: int) -> Iterator[tuple[int, ...]]:
+        """Ключи партиций, покрывающих [from_date, till_date], по возрастанию."""
+        return _iter_period_keys(self._period(interval), from_date, till_date)
+
+    def _partition_path(self, ticker: str, key: tuple[int, ...], interval: int) -> Path:
+        path = self._series_root(ticker, interval) / str(key[0])
+        if len(key) == 1:
+            return path.with_name(f"{key[0]}{self.suffix}")
+        if len(key) == 2:
+            return path / f"{key[1]:02d}{self.suffix}"
+        return path / f"{key[1]:02d}" / f"{key[2]:02d}{self.suffix}"
+
+    def _list_keys(self, ticker: str, interval: int = 1) -> list[tuple[int, ...]]:
+        """Все существующие партиции ряда, по возрастанию."""
+        root = self._series_root(ticker, interval)
+        if not root.exists():
+            return []
+        period = self._period(interval)
+        pattern = f"*{self.suffix}"
+        keys: list[tuple[int, ...]] = []
+        if period == _YEAR:
+            keys = [(int(f.stem),) for f in root.glob(pattern) if f.stem.isdigit()]
+            return sorted(keys)
+        for year_dir in root.iterdir():
+            if not year_dir.is_dir() or not year_dir.name.isdigit():
+                continue
+            year = int(year_dir.name)
+            if period == _MONTH:
+                keys.extend((year, int(f.stem)) for f in year_dir.glob(pattern) if f.stem.isdigit())
+                continue
+            for month_dir in year_dir.iterdir():
+                if not month_dir.is_dir() or not month_dir.name.isdigit():
+                    continue
+                for day_file in month_dir.glob(pattern):
+                    try:
+                        day = date(year, int(month_dir.name), int(day_file.stem))
+                    except ValueError:
+                        continue
+                    keys.append((day.year, day.month, day.day))
+        return sorted(keys)
+
+    # --- служебные запросы --------------------------------------------------
+
+    def tickers(self) -> list[str]:
+        """Тикеры, для которых в хранилище есть хотя бы одна 1-мин партиция."""
+        root = _candles_root()
+        if not root.exists():
+            return []
+        return sorted(
+            d.name for d in root.iterdir()
+            if d.is_dir() and not d.name.startswith(".") and self._list_keys(d.name)
+        )
+
+    def date_span(self, ticker: str, interval: int = 1) -> tuple[date, date] | None:
+        """Дни первой и последней партиции ряда (``None`` — данных нет)."""
+        keys = self._list_keys(ticker, interval)
+        if not keys:
+            return None
+        return _key_bounds(keys[0])[0], _key_bounds(keys[-1])[1]
+
+    def _read_partition(self, path: Path) -> np.ndarray | None:
+        if not path.exists():
+            return None
+        try:
+            return dedupe_records(self._load(path))
+        except Exception as exc:
+            logger.warning("Failed to read %s: %s", path, exc)
+            return None
+
+    def _last_record(self, path: Path) -> np.ndarray | None:
+        """Последняя запись партиции (массив из одного элемента) или None."""
+        records = self._read_partition(path)
+        if records is None or not len(records):
+            return None
+        return records[-1:]
+
+    # --- запись -------------------------------------------------------------
+
+    def write(self, ticker: str, records: np.ndarray, interval: int = 1) -> int:
+        """
+        Записать свечи (дубликаты по ts — побеждает новая запись).
+
+        Партиция не переписывается, если новые бары начинаются не раньше её
+        последнего бара (штатный live-тик): они дописываются в конец файла,
+        повтор последнего ts заменяет его при чтении. Пересылка уже
+        сохранённых баров сверяется с партицией, и дописывается только
+        изменившийся хвост; прочие пересечения идут через merge с перезаписью.
+        Повторы ts убирает ``compact``.
+
+        Запись 1-мин свечей обновляет свёртки ROLLUP_INTERVALS: при дозаписи —
+        инкрементально по последним барам свёрток, иначе пересчётом
+        затронутых дней. Дозапись в конец уже начатого дня (live-тик)
+        манифест не трогает: его день уже есть, счётчики дня уточнит
+        ``compact``.
+
+        Returns
+        -------
+        int
+            Количество записанных партиций 1-мин ряда (или ряда ``interval``).
+        """
+        if not len(records):
+            return 0
+        records = merge_records(records)
+        with self.lock(ticker):
+            # Без 1-мин ряда свёртки тривиально полные — и для «родных» баров.
+            fresh = not self._has_data(ticker)
+            manifest = None
+            if interval == 1 and not self._appends_to_known_day(ticker, records):
+                manifest = CandleManifest.load(self._manifest_path(ticker)) or self._scan_manifest(ticker)
+                # Пока идёт запись, манифеста нет: после аварии он перестроится по данным.
+                self._manifest_path(ticker).unlink(missing_ok=True)
+            written = 0
+            for key, chunk in self._split_partitions(records, interval):
+                path = self._partition_path(ticker, key, interval)
+                appended, previous, rewritten = self._write_partition(path, chunk)
+                written += 1
+                if interval != 1:
+                    self._add_native_span(ticker, interval, chunk)
+                    continue
+                if appended is None:
+                    days = ts_to_day(chunk["ts"][0]), ts_to_day(chunk["ts"][-1])
+                    manifest.replace_days(_slice_days(rewritten, *days))
+                    self._recompute_rollups(ticker, path, chunk)
+                elif len(appended):
+                    if manifest is not None:
+                        manifest.add_appended(appended, previous)
+                    if not self._extend_rollups(ticker, appended, previous):
+                        self._recompute_rollups(ticker, path, appended)
+            if manifest is not None:
+                _atomic_write(self._manifest_path(ticker), manifest.to_bytes())
+            if fresh:
+                # Ряд начат с нуля — свёртки с первой записи полные.
+                self._mark_rollups_ready(ticker)
+        return written
+
+    def _appends_to_known_day(self, ticker: str, records: np.ndarray) -> bool:
+        """Все ``records`` дописываются в конец 1-мин партиции за их же уже начатый день."""
+        day = int(records["ts"][0]) // _SECONDS_PER_DAY
+        if int(records["ts"][-1]) // _SECONDS_PER_DAY != day:
+            return False
+        key = self._partition_key(_EPOCH + timedelta(days=day), 1)
+        last = self._last_record(self._partition_path(ticker, key, 1))
+        if last is None:
+            return False
+        last_ts = int(last["ts"][0])
+        return last_ts // _SECONDS_PER_DAY == day and int(records["ts"][0]) >= last_ts
+
+    @contextmanager
+    def lock(self, ticker: str) -> Iterator[None]:
+        """
+        Эксклюзивная блокировка записи тикера между процессами и потоками
+        (``flock`` на ``{TICKER}/.lock``): read-merge-write и дозапись разных
+        Celery-задач одного тикера не пересекаются. Чтение не блокируется.
+        """
+        if fcntl is None:
+            yield
+            return
+        root = self._ticker_root(ticker)
+        root.mkdir(parents=True, exist_ok=True)
+        with open(root / ".lock", "a") as fh:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+    def _write_partition(
+        self, path: Path, chunk: np.ndarray,
+    ) -> tuple[np.ndarray | None, np.ndarray | None, np.ndarray | None]:
+        """
+        Записать отсортированный кусок в партицию.
+
+        Returns
+        -------
+        (appended, previous, rewritten)
+            ``appended`` — бары, дописанные в конец (``None`` — партиция
+            создана или переписана merge'ем, её содержимое — ``rewritten``);
+            ``previous`` — прежняя версия бара ``appended[0]``, если он
+            заменил последний бар партиции.
+        """
+        last = self._last_record(path)
+        if last is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._dump(path, chunk)
+            logger.debug("Saved %d candles to %s", len(chunk), path)
+            return None, None, chunk
+
+        last_ts = int(last["ts"][0])
+        if int(chunk["ts"][0]) < last_ts:
+            existing = self._read_partition(path)
+            tail = _changed_tail(existing, chunk) if existing is not None else None
+            if tail is None:
+                merged = merge_records(existing if existing is not None else empty_records(), chunk)
+                self._dump(path, merged)
+                logger.debug("Merged %d candles into %s", len(chunk), path)
+                return None, None, merged
+            chunk = tail
+
+        if len(chunk):
+            self._append(path, chunk)
+            logger.debug("Appended %d candles to %s", len(chunk), path)
+        previous = last if len(chunk) and int(chunk["ts"][0]) == last_ts else None
+        return chunk, previous, None
+
+    def _split_partitions(
+        self, records: np.ndarray, interval: int,
+    ) -> Iterator[tuple[tuple[int, ...], np.ndarray]]:
+        """Разбить отсортированный массив на куски по партициям."""
+        days, starts = np.unique(records["ts"] // _SECONDS_PER_DAY, return_index=True)
+        bounds = [*starts.tolist(), len(records)]
+        chunk_start = 0
+        key = self._partition_key(_EPOCH + timedelta(days=int(days[0])), interval)
+        for i in range(1, len(days)):
+            next_key = self._partition_key(_EPOCH + timedelta(days=int(days[i])), interval)
+            if next_key != key:
+                yield key, records[chunk_start:bounds[i]]
+                chunk_start, key = bounds[i], next_key
+        yield key, records[chunk_start:]
+
+    def _write_series(self, ticker: str, records: np.ndarray, interval: int) -> None:
+        for key, chunk in self._split_partitions(records, interval):
+            self._write_partition(self._partition_path(ticker, key, interval), chunk)
+
+    # --- обслуживание -------------------------------------------------------
+
+    def compact(self, ticker: str) -> int:
+        """
+        Переписать партиции тикера с повторами ts (следы дозаписи) начисто.
+
+        Свёртки за дни уплотнённых 1-мин партиций пересчитываются заново —
+        это выправляет инкрементальные обновления, если бар был исправлен
+        задним числом. Манифест пересобирается по прочитанным партициям
+        (точные счётчики дней после live-дозаписей). Возвращает число
+        переписанных партиций.
+        """
+        compacted = 0
+        manifest = CandleManifest()
+        for interval in (1, *ROLLUP_INTERVALS):
+            for key in self._list_keys(ticker, interval):
+                path = self._partition_path(ticker, key, interval)
+                with self.lock(ticker):
+                    try:
+                        raw = self._load(path)
+                    except Exception as exc:
+                        logger.warning("Failed to read %s: %s", path, exc)
+                        if interval == 1:
+                            manifest = None  # картина дней неполная — манифест не трогаем
+                        continue
+                    records = dedupe_records(raw)
+                    if interval == 1 and manifest is not None:
+                        manifest.replace_days(records)
+                    if len(records) == len(raw):
+                        continue
+                    self._dump(path, records)
+                    compacted += 1
+                    if interval == 1:
+                        self._recompute_rollups(ticker, path, records)
+            if interval == 1 and manifest is not None and manifest.days:
+                with self.lock(ticker):
+                    # Под блокировкой снова: между партициями мог дописать писатель.
+                    current = CandleManifest.load(self._manifest_path(ticker)) or CandleManifest()
+                    current.days.update(manifest.days)
+                    _atomic_write(self._manifest_path(ticker), current.to_bytes())
+        return compacted
+
+    # --- свёртки ------------------------------------------------------------
+
+    def _recompute_rollups(self, ticker: str, path: Path, written: np.ndarray) -> None:
+        """Пересчитать свёртки за дни ``written`` по полным дням 1-мин партиции."""
+        minutes = self._read_partition(path)
+        if minutes is None or not len(minutes):
+            return
+        minutes = _slice_days(minutes, ts_to_day(written["ts"][0]), ts_to_day(written["ts"][-1]))
+        for interval in ROLLUP_INTERVALS:
+            self._write_series(ticker, resample_records(minutes, interval), interval)
+
+    def _extend_rollups(
+        self, ticker: str, appended: np.ndarray, previous: np.ndarray | None,
+    ) -> bool:
+        """
+        Обновить свёртки по барам, дописанным в конец 1-мин партиции: первый
+        бар каждой свёртки объединяется с её последним сохранённым баром.
+
+        ``previous`` — прежняя версия заменённого последнего 1-мин бара; её
+        объём вычитается. Формирующийся бар может только расширять high/low —
+        иначе (исправление задним числом) возвращается False и нужен пересчёт.
+        """
+        first = appended[0]
+        if previous is not None:
+            old = previous[0]
+            if old["high"] > first["high"] or old["low"] < first["low"] or old["open"] != first["open"]:
+                return False
+
+        updates = []
+        for interval in ROLLUP_INTERVALS:
+            bars = resample_records(appended, interval).copy()
+            key = self._partition_key(ts_to_day(bars["ts"][0]), interval)
+            stored = self._last_record(self._partition_path(ticker, key, interval))
+            if stored is not None and stored["ts"][0] > bars["ts"][0]:
+                # Дописываем не в конец свёртки (есть более поздние дни).
+                return False
+            if stored is not None and stored["ts"][0] == bars["ts"][0]:
+                head, prev_bar = bars[:1], stored[0]
+                head["open"] = prev_bar["open"]
+                head["high"] = max(head["high"][0], prev_bar["high"])
+                head["low"] = min(head["low"][0], prev_bar["low"])
+                head["volume"] += prev_bar["volume"]
+                head["value"] += prev_bar["value"]
+                if previous is not None:
+                    head["volume"] -= previous["volume"][0]
+                    head["value"] -= previous["value"][0]
+                bars[:1] = head
+            elif previous is not None:
+                # Бар свёртки с заменяемой минутой должен уже существовать.
+                return False
+            updates.append((interval, bars))
+
+        for interval, bars in updates:
+            self._write_series(ticker, bars, interval)
+        return True
+
+    def _has_data(self, ticker: str) -> bool:
+        root = self._ticker_root(ticker)
+        return root.exists() and any(p.name.isdigit() for p in root.iterdir())
+
+    def _rollups_marker(self, ticker: str) -> Path:
+        return self._rollups_root(ticker) / ".complete"
+
+    def _mark_rollups_ready(self, ticker: str) -> None:
+        marker = self._rollups_marker(ticker)
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.touch()
+
+    def _native_spans_path(self, ticker: str) -> Path:
+        return self._rollups_root(ticker) / ".native.json"
+
+    def native_spans(self, ticker: str) -> dict[int, tuple[date, date]]:
+        """{интервал: (первый, последний день)} свёрток, записанных свечами из API."""
+        try:
+            payload = json.loads(self._native_spans_path(ticker).read_bytes())
+            return {
+                int(interval): (date.fromisoformat(first), date.fromisoformat(last))
+                for interval, (first, last) in payload.items()
+            }
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def _save_native_spans(self, ticker: str, spans: dict[int, tuple[date, date]]) -> None:
+        payload = {str(i): [first.isoformat(), last.isoformat()] for i, (first, last) in sorted(spans.items())}
+        path = self._native_spans_path(ticker)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write(path, json.dumps(payload).encode())
+
+    def _add_native_span(self, ticker: str, interval: int, records: np.ndarray) -> None:
+        spans = self.native_spans(ticker)
+        first, last = ts_to_day(int(records["ts"][0])), ts_to_day(int(records["ts"][-1]))
+        if interval in spans:
+            first, last = min(first, spans[interval][0]), max(last, spans[interval][1])
+        if spans.get(interval) != (first, last):
+            spans[interval] = (first, last)
+            self._save_native_spans(ticker, spans)
+
+    # --- манифест -----------------------------------------------------------
+
+    def _manifest_path(self, ticker: str) -> Path:
+        return self._ticker_root(ticker) / f".manifest.{self.name}.json"
+
+    def _scan_manifest(self, ticker: str) -> CandleManifest:
+        manifest = CandleManifest()
+        for key in self._list_keys(ticker):
+            records = self._read_partition(self._partition_path(ticker, key, 1))
+            if records is not None:
+                manifest.replace_days(records)
+        return manifest
+
+    def manifest(self, ticker: str) -> CandleManifest:
+        """Манифест 1-мин ряда; отсутствующий строится по партициям и сохраняется."""
+        manifest = CandleManifest.load(self._manifest_path(ticker))
+        if manifest is not None or not self._has_data(ticker):
+            return manifest or CandleManifest()
+        with self.lock(ticker):
+            # Пока ждали блокировку, манифест мог записать писатель.
+            manifest = CandleManifest.load(self._manifest_path(ticker))
+            if manifest is None:
+                manifest = self._scan_manifest(ticker)
+                _atomic_write(self._manifest_path(ticker), manifest.to_bytes())
+        return manifest
+
+    def rollups_ready(self, ticker: str) -> bool:
+        """Свёртки покрывают весь 1-мин ряд (ими можно подменять чтение)."""
+        return self._rollups_marker(ticker).exists()
+
+    def rebuild_rollups(self, ticker: str) -> int:
+        """
+        Пересобрать все свёртки тикера из 1-мин ряда; «родные» бары из API
+        остаются там, где минут нет. Возвращает число 1-мин партиций.
+        """
+        with self.lock(ticker):
+            spans = self.native_spans(ticker)
+            # copy: у бинарного бэкенда read — view поверх memmap удаляемых файлов.
+            native = {interval: self.read(ticker, *span, interval).copy() for interval, span in spans.items()}
+            shutil.rmtree(self._rollups_root(ticker), ignore_errors=True)
+            for interval, bars in native.items():
+                if len(bars):
+                    self._write_series(ticker, bars, interval)
+            if spans:
+                self._save_native_spans(ticker, spans)
+            keys = self._list_keys(ticker)
+            for key in keys:
+                minutes = self._read_partition(self._partition_path(ticker, key, 1))
+                if minutes is None or not len(minutes):
+                    continue
+                for interval in ROLLUP_INTERVALS:
+                    self._write_series(ticker, resample_records(minutes, interval), interval)
+            self._mark_rollups_ready(ticker)
+        return len(keys)
+
+    # --- чтение -------------------------------------------------------------
+
+    def iter_read(
+        self, ticker: str, from_date: date, till_date: date, interval: int = 1,
+        reverse: bool = False,
+    ) -> Iterator[np.ndarray]:
+        """
+        Свечи ряда ``interval`` за дни [from_date, till_date] кусками по
+        партициям, по возрастанию ts (``reverse=True`` — партиции от
+        till_date назад; внутри куска порядок по-прежнему возрастающий).
+
+        Каждый кусок — срез загруженной партиции; у бинарного бэкенда это view
+        поверх memmap без копирования.
+        """
+        keys = self._iter_keys(from_date, till_date, interval)
+        if reverse:
+            keys = reversed(list(keys))
+        for key in keys:
+            records = self._read_partition(self._partition_path(ticker, key, interval))
+            if records is None or not len(records):
+                continue
+            chunk = _slice_days(records, from_date, till_date)
+            if len(chunk):
+                yield chunk
+
+    def read(self, ticker: str, from_date: date, till_date: date, interval: int = 1) -> np.ndarray:
+        """Свечи ряда ``interval`` за дни [from_date, till_date], отсортированные по ts."""
+        parts = list(self.iter_read(ticker, from_date, till_date, interval))
+        if not parts:
+            return empty_records()
+        # Партиции не пересекаются и упорядочены — достаточно склейки без сортировки.
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def days_present(self, ticker: str, start: date, end: date) -> set[date]:
+        """Дни из [start, end], за которые в 1-мин ряду есть хотя бы одна свеча."""
+        return self.manifest(ticker).days_present(start, end)
+
+    def last_datetime(self, ticker: str) -> datetime | None:
+        """Последний сохранённый 1-мин timestamp тикера (московское время, naive)."""
+        last = self.manifest(ticker).last_datetime()
+        if last is None:
+            return None
+        # Live-дозапись не обновляет манифест — хвост последнего дня из партиции.
+        key = self._partition_key(last.date(), 1)
+        record = self._last_record(self._partition_path(ticker, key, 1))
+        if record is not None:
+            last = max(last, datetime(1970, 1, 1) + timedelta(seconds=int(record["ts"][0])))
+        return last
+
+
+_CSV_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class CsvCandleStorage(CandleStorage):
+    """
+    CSV: 1 мин — дневные файлы ``{TICKER}/{YYYY}/{MM}/{DD}.csv`` (исторический
+    формат), свёртки — помесячные (< 1h) и погодовые файлы.
+    """
+
+    name = "csv"
+    suffix = ".csv"
+
+    def _period(self, interval):
+        if interval == 1:
+            return _DAY
+        return _MONTH if interval < 60 else _YEAR
+
+    def _load(self, path):
+        df = pd.read_csv(path, float_precision="round_trip", on_bad_lines="skip")
+        # Строка, оборванная при аварийной дозаписи, отбрасывается. "mixed":
+        # старые файлы могут содержать полуночные строки без времени.
+        df["datetime"] = pd.to_datetime(df["datetime"], format="mixed", errors="coerce")
+        df = df.dropna(subset=["datetime", "close"])
+        return frame_to_records(df)
+
+    def _dump(self, path, records):
+        _atomic_write(path, self._encode(records, header=True))
+
+    def _append(self, path, records):
+        data = self._encode(records, header=False)
+        with open(path, "ab") as fh:
+            # После оборванной строки начинаем с новой, иначе склеим две записи.
+            if fh.tell() and _last_byte(path) != b"\n":
+                data = b"\n" + data
+            _write_once(fh, data)
+
+    @staticmethod
+    def _encode(records, header):
+        return records_to_frame(records).to_csv(
+            index=False, header=header, columns=CANDLE_COLUMNS, lineterminator="\n",
+            # Иначе куски из одних полуночных баров пишутся голой датой.
+            date_format=_CSV_DATE_FORMAT,
+        ).encode()
+
+    def _last_record(self, path):
+        # Последняя строка файла — без парсинга всего CSV.
+        try:
+            with open(path, "rb") as fh:
+                fh.seek(0, os.SEEK_END)
+                fh.seek(max(0, fh.tell() - 1024))
+                lines = [line for line in fh.read().splitlines() if line.strip()]
+        except OSError:
+            return None
+        if not lines or lines[-1].startswith(b"datetime"):
+            return None
+        try:
+            dt, *values = lines[-1].decode().split(",")
+            record = np.empty(1, dtype=CANDLE_DTYPE)
+            record["ts"] = np.datetime64(dt.strip(), "s").astype("i8")
+            for field, value in zip(CANDLE_COLUMNS[1:], values, strict=True):
+                record[field] = int(float(value)) if field == "volume" else float(value)
+            return record
+        except ValueError:
+            return super()._last_record(path)
+
+
+class BinaryCandleStorage(CandleStorage):
+    """
+    Записи CANDLE_DTYPE фиксированной ширины: 1 мин и свёртки < 1h — файл на
+    месяц (``{TICKER}/{YYYY}/{MM}.bin``), свёртки от 1h — файл на год.
+    """
+
+    name = "binary"
+    suffix = ".bin"
+
+    def _period(self, interval):
+        return _MONTH if interval < 60 else _YEAR
+
+    def _load(self, path):
+        # Только целые записи: хвост от оборванной записи игнорируется.
+        count = path.stat().st_size // CANDLE_DTYPE.itemsize
+        if not count:
+            return empty_records()
+        return np.memmap(path, dtype=CANDLE_DTYPE, mode="r", shape=(count,))
+
+    def _last_record(self, path):
+        try:
+            with open(path, "rb") as fh:
+                count = os.fstat(fh.fileno()).st_size // CANDLE_DTYPE.itemsize
+                if not count:
+                    return None
+                fh.seek((count - 1) * CANDLE_DTYPE.itemsize)
+                return np.frombuffer(fh.read(CANDLE_DTYPE.itemsize), dtype=CANDLE_DTYPE).copy()
+        except OSError:
+            return None
+
+    def _append(self, path, records):
+        with open(path, "ab") as fh:
+            # Хвост оборванной записи отрезается, чтобы не сбить выравнивание;
+            # открытые memmap читателей видят только целые записи до него.
+            size = os.fstat(fh.fileno()).st_size
+            if size % CANDLE_DTYPE.itemsize:
+                fh.truncate(size - size % CANDLE_DTYPE.itemsize)
+            _write_once(fh, np.ascontiguousarray(records, dtype=CANDLE_DTYPE).tobytes())
+
+    def _dump(self, path, records):
+        # rename (а не запись поверх): открытые memmap читателей продолжают
+        # видеть старый inode и не получают SIGBUS от усечения файла.
+        _atomic_write(path, np.ascontiguousarray(records, dtype=CANDLE_DTYPE).tobytes())
+
+
+_BACKENDS: dict[str, type[CandleStorage]] = {
+    CsvCandleStorage.name: CsvCandleStorage,
+    BinaryCandleStorage.name: BinaryCandleStorage,
+}
+
+
+def get_candle_storage(name: str | None = None) -> CandleStorage:
+    """Бэкенд по имени, по умолчанию — ``settings.CANDLES_STORAGE_BACKEND``."""
+    name = name or getattr(settings, "CANDLES_STORAGE_BACKEND", CsvCandleStorage.name)
+    try:
+        return _BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown candle storage backend: {name!r}") from None
@@ -0,0 +1,105 @@
+"""
+Потоковая (chunked) отдача свечей для CandleDataView.
+
+JSON собирается кусками прямо из массива CANDLE_DTYPE — без DataFrame, без
+полного списка словарей и без DRF ``Response``; каждый кусок сразу сжимается
+выбранным кодеком (br, если установлен пакет ``brotli``, иначе gzip).
+"""
+
+from __future__ import annotations
+
+import json
+import zlib
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+try:
+    import brotli
+except ImportError:  # brotli — необязательная зависимость
+    brotli = None
+
+# Баров в одном куске JSON (~60 байт на бар в строчной форме).
+CHUNK_BARS = 2000
+
+_FIELDS = ("time", "open", "high", "low", "close", "volume")
+_SOURCE = {"time": "ts"}
+_DUMPS = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """Кодек сжатия по заголовку Accept-Encoding: ``br`` | ``gzip`` | ``None``."""
+    offered = set()
+    for item in accept_encoding.split(","):
+        name, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            offered.add(name.strip().lower())
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered or "*" in offered:
+        return "gzip"
+    return None
+
+
+def _column(records: np.ndarray, field: str) -> list:
+    return records[_SOURCE.get(field, field)].tolist()
+
+
+def iter_candles_json(
+    meta: dict[str, Any],
+    records: np.ndarray,
+    layout: str = "rows",
+    chunk_bars: int = CHUNK_BARS,
+) -> Iterator[bytes]:
+    """
+    JSON ответа CandleDataView кусками: ``meta`` + ``count`` + ``candles``.
+
+    Разобранный JSON совпадает с нестриминговым ответом
+    (``candles_to_json`` / ``candles_to_columns``) для тех же свечей.
+    """
+    head = dict(meta, layout=layout, count=len(records))
+    yield (_DUMPS(head)[:-1] + ',"candles":').encode()
+
+    if layout == "columns":
+        yield b"{"
+        for i, field in enumerate(_FIELDS):
+            yield (("," if i else "") + f'"{field}":[').encode()
+            for start in range(0, len(records), chunk_bars):
+                part = _column(records[start:start + chunk_bars], field)
+                yield (("," if start else "") + _DUMPS(part)[1:-1]).encode()
+            yield b"]"
+        yield b"}}"
+        return
+
+    yield b"["
+    for start in range(0, len(records), chunk_bars):
+        part = records[start:start + chunk_bars]
+        rows = [dict(zip(_FIELDS, values)) for values in zip(*(_column(part, f) for f in _FIELDS))]
+        yield (("," if start else "") + _DUMPS(rows)[1:-1]).encode()
+    yield b"]}"
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str | None) -> Iterator[bytes]:
+    """Сжать поток кусков на лету (``encoding=None`` — без сжатия)."""
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
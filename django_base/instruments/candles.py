@@ -2,21 +2,40 @@
 Утилиты для хранения и обработки свечей (source-agnostic).
 
 Функции:
-- save_candles_to_csv — сохранение свечей в CSV (по дням)
-- read_candles        — чтение свечей из CSV за диапазон дат
+- save_candles_to_csv — сохранение свечей в хранилище (бэкенд — candle_storage)
+- save_candle_records — то же для готового массива CANDLE_DTYPE
+- read_candles        — чтение свечей из хранилища за диапазон дат
+- read_candle_records — то же без DataFrame: массив CANDLE_DTYPE (memmap-view);
+                        крупные интервалы читаются из готовых свёрток,
+                        ``limit`` читает только хвост диапазона
 - resample_candles    — пересэмплирование до 5m/15m/30m/1h/4h/1D
 - candles_to_json     — конвертация DataFrame → JSON для lightweight-charts
+- candles_to_columns  — то же в колоночной форме ``{time: [...], open: [...], …}``
 """
 
 from __future__ import annotations
 
+import bisect
 import logging
-from datetime import date, timedelta, timezone
-from pathlib import Path
+from datetime import date, timedelta
 from typing import Any
 
+import numpy as np
 import pandas as pd
-from django.conf import settings
+
+from instruments.candle_storage import (
+    CANDLE_COLUMNS,
+    ROLLUP_INTERVALS,
+    _candles_root,  # noqa: F401 — реэкспорт для обратной совместимости
+    candle_dir,
+    candle_path,  # noqa: F401
+    empty_records,
+    frame_to_records,
+    get_candle_storage,
+    records_to_frame,
+    resample_records,
+    ts_to_day,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -51,31 +70,13 @@ def _interval_to_freq(interval_minutes: int) -> str | None:
         return f"{interval_minutes // 60}h"
     return f"{interval_minutes}min"
 
-_CSV_COLUMNS = ["datetime", "open", "high", "low", "close", "volume", "value"]
+_CSV_COLUMNS = CANDLE_COLUMNS
 
 
 # ---------------------------------------------------------------------------
 # Пути
 # ---------------------------------------------------------------------------
 
-def _candles_root() -> Path:
-    """Корень хранилища свечей (настраивается через settings.CANDLES_ROOT)."""
-    root = getattr(settings, "CANDLES_ROOT", None)
-    if root:
-        return Path(root)
-    return Path(settings.BASE_DIR).parent / "uploads" / "candles"
-
-
-def candle_dir(ticker: str, year: int, month: int) -> Path:
-    """Директория ``{root}/{TICKER}/{YYYY}/{MM}``."""
-    return _candles_root() / ticker.upper() / str(year) / f"{month:02d}"
-
-
-def candle_path(ticker: str, dt: date) -> Path:
-    """Путь к CSV файлу дневных свечей: ``…/{DD}.csv``."""
-    return candle_dir(ticker, dt.year, dt.month) / f"{dt.day:02d}.csv"
-
-
 def month_csv_count(ticker: str, year: int, month: int) -> int:
     """Количество CSV-файлов (дней) в директории месяца."""
     d = candle_dir(ticker, year, month)
@@ -85,20 +86,25 @@ def month_csv_count(ticker: str, year: int, month: int) -> int:
 
 
 # ---------------------------------------------------------------------------
-# CSV — запись
+# Запись
 # ---------------------------------------------------------------------------
 
-def save_candles_to_csv(ticker: str, candles: list[dict[str, Any]]) -> int:
+def save_candles_to_csv(ticker: str, candles: list[dict[str, Any]], interval: int = 1) -> int:
     """
-    Сохранить свечи в daily CSV файлы (по дням).
+    Сохранить свечи в хранилище (имя историческое — формат задаёт бэкенд,
+    см. ``instruments.candle_storage``).
+
+    Если партиция уже существует — данные объединяются:
+    дубликаты по datetime заменяются новыми значениями, порядок — по времени.
 
-    Если CSV за день уже существует — данные объединяются:
-    concat → drop_duplicates(datetime, keep='last') → sort.
+    ``interval`` > 1 — «родные» свечи интервала из API (одна из
+    ROLLUP_INTERVALS): пишутся прямо в ряд свёртки, время бара выравнивается
+    на границу интервала.
 
     Returns
     -------
     int
-        Количество записанных файлов.
+        Количество записанных партиций (файлов).
     """
     if not candles:
         return 0
@@ -106,37 +112,26 @@ def save_candles_to_csv(ticker: str, candles: list[dict[str, Any]]) -> int:
     df = _normalize_candles_df(candles)
     if df.empty:
         return 0
+    return save_candle_records(ticker, frame_to_records(df), interval)
 
-    df["_date"] = df["datetime"].dt.date
-    files_written = 0
-
-    for day, group in df.groupby("_date"):
-        day_df = group.drop(columns=["_date"])
-        path = candle_path(ticker, day)
-
-        if path.exists():
-            try:
-                existing = pd.read_csv(path, parse_dates=["datetime"])
-                day_df = (
-                    pd.concat([existing, day_df], ignore_index=True)
-                    .drop_duplicates(subset=["datetime"], keep="last")
-                    .sort_values("datetime")
-                    .reset_index(drop=True)
-                )
-            except Exception as exc:
-                logger.warning(
-                    "Failed to read existing CSV %s, overwriting: %s",
-                    path, exc,
-                )
-
-        path.parent.mkdir(parents=True, exist_ok=True)
-        day_df.to_csv(path, index=False, columns=_CSV_COLUMNS)
-        files_written += 1
-        logger.debug("Saved %d candles to %s", len(day_df), path)
+
+def save_candle_records(ticker: str, records: np.ndarray, interval: int = 1) -> int:
+    """
+    То же для готового массива CANDLE_DTYPE (окна ``iter_tinkoff_candles``) —
+    без промежуточных dict и DataFrame.
+    """
+    if not len(records):
+        return 0
+    if interval > 1:
+        if interval not in ROLLUP_INTERVALS:
+            raise ValueError(f"interval {interval} is not a rollup interval")
+        records = records.copy()
+        records["ts"] -= records["ts"] % (interval * 60)
+    files_written = get_candle_storage().write(ticker, records, interval)
 
     logger.info(
-        "save_candles_to_csv %s: wrote %d file(s) from %d candle(s)",
-        ticker, files_written, len(candles),
+        "save_candle_records %s: wrote %d file(s) from %d candle(s)",
+        ticker, files_written, len(records),
     )
     return files_written
 
@@ -170,16 +165,22 @@ def _normalize_candles_df(candles: list[dict[str, Any]]) -> pd.DataFrame:
 
 
 # ---------------------------------------------------------------------------
-# CSV — чтение
+# Чтение
 # ---------------------------------------------------------------------------
 
 def read_candles(
     ticker: str,
     from_date: date,
     till_date: date,
+    interval: int = 1,
+    limit: int | None = None,
+    since: int | None = None,
 ) -> pd.DataFrame:
     """
-    Прочитать свечи из CSV файлов за диапазон дат [from_date, till_date].
+    Прочитать свечи из хранилища за диапазон дат [from_date, till_date],
+    агрегированные до ``interval`` минут; ``limit`` — только последние
+    ``limit`` баров, ``since`` — только бары не раньше курсора
+    (см. ``read_candle_records``).
 
     Returns
     -------
@@ -187,27 +188,101 @@ def read_candles(
         Столбцы: datetime, open, high, low, close, volume, value.
         Пустой DataFrame если данных нет.
     """
-    frames: list[pd.DataFrame] = []
-    current = from_date
-
-    while current <= till_date:
-        path = candle_path(ticker, current)
-        if path.exists():
-            try:
-                df = pd.read_csv(path, parse_dates=["datetime"])
-                frames.append(df)
-            except Exception as exc:
-                logger.warning("Failed to read %s: %s", path, exc)
-        current += timedelta(days=1)
-
-    if not frames:
+    records = read_candle_records(ticker, from_date, till_date, interval, limit, since)
+    if not len(records):
         return pd.DataFrame(columns=_CSV_COLUMNS)
+    return records_to_frame(records)
+
+
+def read_candle_records(
+    ticker: str,
+    from_date: date,
+    till_date: date,
+    interval: int = 1,
+    limit: int | None = None,
+    since: int | None = None,
+) -> np.ndarray:
+    """
+    Прочитать свечи за [from_date, till_date] как массив CANDLE_DTYPE.
 
-    result = pd.concat(frames, ignore_index=True).sort_values("datetime").reset_index(drop=True)
+    Для ``interval > 1`` источник — самая крупная свёртка, кратная интервалу
+    (1h для 2h, 1D для 1W и т.п.), если свёртки тикера полные; иначе 1-мин ряд.
+    Стандартные интервалы отдаются из свёрток как есть, без ресэмплинга.
 
-    # Фильтр по точным границам (файлы дневные, но from_date/till_date могут
-    # быть неполными только по дням — на уровне дней гарантируем корректность)
-    return result
+    У бинарного бэкенда диапазон в пределах одной партиции возвращается
+    view поверх memmap (без копирования); при нескольких партициях куски
+    склеиваются одним ``np.concatenate`` — без сортировки и без DataFrame.
+    Массив read-only.
+
+    С ``limit`` партиции читаются от till_date назад, пока не наберётся
+    исходных баров на ``limit`` выходных — стоимость O(limit), а не O(диапазона).
+    Для интервалов, не делящих сутки, границы баров зависят от первого дня
+    диапазона, поэтому там читается весь диапазон и берётся хвост.
+
+    ``since`` — курсор live-графика (``time`` последнего бара клиента): только
+    бары с ``ts >= since``, включая ещё формирующийся последний. Для интервалов,
+    делящих сутки, чтение начинается с дня курсора — O(новых баров).
+    """
+    storage = get_candle_storage()
+    source = 1
+    if interval > 1 and storage.rollups_ready(ticker):
+        source = _rollup_source(interval)
+    resample_numpy = interval <= source or 1440 % interval == 0
+    if since is not None and resample_numpy:
+        from_date = max(from_date, ts_to_day(since))
+
+    if limit is not None and resample_numpy:
+        records = _read_tail(storage, ticker, from_date, till_date, source, interval, limit)
+    else:
+        records = storage.read(ticker, from_date, till_date, source)
+    if interval > source and len(records):
+        if resample_numpy:
+            records = resample_records(records, interval)
+        else:
+            records = frame_to_records(resample_candles(records_to_frame(records), interval))
+    if since is not None:
+        records = records[bisect.bisect_left(records["ts"], since):]
+    if limit is not None and len(records) > limit:
+        records = records[len(records) - limit:]
+    return records
+
+
+def _read_tail(storage, ticker, from_date, till_date, source, interval, limit) -> np.ndarray:
+    """
+    Последние исходные бары ряда ``source``, дающие не меньше ``limit`` баров
+    ``interval`` (интервал делит сутки — бары не пересекают границы партиций).
+    """
+    ratio = max(1, interval // source)
+    step = interval * 60
+    parts: list[np.ndarray] = []
+    have = 0
+    for chunk in storage.iter_read(ticker, from_date, till_date, source, reverse=True):
+        ts = chunk["ts"]
+        hi = len(chunk)
+        while hi and have < limit:
+            lo = max(0, hi - (limit - have) * ratio)
+            if ratio > 1 and lo:
+                # Не резать бар: начало окна — на границу его первого бара.
+                lo = bisect.bisect_left(ts, ts[lo] // step * step, 0, hi)
+            part = chunk[lo:hi]
+            parts.append(part)
+            if ratio == 1:
+                have += len(part)
+            else:
+                buckets = part["ts"] // step
+                have += 1 + int(np.count_nonzero(buckets[1:] != buckets[:-1]))
+            hi = lo
+        if have >= limit:
+            break
+    if not parts:
+        return empty_records()
+    parts.reverse()
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+def _rollup_source(interval: int) -> int:
+    """Самая крупная свёртка, бары которой целиком укладываются в бары ``interval``."""
+    return max((r for r in ROLLUP_INTERVALS if interval % r == 0), default=1)
 
 
 # ---------------------------------------------------------------------------
@@ -257,11 +332,45 @@ def resample_candles(df: pd.DataFrame, interval_minutes: int) -> pd.DataFrame:
 # JSON для lightweight-charts
 # ---------------------------------------------------------------------------
 
+_JSON_FIELDS = ("time", "open", "high", "low", "close", "volume")
+
+
+def candles_to_columns(df: pd.DataFrame) -> dict[str, list]:
+    """
+    Колоночный вариант :func:`candles_to_json`: ``{time: [...], open: [...], …}``.
+
+    Значения совпадают с построчным форматом; компактнее в JSON и дешевле в
+    кодировании (одна ``tolist()`` на столбец вместо dict на свечу).
+    """
+    if df.empty:
+        return {field: [] for field in _JSON_FIELDS}
+
+    dt = pd.to_datetime(df["datetime"])
+    if dt.dt.tz is not None:
+        # Как и в построчной версии, берётся «настенное» время без сдвига.
+        dt = dt.dt.tz_localize(None)
+
+    # В CSV хранится Moscow time. lightweight-charts отображает unix-timestamp
+    # как UTC. Чтобы пользователь видел московское время — передаём МСК-наивное
+    # значение, объявляя его «как UTC» (без вычитания смещения).
+    unix_ts = dt.to_numpy().astype("datetime64[s]").view("i8")
+
+    return {
+        "time": unix_ts.tolist(),
+        "open": df["open"].to_numpy(dtype="f8").tolist(),
+        "high": df["high"].to_numpy(dtype="f8").tolist(),
+        "low": df["low"].to_numpy(dtype="f8").tolist(),
+        "close": df["close"].to_numpy(dtype="f8").tolist(),
+        "volume": df["volume"].to_numpy().astype(np.int64).tolist(),
+    }
+
+
 def candles_to_json(df: pd.DataFrame) -> list[dict[str, Any]]:
     """
     Конвертировать DataFrame свечей в формат lightweight-charts.
 
-    Московское время (UTC+3) преобразуется в UTC unix-timestamp (секунды).
+    Московское время (UTC+3) передаётся как UTC unix-timestamp (секунды),
+    см. :func:`candles_to_columns`.
 
     Returns
     -------
@@ -271,25 +380,11 @@ def candles_to_json(df: pd.DataFrame) -> list[dict[str, Any]]:
     if df.empty:
         return []
 
-    records: list[dict[str, Any]] = []
-
-    for _, row in df.iterrows():
-        dt = pd.Timestamp(row["datetime"])
-
-        # В CSV хранится Moscow time. lightweight-charts отображает unix-timestamp
-        # как UTC. Чтобы пользователь видел московское время — передаём МСК-наивное
-        # значение, объявляя его «как UTC» (без вычитания смещения).
-        unix_ts = int(dt.replace(tzinfo=timezone.utc).timestamp())
-
-        records.append(
-            {
-                "time": unix_ts,
-                "open": float(row["open"]),
-                "high": float(row["high"]),
-                "low": float(row["low"]),
-                "close": float(row["close"]),
-                "volume": int(row["volume"]),
-            }
+    cols = candles_to_columns(df)
+    return [
+        {"time": t, "open": o, "high": h, "low": lo, "close": c, "volume": v}
+        for t, o, h, lo, c, v in zip(
+            cols["time"], cols["open"], cols["high"],
+            cols["low"], cols["close"], cols["volume"],
         )
-
-    return records
+    ]
@@ -1,17 +1,28 @@
-"""Резолвер пропусков в локальном хранилище свечей."""
+"""
+Резолвер пропусков в локальном хранилище свечей.
+
+``find_missing_ranges`` — пропуски одного тикера; ``plan_missing_ranges`` —
+план догрузки сразу для многих тикеров: общая ось торговых дней строится один
+раз, наличие дней каждого тикера (из манифеста хранилища) — битовая маска
+numpy над ней, пропуски — серии нулей маски.
+
+Ось — торговые дни календаря Мосбиржи (``instruments.trading_calendar``).
+Дни, за которые T-Invest уже вернул пустой ответ (``mark_empty_days``),
+считаются закрытыми и повторно не запрашиваются.
+"""
 from __future__ import annotations
 
 import logging
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
-from pathlib import Path
-from typing import Literal
+from typing import Iterable, Literal
 
-import pandas as pd
+import numpy as np
 from django.conf import settings
 from django.core.cache import cache
 
-from instruments.candles import candle_path, _candles_root
+from instruments.candle_storage import day_to_ts, get_candle_storage
+from instruments.trading_calendar import trading_days
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +36,13 @@ class GapRange:
     reason: Literal["missing_days", "tail"]
 
 
+@dataclass(frozen=True)
+class SyncTarget:
+    ticker: str
+    api_ticker: str
+    market: Literal["stock", "futures"]
+
+
 def _last_saved_cache_key(ticker: str) -> str:
     return f"candles:last_saved:{ticker.upper()}"
 
@@ -37,96 +55,57 @@ def _last_saved_cache_clear() -> None:
         pass
 
 
-def _ticker_root(ticker: str) -> Path:
-    return _candles_root() / ticker.upper()
-
-
-def _iter_day_files_desc(ticker: str) -> list[Path]:
-    """Все CSV дневных файлов тикера, отсортированные по дате убывания."""
-    root = _ticker_root(ticker)
-    if not root.exists():
-        return []
-    files: list[tuple[date, Path]] = []
-    for year_dir in root.iterdir():
-        if not year_dir.is_dir() or not year_dir.name.isdigit():
-            continue
-        year = int(year_dir.name)
-        for month_dir in year_dir.iterdir():
-            if not month_dir.is_dir() or not month_dir.name.isdigit():
-                continue
-            month = int(month_dir.name)
-            for day_file in month_dir.glob("*.csv"):
-                try:
-                    day = int(day_file.stem)
-                    files.append((date(year, month, day), day_file))
-                except ValueError:
-                    continue
-    files.sort(key=lambda x: x[0], reverse=True)
-    return [p for _, p in files]
-
-
 def last_saved_candle_dt(ticker: str) -> datetime | None:
-    """Найти последний сохранённый timestamp в CSV-файлах тикера."""
+    """Найти последний сохранённый timestamp тикера в хранилище свечей."""
     ticker = ticker.upper()
     cached = cache.get(_last_saved_cache_key(ticker))
     if cached is not None:
         return datetime.fromisoformat(cached) if isinstance(cached, str) else cached
 
-    files = _iter_day_files_desc(ticker)
-    for path in files:
-        try:
-            df = pd.read_csv(path, usecols=["datetime"], parse_dates=["datetime"])
-            if df.empty:
-                continue
-            last = df["datetime"].max().to_pydatetime()
-            cache.set(_last_saved_cache_key(ticker), last.isoformat(), _LAST_SAVED_TTL)
-            return last
-        except Exception as exc:
-            logger.warning("last_saved_candle_dt: failed to read %s: %s", path, exc)
-            continue
-    return None
-
-
-def _iter_trading_days(start: date, end: date):
-    cur = start
-    while cur <= end:
-        if cur.weekday() < 5:  # Mon-Fri
-            yield cur
-        cur += timedelta(days=1)
-
-
-def _next_trading_day(d: date) -> date:
-    nxt = d + timedelta(days=1)
-    while nxt.weekday() >= 5:
-        nxt += timedelta(days=1)
-    return nxt
-
-
-def _group_consecutive_days(days: list[date]) -> list[tuple[date, date]]:
-    if not days:
+    last = get_candle_storage().last_datetime(ticker)
+    if last is not None:
+        cache.set(_last_saved_cache_key(ticker), last.isoformat(), _LAST_SAVED_TTL)
+    return last
+
+
+def _missing_runs(axis: np.ndarray, present: Iterable[date]) -> list[tuple[date, date]]:
+    """Серии подряд идущих торговых дней оси, которых нет в ``present``."""
+    present = np.array(sorted(present), dtype="datetime64[D]")
+    missing = np.flatnonzero(~np.isin(axis, present))
+    if not len(missing):
         return []
-    days = sorted(days)
-    ranges: list[tuple[date, date]] = []
-    run_start = days[0]
-    prev = days[0]
-    for d in days[1:]:
-        next_trading = _next_trading_day(prev)
-        if d == next_trading:
-            prev = d
-            continue
-        ranges.append((run_start, prev))
-        run_start = d
-        prev = d
-    ranges.append((run_start, prev))
-    return ranges
+    breaks = np.flatnonzero(np.diff(missing) != 1)
+    firsts = missing[np.r_[0, breaks + 1]]
+    lasts = missing[np.r_[breaks, len(missing) - 1]]
+    return [(a.item(), b.item()) for a, b in zip(axis[firsts], axis[lasts])]
+
+
+def _ticker_ranges(
+    axis: np.ndarray,
+    present: Iterable[date],
+    last_dt: datetime | None,
+    end: date,
+    today: date,
+) -> list[GapRange]:
+    ranges = [GapRange(a, b, "missing_days") for a, b in _missing_runs(axis, present)]
 
+    # Хвост — до последнего торгового дня не позже today: в выходные и
+    # праздники после последней сессии запрашивать нечего.
+    trading = axis[axis <= np.datetime64(min(end, today), "D")]
+    if last_dt is not None and len(trading):
+        last_day = last_dt.date()
+        tail_end = trading[-1].item()
+        # last_day == tail_end == today: торговый день ещё идёт, добиваем
+        # текущий день с последней свечи до now (iter_tinkoff_candles за
+        # один день не дороже одного запроса, дубликаты дропнутся в merge).
+        need_tail = last_day < tail_end or (last_day == tail_end == today)
+        if need_tail:
+            tail = GapRange(last_day, tail_end, "tail")
+            ranges = [r for r in ranges if not (r.from_date <= tail.till_date and r.till_date >= tail.from_date)]
+            ranges.append(tail)
 
-def _has_data_for_day(ticker: str, day: date) -> bool:
-    path = candle_path(ticker, day)
-    try:
-        return path.exists() and path.stat().st_size > 0
-    except OSError:
-        return False
+    ranges.sort(key=lambda r: r.from_date)
+    return ranges
 
 
 def find_missing_ranges(
@@ -136,30 +115,82 @@ def find_missing_ranges(
     end: date | None = None,
 ) -> list[GapRange]:
     """Список пропущенных диапазонов в локальном хранилище свечей."""
-    ticker = ticker.upper()
+    return plan_missing_ranges([ticker], start=start, end=end).get(ticker.upper(), [])
+
+
+def plan_missing_ranges(
+    tickers: Iterable[str],
+    *,
+    start: date | None = None,
+    end: date | None = None,
+) -> dict[str, list[GapRange]]:
+    """
+    План догрузки: {тикер: пропуски} для всех ``tickers`` за один проход.
+
+    В план попадают только тикеры с пропусками; для каждого читается один
+    манифест хранилища (дни и последний ts), файлы свечей не открываются.
+    """
     today = date.today()
     start = start or date(settings.CANDLES_HISTORY_START_YEAR, 1, 1)
     end = end or today
     if start > end:
-        return []
-
-    trading = list(_iter_trading_days(start, end))
-    missing_days = [d for d in trading if not _has_data_for_day(ticker, d)]
-    grouped = _group_consecutive_days(missing_days)
-    ranges = [GapRange(a, b, "missing_days") for a, b in grouped]
-
-    last_dt = last_saved_candle_dt(ticker)
-    if last_dt is not None:
-        last_day = last_dt.date()
-        tail_end = min(end, today) if end > today else end
-        # last_day == tail_end == today: торговый день ещё идёт, добиваем
-        # текущий день с последней свечи до now (fetch_tinkoff_candles за
-        # один день не дороже одного запроса, дубликаты дропнутся в merge).
-        need_tail = last_day < tail_end or (last_day == tail_end == today)
-        if need_tail:
-            tail = GapRange(last_day, tail_end, "tail")
-            ranges = [r for r in ranges if not (r.from_date <= tail.till_date and r.till_date >= tail.from_date)]
-            ranges.append(tail)
-
-    ranges.sort(key=lambda r: r.from_date)
-    return ranges
+        return {}
+
+    from instruments.models import EmptyCandleDay
+
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    axis = trading_days(start, end)
+    empty: dict[str, set[date]] = {}
+    rows = EmptyCandleDay.objects.filter(ticker__in=tickers, date__range=(start, end))
+    for ticker, day in rows.values_list("ticker", "date"):
+        empty.setdefault(ticker, set()).add(day)
+
+    storage = get_candle_storage()
+    plan: dict[str, list[GapRange]] = {}
+    for ticker in tickers:
+        manifest = storage.manifest(ticker)
+        covered = manifest.days_present(start, end) | empty.get(ticker, set())
+        ranges = _ticker_ranges(axis, covered, manifest.last_datetime(), end, today)
+        if ranges:
+            plan[ticker] = ranges
+    return plan
+
+
+def mark_empty_days(ticker: str, from_date: date, till_date: date, records: np.ndarray) -> int:
+    """
+    Запомнить торговые дни [from_date, till_date], за которые полный ответ
+    T-Invest (``records``, массив CANDLE_DTYPE) не содержит свечей.
+    Сегодняшний день не помечается — сессия ещё может начаться. Возвращает
+    число дней.
+    """
+    from instruments.models import EmptyCandleDay
+
+    till_date = min(till_date, date.today() - timedelta(days=1))
+    fetched = set(np.unique(records["ts"] // 86400).tolist())
+    empty = [
+        day for day in trading_days(from_date, till_date).tolist()
+        if day_to_ts(day) // 86400 not in fetched
+    ]
+    EmptyCandleDay.objects.bulk_create(
+        [EmptyCandleDay(ticker=ticker.upper(), date=day) for day in empty],
+        ignore_conflicts=True,
+    )
+    return len(empty)
+
+
+def active_sync_targets() -> list[SyncTarget]:
+    """Активные акции и фьючерсы — кандидаты на догрузку свечей."""
+    from instruments.models import Futures, Instrument
+
+    targets = [
+        SyncTarget(ticker.upper(), ticker, "stock")
+        for ticker in Instrument.objects.filter(is_active=True, instrument_type="STOCK")
+        .values_list("ticker", flat=True)
+    ]
+    targets.extend(
+        SyncTarget(ticker.upper(), secid, "futures")
+        for ticker, secid in Futures.objects.filter(is_active=True)
+        .exclude(secid="")
+        .values_list("ticker", "secid")
+    )
+    return targets
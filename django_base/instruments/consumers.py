@@ -1,8 +1,18 @@
-"""WebSocket consumer для прогресса синхронизации свечей."""
+"""WebSocket consumers: прогресс синхронизации свечей и live-бары для графиков."""
 from asgiref.sync import async_to_sync
 from channels.generic.websocket import JsonWebsocketConsumer
 from django.core.cache import cache
 
+from instruments.candle_feed import live_group
+
+
+def _active_tickers(tickers: set[str]) -> set[str]:
+    """Активные тикеры акций и фьючерсов из ``tickers`` — одним запросом на модель."""
+    from instruments.models import Futures, Instrument
+    found = set(Instrument.objects.filter(ticker__in=tickers, is_active=True).values_list("ticker", flat=True))
+    found.update(Futures.objects.filter(ticker__in=tickers, is_active=True).values_list("ticker", flat=True))
+    return found
+
 
 def _ticker_exists(ticker: str) -> bool:
     from instruments.models import Futures, Instrument
@@ -43,3 +53,64 @@ class CandleSyncConsumer(JsonWebsocketConsumer):
     def sync_done(self, event):     self.send_json(event)
     def sync_error(self, event):    self.send_json(event)
     def sync_snapshot(self, event): self.send_json(event)
+
+
+class CandleStreamConsumer(JsonWebsocketConsumer):
+    """
+    Закрытые 1-мин бары (``candle.bar`` из ``stream_candles`` и новые бары
+    сегодняшней догрузки ``sync_candles_round``) по нескольким тикерам через
+    один сокет; бар с уже полученным ``time`` — его обновление. Протокол::
+
+        → {"action": "subscribe", "tickers": ["SBER", "GAZP"]}
+        → {"action": "unsubscribe", "tickers": ["GAZP"]}
+        ← {"type": "candle.subscribed", "tickers": [...], "unknown": [...]}
+        ← {"type": "candle.bar", "ticker": "SBER", "candle": {"time": ..., "open": ..., ...}}
+        ← {"type": "candle.error", "message": "bad_request" | "too_many_tickers"}
+    """
+
+    MAX_TICKERS = 50
+
+    def connect(self):
+        user = self.scope.get("user")
+        if not getattr(user, "is_authenticated", False):
+            self.close(code=4403)
+            return
+        self.tickers: set[str] = set()
+        self.accept()
+
+    def disconnect(self, code):
+        for ticker in getattr(self, "tickers", ()):
+            async_to_sync(self.channel_layer.group_discard)(live_group(ticker), self.channel_name)
+
+    def receive_json(self, content, **kwargs):
+        action = content.get("action") if isinstance(content, dict) else None
+        tickers = content.get("tickers") if isinstance(content, dict) else None
+        if action not in ("subscribe", "unsubscribe") or not isinstance(tickers, list) \
+                or not all(isinstance(t, str) for t in tickers):
+            self.send_json({"type": "candle.error", "message": "bad_request"})
+            return
+
+        requested = {t.strip().upper() for t in tickers if t.strip()}
+        unknown: set[str] = set()
+        if action == "subscribe":
+            requested -= self.tickers
+            if len(self.tickers) + len(requested) > self.MAX_TICKERS:
+                self.send_json({"type": "candle.error", "message": "too_many_tickers"})
+                return
+            found = _active_tickers(requested) if requested else set()
+            unknown = requested - found
+            for ticker in found:
+                async_to_sync(self.channel_layer.group_add)(live_group(ticker), self.channel_name)
+            self.tickers |= found
+        else:
+            for ticker in requested & self.tickers:
+                async_to_sync(self.channel_layer.group_discard)(live_group(ticker), self.channel_name)
+            self.tickers -= requested
+
+        self.send_json({
+            "type": "candle.subscribed",
+            "tickers": sorted(self.tickers),
+            "unknown": sorted(unknown),
+        })
+
+    def candle_bar(self, event): self.send_json(event)
@@ -0,0 +1,187 @@
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from instruments.candle_storage import (
+    CANDLE_DTYPE,
+    day_to_ts,
+    get_candle_storage,
+    records_to_frame,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Микробенчмарки пути свечей на синтетических данных '
+        '(чтение из хранилища, свёртки, JSON-сериализация)'
+    )
+
+    CASES = ('read', 'rollup', 'json')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'cases',
+            nargs='*',
+            help=f'Какие замеры запускать: {", ".join(self.CASES)} (по умолчанию все)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Календарных дней 1-мин истории для read/rollup (по умолчанию 365)',
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=100_000,
+            help='Свечей в DataFrame для json (по умолчанию 100000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Повторов каждого замера (по умолчанию 5)',
+        )
+
+    def handle(self, *args, **options):
+        cases = options['cases'] or list(self.CASES)
+        unknown = [c for c in cases if c not in self.CASES]
+        if unknown:
+            raise CommandError(f'Неизвестные замеры: {", ".join(unknown)}')
+
+        for case in cases:
+            getattr(self, f'_bench_{case}')(options)
+
+    # --- замеры ---------------------------------------------------------------
+
+    def _bench_read(self, options):
+        days = options['days']
+        till = date(2026, 1, 1) + timedelta(days=days - 1)
+        records = _synthetic_minutes(date(2026, 1, 1), till)
+        self.stdout.write(f'read: {len(records)} 1-мин свечей за {days} дн.')
+
+        root = tempfile.mkdtemp(prefix='bench_candles_')
+        try:
+            with override_settings(CANDLES_ROOT=root):
+                for backend in ('csv', 'binary'):
+                    storage = get_candle_storage(backend)
+                    storage.write('BENCH', records)
+                    timings = self._measure(
+                        lambda: storage.read('BENCH', date(2026, 1, 1), till),
+                        options['repeat'],
+                    )
+                    self._report(f'read[{backend}]', timings)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    def _bench_rollup(self, options):
+        from instruments.candles import read_candles, resample_candles
+
+        days = options['days']
+        till = date(2026, 1, 1) + timedelta(days=days - 1)
+        records = _synthetic_minutes(date(2026, 1, 1), till)
+        self.stdout.write(f'rollup: 1h из {len(records)} 1-мин свечей за {days} дн.')
+
+        root = tempfile.mkdtemp(prefix='bench_candles_')
+        try:
+            with override_settings(CANDLES_ROOT=root, CANDLES_STORAGE_BACKEND='binary'):
+                get_candle_storage().write('BENCH', records)
+                start = date(2026, 1, 1)
+                resampled = self._measure(
+                    lambda: resample_candles(read_candles('BENCH', start, till), 60),
+                    options['repeat'],
+                )
+                rollup = self._measure(
+                    lambda: read_candles('BENCH', start, till, 60),
+                    options['repeat'],
+                )
+            self._report('1m+resample', resampled)
+            self._report('rollup[60]', rollup)
+            self.stdout.write(f'  ускорение: x{min(resampled) / min(rollup):.0f}')
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    def _bench_json(self, options):
+        from instruments.candles import candles_to_columns, candles_to_json
+
+        till = date(2026, 1, 1) + timedelta(days=options['rows'] // 300 + 1)
+        df = records_to_frame(_synthetic_minutes(date(2026, 1, 1), till)[:options['rows']])
+        self.stdout.write(f'json: {len(df)} свечей')
+
+        if _legacy_candles_to_json(df) != candles_to_json(df):
+            raise CommandError('candles_to_json расходится с построчной реализацией')
+
+        legacy = self._measure(lambda: _legacy_candles_to_json(df), min(options['repeat'], 2))
+        rows = self._measure(lambda: candles_to_json(df), options['repeat'])
+        columns = self._measure(lambda: candles_to_columns(df), options['repeat'])
+        self._report('json[iterrows]', legacy)
+        self._report('json[rows]', rows)
+        self._report('json[columns]', columns)
+        self.stdout.write(
+            f'  ускорение rows: x{min(legacy) / min(rows):.0f}, '
+            f'columns: x{min(legacy) / min(columns):.0f}'
+        )
+
+    # --- утилиты --------------------------------------------------------------
+
+    @staticmethod
+    def _measure(fn, repeat: int) -> list[float]:
+        timings = []
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def _report(self, label: str, timings: list[float]) -> None:
+        self.stdout.write(
+            f'  {label:<20} min={min(timings):9.2f} ms  '
+            f'median={statistics.median(timings):9.2f} ms'
+        )
+
+
+def _legacy_candles_to_json(df) -> list[dict]:
+    """Прежняя построчная реализация candles_to_json — эталон для сравнения."""
+    records = []
+    for _, row in df.iterrows():
+        dt = pd.Timestamp(row['datetime'])
+        records.append({
+            'time': int(dt.replace(tzinfo=timezone.utc).timestamp()),
+            'open': float(row['open']),
+            'high': float(row['high']),
+            'low': float(row['low']),
+            'close': float(row['close']),
+            'volume': int(row['volume']),
+        })
+    return records
+
+
+def _synthetic_minutes(start: date, end: date) -> np.ndarray:
+    """1-мин свечи 10:00–18:39 по будням за [start, end] (случайное блуждание цены)."""
+    rng = np.random.default_rng(0)
+    day_offsets = np.arange(600, 600 + 520) * 60
+    stamps = []
+    current = start
+    while current <= end:
+        if current.weekday() < 5:
+            stamps.append(day_to_ts(current) + day_offsets)
+        current += timedelta(days=1)
+    ts = np.concatenate(stamps) if stamps else np.empty(0, dtype='i8')
+
+    close = 100 + np.cumsum(rng.normal(0, 0.05, len(ts)))
+    records = np.empty(len(ts), dtype=CANDLE_DTYPE)
+    records['ts'] = ts
+    records['open'] = np.concatenate([[close[0]], close[:-1]]) if len(ts) else close
+    records['close'] = close
+    records['high'] = np.maximum(records['open'], close) + 0.01
+    records['low'] = np.minimum(records['open'], close) - 0.01
+    records['volume'] = rng.integers(1, 1000, len(ts))
+    records['value'] = records['volume'] * close
+    return records
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from instruments.candle_cache import invalidate_ticker_candles_cache
+from instruments.candle_storage import get_candle_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Уплотняет партиции свечей: убирает повторы ts, оставленные '
+        'дозаписью live-тиков, и пересчитывает свёртки за эти дни'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ticker',
+            action='append',
+            dest='tickers',
+            default=None,
+            help='Уплотнить только указанный тикер (можно повторять)',
+        )
+
+    def handle(self, *args, **options):
+        storage = get_candle_storage()
+        tickers = [t.upper() for t in options['tickers'] or storage.tickers()]
+
+        total = 0
+        for ticker in tickers:
+            compacted = storage.compact(ticker)
+            total += compacted
+            if compacted:
+                invalidate_ticker_candles_cache(ticker, storage)
+                self.stdout.write(f'{ticker}: переписано партиций={compacted}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: тикеров={len(tickers)}, партиций={total}'
+        ))
@@ -0,0 +1,99 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from instruments.candle_cache import invalidate_ticker_candles_cache
+from instruments.candle_storage import get_candle_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит свечи между бэкендами хранения '
+        '(по умолчанию дневные CSV → бинарные файлы тикер-месяц)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            default='csv',
+            help='Бэкенд-источник (csv | binary), по умолчанию csv',
+        )
+        parser.add_argument(
+            '--target',
+            default='binary',
+            help='Целевой бэкенд (csv | binary), по умолчанию binary',
+        )
+        parser.add_argument(
+            '--ticker',
+            action='append',
+            dest='tickers',
+            default=None,
+            help='Конвертировать только указанный тикер (можно повторять)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать свечи, ничего не записывая',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            source = get_candle_storage(options['source'])
+            target = get_candle_storage(options['target'])
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+        if source.name == target.name:
+            raise CommandError('Источник и цель совпадают.')
+
+        tickers = [t.upper() for t in options['tickers'] or source.tickers()]
+        if not tickers:
+            self.stdout.write('Нет данных для конвертации.')
+            return
+
+        total_candles = 0
+        for ticker in tickers:
+            # «Родные» свёртки из API — до минут: бары, посчитанные из 1-мин
+            # ряда, при пересечении заменяют их, как и в исходном дереве.
+            native = 0
+            for interval, native_span in source.native_spans(ticker).items():
+                records = source.read(ticker, *native_span, interval)
+                if len(records) and not options['dry_run']:
+                    native += target.write(ticker, records, interval=interval)
+
+            span = source.date_span(ticker)
+            if span is None:
+                self.stdout.write(self.style.WARNING(f'{ticker}: нет данных в {source.name}'))
+                if native:
+                    invalidate_ticker_candles_cache(ticker, target)
+                continue
+
+            ticker_candles = 0
+            ticker_files = 0
+            for month_start, month_end in _iter_months(*span):
+                records = source.read(ticker, month_start, month_end)
+                if not len(records):
+                    continue
+                ticker_candles += len(records)
+                if not options['dry_run']:
+                    ticker_files += target.write(ticker, records)
+            if not options['dry_run']:
+                invalidate_ticker_candles_cache(ticker, target)
+
+            total_candles += ticker_candles
+            self.stdout.write(
+                f'{ticker}: {span[0]}…{span[1]}, свечей={ticker_candles}, файлов={ticker_files}'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: тикеров={len(tickers)}, свечей={total_candles}'
+            + (' (dry-run)' if options['dry_run'] else '')
+        ))
+
+
+def _iter_months(start: date, end: date):
+    """Пары (первый, последний день) календарных месяцев, покрывающих [start, end]."""
+    current = date(start.year, start.month, 1)
+    while current <= end:
+        nxt = date(current.year + 1, 1, 1) if current.month == 12 else date(current.year, current.month + 1, 1)
+        yield max(current, start), min(nxt - timedelta(days=1), end)
+        current = nxt
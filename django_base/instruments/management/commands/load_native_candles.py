@@ -0,0 +1,57 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from instruments.candle_storage import ROLLUP_INTERVALS
+from instruments.candles_gaps import active_sync_targets
+from instruments.tinkoff_candles import INTERVAL_MAP
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает готовые свечи крупного интервала из T-Invest прямо в свёртку '
+        '(длинная история графиков без 1-мин ряда)'
+    )
+
+    INTERVALS = sorted(set(ROLLUP_INTERVALS) & set(INTERVAL_MAP))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ticker', required=True, help='Тикер инструмента')
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=1440,
+            choices=self.INTERVALS,
+            help='Интервал в минутах (по умолчанию 1440 — дневные свечи)',
+        )
+        parser.add_argument('--from', dest='start', default=None, help='Начало, YYYY-MM-DD')
+        parser.add_argument('--till', dest='end', default=None, help='Конец, YYYY-MM-DD (по умолчанию сегодня)')
+
+    def handle(self, *args, **options):
+        from instruments.tasks import load_native_candles
+
+        for key in ('start', 'end'):
+            if options[key]:
+                try:
+                    date.fromisoformat(options[key])
+                except ValueError:
+                    raise CommandError(f'Некорректная дата: {options[key]}') from None
+
+        ticker = options['ticker'].upper()
+        target = next((t for t in active_sync_targets() if t.ticker == ticker), None)
+        result = load_native_candles.run(
+            ticker=ticker,
+            interval=options['interval'],
+            start=options['start'],
+            end=options['end'],
+            market=target.market if target else 'stock',
+            api_ticker=target.api_ticker if target else None,
+        )
+
+        if result['status'] in ('no_token', 'uid_not_found'):
+            raise CommandError(f'{ticker}: {result["status"]}')
+        message = f'{ticker}: интервал={result["interval"]}, свечей={result["candles"]}'
+        if result['status'] == 'partial':
+            self.stdout.write(self.style.WARNING(f'{message} (часть окон не загрузилась)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from instruments.models import TradingCalendarDay
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает исключения торгового календаря Мосбиржи (праздники в будни, '
+        'рабочие выходные) из CSV с колонками date, is_trading[, note]'
+    )
+
+    REQUIRED_COLUMNS = ('date', 'is_trading')
+    TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да'}
+    FALSE_VALUES = {'0', 'false', 'no', 'n', 'нет'}
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv-path',
+            type=str,
+            default=None,
+            help='Путь к CSV файлу (по умолчанию uploads/data_instruments/moex_trading_calendar.csv)',
+        )
+
+    def handle(self, *args, **options):
+        csv_path = self._resolve_csv_path(options.get('csv_path'))
+        df = self._read_csv(csv_path)
+
+        missing_columns = [col for col in self.REQUIRED_COLUMNS if col not in df.columns]
+        if missing_columns:
+            raise CommandError(
+                f'В CSV отсутствуют обязательные колонки: {", ".join(missing_columns)}'
+            )
+
+        days = []
+        for line, row in enumerate(df.fillna('').itertuples(index=False), start=2):
+            try:
+                day = pd.Timestamp(str(row.date).strip()).date()
+            except ValueError:
+                raise CommandError(f'Строка {line}: некорректная дата {row.date!r}') from None
+            flag = str(row.is_trading).strip().lower()
+            if flag not in self.TRUE_VALUES | self.FALSE_VALUES:
+                raise CommandError(f'Строка {line}: некорректный is_trading {row.is_trading!r}')
+            days.append(TradingCalendarDay(
+                date=day,
+                is_trading=flag in self.TRUE_VALUES,
+                note=str(getattr(row, 'note', '')).strip()[:200],
+            ))
+
+        TradingCalendarDay.objects.bulk_create(
+            days,
+            update_conflicts=True,
+            unique_fields=['date'],
+            update_fields=['is_trading', 'note'],
+        )
+
+        holidays = sum(not d.is_trading for d in days)
+        self.stdout.write(self.style.SUCCESS(
+            f'Календарь загружен: праздников={holidays}, рабочих выходных={len(days) - holidays}'
+        ))
+
+    @staticmethod
+    def _resolve_csv_path(raw_path: str | None) -> Path:
+        if raw_path:
+            path = Path(raw_path)
+        else:
+            path = (
+                Path(__file__).resolve().parents[4]
+                / 'uploads'
+                / 'data_instruments'
+                / 'moex_trading_calendar.csv'
+            )
+        return path.resolve()
+
+    @staticmethod
+    def _read_csv(path: Path) -> pd.DataFrame:
+        if not path.exists():
+            raise CommandError(f'CSV файл не найден: {path}')
+
+        try:
+            return pd.read_csv(path, dtype=str)
+        except Exception as exc:
+            raise CommandError(f'Не удалось прочитать CSV: {exc}') from exc
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from instruments.candle_cache import invalidate_ticker_candles_cache
+from instruments.candle_storage import ROLLUP_INTERVALS, get_candle_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает свёртки свечей '
+        f'({", ".join(str(i) for i in ROLLUP_INTERVALS)} мин) из 1-мин ряда'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ticker',
+            action='append',
+            dest='tickers',
+            default=None,
+            help='Пересобрать только указанный тикер (можно повторять)',
+        )
+        parser.add_argument(
+            '--missing-only',
+            action='store_true',
+            help='Пропускать тикеры, у которых свёртки уже полные',
+        )
+
+    def handle(self, *args, **options):
+        storage = get_candle_storage()
+        tickers = [t.upper() for t in options['tickers'] or storage.tickers()]
+        if not tickers:
+            self.stdout.write('Нет данных.')
+            return
+
+        rebuilt = 0
+        for ticker in tickers:
+            if options['missing_only'] and storage.rollups_ready(ticker):
+                continue
+            partitions = storage.rebuild_rollups(ticker)
+            invalidate_ticker_candles_cache(ticker, storage)
+            rebuilt += 1
+            self.stdout.write(f'{ticker}: партиций 1m={partitions}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: тикеров={rebuilt} (бэкенд {storage.name})'
+        ))
@@ -0,0 +1,81 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from instruments.candle_feed import CandleFeed
+from instruments.candles_gaps import active_sync_targets
+from instruments.tinkoff_candles import resolve_instrument_uid
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Live-лента 1-мин свечей: один MarketDataStream T-Invest на все активные '
+        'инструменты, закрытые бары пишутся в хранилище и рассылаются в Channels'
+    )
+
+    # Лимит подписок T-Invest на один стрим.
+    MAX_SUBSCRIPTIONS = 300
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-backoff',
+            type=int,
+            default=60,
+            help='Максимальная пауза перед переподключением, секунд (по умолчанию 60)',
+        )
+
+    def handle(self, *args, **options):
+        from instruments.tasks import _get_admin_token, sync_candles_round
+
+        token = _get_admin_token()
+        if not token:
+            raise CommandError('Нет T-Invest токена у пользователя admin')
+
+        delay = 1
+        while True:
+            tickers_by_uid = self._resolve_uids(token)
+            if not tickers_by_uid:
+                raise CommandError('Нет активных инструментов с T-Invest UID')
+
+            # Бары, закрывшиеся пока стрима не было, добьёт раунд догрузки.
+            sync_candles_round.delay(force=True)
+
+            feed = CandleFeed(tickers_by_uid)
+            self.stdout.write(f'Подписка на свечи: инструментов={len(tickers_by_uid)}')
+            try:
+                feed.run(token)
+                logger.warning('stream_candles: стрим закрыт сервером')
+            except KeyboardInterrupt:
+                break
+            except Exception as exc:
+                logger.warning('stream_candles: стрим оборвался: %s', exc)
+
+            delay = 1 if feed.bars else min(delay * 2, options['max_backoff'])
+            self.stdout.write(f'Получено баров={feed.bars}, переподключение через {delay} с')
+            try:
+                time.sleep(delay)
+            except KeyboardInterrupt:
+                break
+
+        self.stdout.write(self.style.SUCCESS('Лента остановлена'))
+
+    def _resolve_uids(self, token: str) -> dict[str, str]:
+        tickers_by_uid = {}
+        for target in active_sync_targets():
+            instrument_type = 'FUTURES' if target.market == 'futures' else 'STOCK'
+            uid = resolve_instrument_uid(token, target.api_ticker, instrument_type)
+            if uid:
+                tickers_by_uid[uid] = target.ticker
+            else:
+                logger.warning('stream_candles: нет UID для %s', target.ticker)
+
+        if len(tickers_by_uid) > self.MAX_SUBSCRIPTIONS:
+            self.stderr.write(
+                f'Инструментов {len(tickers_by_uid)} больше лимита стрима '
+                f'{self.MAX_SUBSCRIPTIONS}: остальные обновляет sync_candles_round'
+            )
+            tickers_by_uid = dict(list(tickers_by_uid.items())[:self.MAX_SUBSCRIPTIONS])
+        return tickers_by_uid
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from instruments.tinkoff_candles import resolve_all_instrument_uids
+
+
+class Command(BaseCommand):
+    help = (
+        'Массово проставляет T-Invest UID акциям и фьючерсам справочника '
+        '(два запроса списков инструментов) и прогревает кеш UID'
+    )
+
+    def handle(self, *args, **options):
+        from accounts.token_provider import get_admin_token
+
+        token = get_admin_token()
+        if not token:
+            raise CommandError('Нет T-Invest токена у пользователя admin')
+
+        try:
+            result = resolve_all_instrument_uids(token)
+        except Exception as exc:
+            raise CommandError(f'Не удалось получить списки инструментов T-Invest: {exc}') from exc
+
+        self.stdout.write(self.style.SUCCESS(
+            f'UID обновлены: акций={result["stocks"]}, фьючерсов={result["futures"]}, '
+            f'активных без UID={result["missing"]}'
+        ))
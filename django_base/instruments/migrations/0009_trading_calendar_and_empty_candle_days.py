@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instruments', '0008_add_tinkoff_uid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmptyCandleDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=50, verbose_name='Тикер')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'День без свечей',
+                'verbose_name_plural': 'Дни без свечей',
+                'db_table': 'instruments_empty_candle_day',
+                'ordering': ['ticker', 'date'],
+                'unique_together': {('ticker', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TradingCalendarDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Дата')),
+                ('is_trading', models.BooleanField(verbose_name='Торговый день')),
+                ('note', models.CharField(blank=True, max_length=200, verbose_name='Заметка')),
+            ],
+            options={
+                'verbose_name': 'День торгового календаря',
+                'verbose_name_plural': 'Торговый календарь',
+                'db_table': 'instruments_trading_calendar_day',
+                'ordering': ['date'],
+            },
+        ),
+    ]
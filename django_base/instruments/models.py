@@ -335,3 +335,59 @@ class Futures(models.Model):
 
     def __str__(self):
         return f'{self.ticker} (базовый актив: {self.base_asset.ticker})'
+
+
+class TradingCalendarDay(models.Model):
+    """
+    Исключение из торгового календаря Мосбиржи (по умолчанию торгуют Пн-Пт):
+    праздник в будний день или рабочий выходной.
+    """
+    date = models.DateField(
+        unique=True,
+        verbose_name='Дата'
+    )
+    is_trading = models.BooleanField(
+        verbose_name='Торговый день'
+    )
+    note = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name='Заметка'
+    )
+
+    class Meta:
+        verbose_name = 'День торгового календаря'
+        verbose_name_plural = 'Торговый календарь'
+        db_table = 'instruments_trading_calendar_day'
+        ordering = ['date']
+
+    def __str__(self):
+        return f'{self.date} ({"торги" if self.is_trading else "нет торгов"})'
+
+
+class EmptyCandleDay(models.Model):
+    """
+    Торговый день, за который T-Invest вернул пустой ответ по тикеру:
+    поиск пропусков больше не запрашивает его повторно.
+    """
+    ticker = models.CharField(
+        max_length=50,
+        verbose_name='Тикер'
+    )
+    date = models.DateField(
+        verbose_name='Дата'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+
+    class Meta:
+        verbose_name = 'День без свечей'
+        verbose_name_plural = 'Дни без свечей'
+        db_table = 'instruments_empty_candle_day'
+        ordering = ['ticker', 'date']
+        unique_together = [['ticker', 'date']]
+
+    def __str__(self):
+        return f'{self.ticker} {self.date}'
@@ -0,0 +1,61 @@
+"""
+Бинарный формат свечей для CandleDataView (``?format=bin`` или
+``Accept: application/vnd.candles``).
+
+Раскладка (little-endian)::
+
+    0   4s   magic  b"CNDL"
+    4   u32  версия формата (CANDLES_WIRE_VERSION)
+    8   u32  n — число баров
+    12  u32  интервал, минуты
+    16  f64[n] × 6  колонки time, open, high, low, close, volume
+
+Колонки лежат подряд и выровнены на 8 байт — на клиенте это
+``new Float64Array(buffer, 16, 6 * n)`` без парсинга. ``time`` — то же
+значение, что в JSON (московское время «как UTC», секунды).
+"""
+
+from __future__ import annotations
+
+import struct
+
+import numpy as np
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+CANDLES_WIRE_VERSION = 1
+
+_HEADER = struct.Struct("<4sIII")
+_MAGIC = b"CNDL"
+_COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+
+
+def pack_candles(records: np.ndarray, interval: int) -> bytes:
+    """Массив CANDLE_DTYPE → бинарный формат (см. модуль)."""
+    columns = np.empty((len(_COLUMNS), len(records)), dtype="<f8")
+    for row, field in enumerate(_COLUMNS):
+        columns[row] = records[field]
+    return _HEADER.pack(_MAGIC, CANDLES_WIRE_VERSION, len(records), interval) + columns.tobytes()
+
+
+def unpack_candles(payload: bytes) -> tuple[int, dict[str, np.ndarray]]:
+    """Обратное к ``pack_candles``: (interval, {time: …, open: …, …})."""
+    magic, version, count, interval = _HEADER.unpack_from(payload)
+    if magic != _MAGIC or version != CANDLES_WIRE_VERSION:
+        raise ValueError("Not a candles payload")
+    columns = np.frombuffer(payload, dtype="<f8", count=len(_COLUMNS) * count, offset=_HEADER.size)
+    names = ("time",) + _COLUMNS[1:]
+    return interval, dict(zip(names, columns.reshape(len(_COLUMNS), count)))
+
+
+class CandleBinaryRenderer(BaseRenderer):
+    """Отдаёт готовый ``pack_candles``-payload; прочие данные — как JSON."""
+
+    media_type = "application/vnd.candles"
+    format = "bin"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, bytearray)):
+            return bytes(data)
+        return JSONRenderer().render(data, accepted_media_type, renderer_context)
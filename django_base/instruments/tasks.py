@@ -1,7 +1,8 @@
 import logging
 import time
-from datetime import date
+from datetime import date, datetime
 
+import numpy as np
 from celery import shared_task
 from celery.exceptions import SoftTimeLimitExceeded
 from django.conf import settings
@@ -10,24 +11,31 @@ from django.core.management import call_command
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 
-from instruments.candles import save_candles_to_csv
-from instruments.candles_gaps import find_missing_ranges
-from instruments.tinkoff_candles import fetch_tinkoff_candles, resolve_instrument_uid
+from accounts.token_provider import get_admin_token
+from instruments.candle_cache import invalidate_candles_cache
+from instruments.candle_feed import live_tickers, publish_bars
+from instruments.candles import save_candle_records
+from instruments.candles_gaps import (
+    GapRange,
+    active_sync_targets,
+    find_missing_ranges,
+    last_saved_candle_dt,
+    mark_empty_days,
+    plan_missing_ranges,
+)
+from instruments.tinkoff_candles import (
+    CandleFetchError,
+    iter_tinkoff_candles,
+    resolve_all_instrument_uids,
+    resolve_instrument_uid,
+)
 
 logger = logging.getLogger(__name__)
 
 
 def _get_admin_token() -> str | None:
-    """Получить расшифрованный T-Invest токен admin-пользователя."""
-    from accounts.models import TraderProfile
-    try:
-        profile = TraderProfile.objects.select_related("user").get(
-            user__username="admin"
-        )
-        token = profile.tinkoff_token
-        return token if token else None
-    except TraderProfile.DoesNotExist:
-        return None
+    """Получить расшифрованный T-Invest токен admin-пользователя (кеш процесса)."""
+    return get_admin_token()
 
 
 def _probe_tinkoff(token: str) -> None:
@@ -84,68 +92,218 @@ def load_candles_for_instrument(
     )
 
 
+@shared_task(bind=True, time_limit=7200, soft_time_limit=7000)
+def load_native_candles(
+    self,
+    ticker: str,
+    interval: int,
+    start: str | None = None,
+    end: str | None = None,
+    market: str = "stock",
+    api_ticker: str | None = None,
+):
+    """
+    Свечи ``interval`` (одна из ROLLUP_INTERVALS) готовыми из T-Invest прямо
+    в ряд свёртки — длинная история графиков без 1-мин ряда: дневки за
+    10 лет — десяток запросов вместо тысяч суточных.
+    """
+    ticker = ticker.upper()
+    token = _get_admin_token()
+    if not token:
+        return {"ticker": ticker, "status": "no_token"}
+    instrument_type = "FUTURES" if market == "futures" else "STOCK"
+    uid = resolve_instrument_uid(token, api_ticker or ticker, instrument_type)
+    if not uid:
+        return {"ticker": ticker, "status": "uid_not_found"}
+
+    start_date = date.fromisoformat(start) if start else date(settings.CANDLES_HISTORY_START_YEAR, 1, 1)
+    end_date = date.fromisoformat(end) if end else date.today()
+    status = "ok"
+    count = 0
+    try:
+        for chunk in iter_tinkoff_candles(token, uid, start_date, end_date, interval=interval):
+            if len(chunk.records):
+                save_candle_records(ticker, chunk.records, interval=interval)
+                invalidate_candles_cache(ticker, chunk.from_date, chunk.till_date)
+                count += len(chunk.records)
+    except CandleFetchError:
+        status = "partial"
+    return {"ticker": ticker, "interval": interval, "status": status, "candles": count}
+
+
 @shared_task(bind=True, time_limit=3600, soft_time_limit=3300)
 def load_all_candles(self, year: int | None = None):
-    """Fan-out загрузка свечей для всех активных инструментов."""
-    from instruments.models import Futures, Instrument
-
+    """Fan-out загрузка свечей года для активных инструментов, у которых есть пропуски."""
     year = year or date.today().year
-    stocks = list(
-        Instrument.objects.filter(is_active=True, instrument_type="STOCK")
-        .values_list("ticker", flat=True)
-    )
-    futures = list(
-        Futures.objects.filter(is_active=True)
-        .exclude(secid="")
-        .values_list("ticker", "secid")
+    targets = active_sync_targets()
+    plan = plan_missing_ranges(
+        [t.ticker for t in targets],
+        start=date(year, 1, 1),
+        end=min(date(year, 12, 31), date.today()),
     )
+    pending = [t for t in targets if t.ticker in plan]
 
-    for i, ticker in enumerate(stocks):
-        load_candles_for_instrument.apply_async(
-            kwargs={"ticker": ticker, "year": year, "market": "stock"},
-            countdown=i * 3,
-        )
-
-    offset = len(stocks)
-    for i, (ticker, secid) in enumerate(futures):
+    # Без countdown: частоту запросов к T-Invest держит общий ограничитель.
+    for target in pending:
         load_candles_for_instrument.apply_async(
             kwargs={
-                "ticker": ticker,
+                "ticker": target.ticker,
                 "year": year,
-                "market": "futures",
-                "api_ticker": secid,
+                "market": target.market,
+                "api_ticker": target.api_ticker,
             },
-            countdown=(offset + i) * 3,
         )
 
-    return {"stocks": len(stocks), "futures": len(futures), "year": year}
+    return {
+        "stocks": sum(t.market == "stock" for t in pending),
+        "futures": sum(t.market == "futures" for t in pending),
+        "skipped": len(targets) - len(pending),
+        "year": year,
+    }
 
 
 @shared_task(bind=True)
-def update_today_candles(self):
-    """Периодический tick: fan-out sync с start=end=today для всех активных тикеров."""
-    from instruments.models import Futures, Instrument
-
-    today_iso = date.today().isoformat()
-    targets: list[tuple[str, str, str]] = []
-    for inst in Instrument.objects.filter(is_active=True, instrument_type="STOCK"):
-        targets.append((inst.ticker.upper(), inst.ticker, "stock"))
-    for fut in Futures.objects.filter(is_active=True).exclude(secid=""):
-        targets.append((fut.ticker.upper(), fut.secid, "futures"))
-
-    for i, (ticker, api_ticker, market) in enumerate(targets):
+def update_today_candles(self, force: bool = False):
+    """
+    Fan-out sync с start=end=today для тикеров с пропусками за сегодня — по
+    задаче на тикер (периодический tick — ``sync_candles_round``). Тикеры
+    live-ленты ``stream_candles`` пропускаются, пока она жива; ``force`` —
+    опросить и их.
+    """
+    today = date.today()
+    today_iso = today.isoformat()
+    live = set() if force else live_tickers()
+    targets = [t for t in active_sync_targets() if t.ticker not in live]
+    plan = plan_missing_ranges([t.ticker for t in targets], start=today, end=today)
+    pending = [t for t in targets if t.ticker in plan]
+
+    for target in pending:
         sync_candles_for_instrument.apply_async(
             kwargs={
-                "ticker": ticker,
-                "api_ticker": api_ticker,
-                "market": market,
+                "ticker": target.ticker,
+                "api_ticker": target.api_ticker,
+                "market": target.market,
                 "start": today_iso,
                 "end": today_iso,
             },
-            countdown=i * 1,
         )
 
-    return {"total": len(targets), "date": today_iso}
+    return {
+        "total": len(pending),
+        "skipped": len(targets) - len(pending),
+        "live": len(live),
+        "date": today_iso,
+    }
+
+
+_ROUND_LOCK_KEY = "candles:sync_round:lock"
+_ROUND_CURSOR_KEY = "candles:sync_round:cursor"
+ROUND_STATS_KEY = "candles:sync_round:last"
+
+
+@shared_task(bind=True, time_limit=900, soft_time_limit=840)
+def sync_candles_round(self, force: bool = False):
+    """
+    Периодический tick догрузки за сегодня одним воркером для всех тикеров.
+
+    Токен, план пропусков и разрешение UID — один раз на раунд, тикеры идут
+    подряд в пределах ``CANDLES_SYNC_ROUND_BUDGET`` секунд; не успевшие
+    (backlog) начинают следующий раунд. Пока предыдущий раунд не закончился,
+    новый tick пропускается. Тикеры live-ленты ``stream_candles`` не
+    опрашиваются, ``force`` — опросить все. Итог раунда — в кеше
+    ``ROUND_STATS_KEY``.
+    """
+    task_id = getattr(self.request, "id", None) or "unknown"
+    if not cache.add(_ROUND_LOCK_KEY, task_id, timeout=sync_candles_round.time_limit):
+        logger.info("sync_candles_round: previous round still running, tick skipped")
+        return {"status": "skipped"}
+
+    started = time.monotonic()
+    try:
+        token = _get_admin_token()
+        if not token:
+            return {"status": "no_token"}
+
+        today = date.today()
+        live = set() if force else live_tickers()
+        targets = [t for t in active_sync_targets() if t.ticker not in live]
+        plan = plan_missing_ranges([t.ticker for t in targets], start=today, end=today)
+        pending = [t for t in targets if t.ticker in plan]
+
+        # Начинаем с тикера, следующего за последним обработанным в прошлом раунде.
+        cursor = cache.get(_ROUND_CURSOR_KEY)
+        names = [t.ticker for t in pending]
+        if cursor in names:
+            shift = names.index(cursor) + 1
+            pending = pending[shift:] + pending[:shift]
+
+        deadline = started + settings.CANDLES_SYNC_ROUND_BUDGET
+        synced = locked = unresolved = candles = errors = 0
+        for target in pending:
+            if time.monotonic() >= deadline:
+                break
+            cache.set(_ROUND_CURSOR_KEY, target.ticker, 86400)
+            if cache.get(_lock_key(target.ticker)):
+                # Идёт ручной sync тикера: не обработан, остаётся в backlog.
+                locked += 1
+                continue
+            instrument_type = "FUTURES" if target.market == "futures" else "STOCK"
+            uid = resolve_instrument_uid(token, target.api_ticker, instrument_type)
+            if not uid:
+                # UID не разрешён: тикер пройден, но не синхронизирован.
+                unresolved += 1
+                errors += 1
+                continue
+            synced += 1
+            for gap in plan[target.ticker]:
+                try:
+                    fetched, complete = _fetch_and_save(token, uid, target.ticker, gap)
+                except SoftTimeLimitExceeded:
+                    raise
+                except Exception as exc:
+                    logger.error("sync_candles_round %s %s-%s: %s", target.ticker, gap.from_date, gap.till_date, exc)
+                    errors += 1
+                    continue
+                candles += fetched
+                if not complete:
+                    errors += 1
+
+        stats = {
+            "tickers": len(targets),
+            "live": len(live),
+            "pending": len(pending),
+            "synced": synced,
+            "locked": locked,
+            "unresolved": unresolved,
+            "backlog": len(pending) - synced - unresolved,
+            "candles": candles,
+            "errors": errors,
+            "duration_s": round(time.monotonic() - started, 1),
+            "date": today.isoformat(),
+        }
+        cache.set(ROUND_STATS_KEY, stats, 86400)
+        logger.info("sync_candles_round: %s", stats)
+        return stats
+    finally:
+        cache.delete(_ROUND_LOCK_KEY)
+
+
+@shared_task(bind=True, time_limit=600, soft_time_limit=540)
+def sync_instrument_uids(self):
+    """Массовое разрешение T-Invest UID акций и фьючерсов справочника."""
+    token = _get_admin_token()
+    if not token:
+        return {"status": "no_token"}
+    result = resolve_all_instrument_uids(token)
+    logger.info("sync_instrument_uids: %s", result)
+    return result
+
+
+@shared_task(bind=True, time_limit=3600, soft_time_limit=3300)
+def compact_candles_storage(self):
+    """Ночное уплотнение хранилища свечей (повторы ts от дозаписи live-тиков)."""
+    call_command('compact_candles')
+    return {"status": "ok"}
 
 
 # ---------------------------------------------------------------------------
@@ -169,6 +327,47 @@ def _release_lock(ticker: str) -> None:
     cache.delete(_state_key(ticker))
 
 
+def _publish_saved_bars(ticker: str, records: np.ndarray, since: datetime | None) -> None:
+    """Разослать подписчикам графика бары ``records`` не старше прежнего последнего (``since``)."""
+    if since is not None:
+        records = records[records["ts"] >= int((since - datetime(1970, 1, 1)).total_seconds())]
+    try:
+        publish_bars(ticker, records)
+    except Exception as exc:
+        # Рассылка — не часть догрузки: бары уже сохранены.
+        logger.warning("publish bars %s: %s", ticker, exc)
+
+
+def _fetch_and_save(token: str, uid: str, ticker: str, gap: GapRange) -> tuple[int, bool]:
+    """
+    Загрузить и сохранить один диапазон: (число свечей, ответ полный).
+
+    Каждое окно запроса сразу пишется в хранилище, а его пустые дни
+    помечаются — память не растёт с длиной диапазона, а после таймаута или
+    ошибки следующий sync догружает только недописанные окна. Новые бары
+    окна с сегодняшним днём рассылаются в ``live_group`` — как из live-ленты.
+    """
+    today = date.today()
+    count = 0
+    complete = True
+    try:
+        for chunk in iter_tinkoff_candles(token, uid, gap.from_date, gap.till_date, interval=1):
+            if len(chunk.records):
+                live = chunk.till_date >= today
+                since = last_saved_candle_dt(ticker) if live else None
+                save_candle_records(ticker, chunk.records)
+                invalidate_candles_cache(ticker, chunk.from_date, chunk.till_date)
+                cache.delete(f"candles:last_saved:{ticker}")
+                if live:
+                    _publish_saved_bars(ticker, chunk.records, since)
+                count += len(chunk.records)
+            mark_empty_days(ticker, chunk.from_date, chunk.till_date, chunk.records)
+    except CandleFetchError:
+        # Упавшие окна догрузит следующий sync.
+        complete = False
+    return count, complete
+
+
 def _run_sync_candles(
     self,
     ticker: str,
@@ -219,12 +418,10 @@ def _run_sync_candles(
     try:
         for i, gap in enumerate(ranges, 1):
             try:
-                candles = fetch_tinkoff_candles(token, uid, gap.from_date, gap.till_date, interval=1)
-                if candles:
-                    save_candles_to_csv(ticker, candles)
-                    cache.delete_pattern(f"candles:{ticker}:*")
-                    cache.delete(f"candles:last_saved:{ticker}")
-                    cumulative += len(candles)
+                fetched, complete = _fetch_and_save(token, uid, ticker, gap)
+                cumulative += fetched
+                if not complete:
+                    errors += 1
 
                 event = {
                     "type": "sync.progress",
@@ -233,12 +430,11 @@ def _run_sync_candles(
                     "total_ranges": total,
                     "range_from": gap.from_date.isoformat(),
                     "range_till": gap.till_date.isoformat(),
-                    "range_candles": len(candles),
+                    "range_candles": fetched,
                     "cumulative_candles": cumulative,
                 }
                 cache.set(_state_key(ticker), event, 86400)
                 _publish(layer, group, event)
-                time.sleep(0.2)
             except SoftTimeLimitExceeded:
                 raise
             except Exception as exc:
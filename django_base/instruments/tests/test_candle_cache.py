@@ -0,0 +1,128 @@
+from datetime import date
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CandlesCacheKeyTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_key_is_stable_until_invalidated(self):
+        from instruments.candle_cache import candles_cache_key, invalidate_candles_cache
+        key = candles_cache_key("SBER", date(2026, 4, 1), date(2026, 5, 4), 1, "rows")
+        self.assertEqual(key, candles_cache_key("SBER", date(2026, 4, 1), date(2026, 5, 4), 1, "rows"))
+
+        invalidate_candles_cache("SBER", date(2026, 5, 4), date(2026, 5, 4))
+        self.assertNotEqual(key, candles_cache_key("SBER", date(2026, 4, 1), date(2026, 5, 4), 1, "rows"))
+
+    def test_untouched_months_and_tickers_stay_cached(self):
+        from instruments.candle_cache import candles_cache_key, invalidate_candles_cache
+        april = candles_cache_key("SBER", date(2026, 4, 1), date(2026, 4, 30), 60, "rows")
+        gazp = candles_cache_key("GAZP", date(2026, 5, 1), date(2026, 5, 4), 60, "rows")
+        invalidate_candles_cache("SBER", date(2026, 5, 4), date(2026, 5, 4))
+        self.assertEqual(april, candles_cache_key("SBER", date(2026, 4, 1), date(2026, 4, 30), 60, "rows"))
+        self.assertEqual(gazp, candles_cache_key("GAZP", date(2026, 5, 1), date(2026, 5, 4), 60, "rows"))
+
+    def test_evicted_version_never_reuses_old_key(self):
+        from instruments.candle_cache import candles_cache_key, invalidate_candles_cache
+        seen = {candles_cache_key("SBER", date(2026, 5, 1), date(2026, 5, 4), 1, "rows")}
+        invalidate_candles_cache("SBER", date(2026, 5, 1), date(2026, 5, 1))
+        seen.add(candles_cache_key("SBER", date(2026, 5, 1), date(2026, 5, 4), 1, "rows"))
+        cache.delete("candles:ver:SBER:2026-05")
+        seen.add(candles_cache_key("SBER", date(2026, 5, 1), date(2026, 5, 4), 1, "rows"))
+        self.assertEqual(len(seen), 3)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CandleBlockCacheTests(SimpleTestCase):
+    def setUp(self):
+        import shutil
+        from pathlib import Path
+        cache.clear()
+        self.root = Path(f"_blocks_{self._testMethodName}_tmp").resolve()
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.addCleanup(lambda: shutil.rmtree(self.root, ignore_errors=True))
+        settings_ctx = override_settings(CANDLES_ROOT=str(self.root))
+        settings_ctx.enable()
+        self.addCleanup(settings_ctx.disable)
+
+    def _save(self, day: date, times: list[str], close: float = 100.0):
+        from instruments.candles import save_candles_to_csv
+        save_candles_to_csv("SBER", [
+            {"datetime": f"{day} {t}", "open": 1, "high": 2, "low": 0.5,
+             "close": close, "volume": 1, "value": 1}
+            for t in times
+        ])
+
+    def test_assembled_range_matches_storage(self):
+        from instruments.candle_cache import read_cached_candle_records
+        from instruments.candles import read_candle_records
+        for day in (date(2026, 4, 29), date(2026, 4, 30), date(2026, 5, 4)):
+            self._save(day, ["10:00:00", "10:01:00", "14:30:00"])
+        for interval in (1, 5, 60, 1440, 7):
+            for limit in (None, 2, 5):
+                expected = read_candle_records("SBER", date(2026, 4, 30), date(2026, 5, 4), interval, limit)
+                actual = read_cached_candle_records("SBER", date(2026, 4, 30), date(2026, 5, 4), interval, limit)
+                self.assertEqual(actual.tolist(), expected.tolist(), (interval, limit))
+
+    def test_scrolling_back_reuses_blocks(self):
+        from unittest import mock
+        from instruments import candles
+        from instruments.candle_cache import read_cached_candle_records
+        self._save(date(2026, 4, 30), ["10:00:00"])
+        self._save(date(2026, 5, 4), ["10:00:00"])
+        read_cached_candle_records("SBER", date(2026, 5, 1), date(2026, 5, 4))
+        with mock.patch.object(candles, "read_candle_records", wraps=candles.read_candle_records) as read:
+            records = read_cached_candle_records("SBER", date(2026, 4, 30), date(2026, 5, 4))
+        self.assertEqual(len(records), 2)
+        read.assert_called_once_with("SBER", date(2026, 4, 30), date(2026, 4, 30), 1)
+
+    def test_invalidation_drops_only_touched_days(self):
+        from instruments.candle_cache import invalidate_candles_cache, read_cached_candle_records
+        self._save(date(2026, 5, 4), ["10:00:00"])
+        self._save(date(2026, 5, 5), ["10:00:00"])
+        read_cached_candle_records("SBER", date(2026, 5, 4), date(2026, 5, 5))
+        self._save(date(2026, 5, 4), ["11:00:00"], close=1.0)
+        self._save(date(2026, 5, 5), ["11:00:00"], close=1.0)
+        invalidate_candles_cache("SBER", date(2026, 5, 5), date(2026, 5, 5))
+        records = read_cached_candle_records("SBER", date(2026, 5, 4), date(2026, 5, 5))
+        # 04.05 отдан из кэша, 05.05 перечитан.
+        self.assertEqual(len(records), 3)
+
+    def test_invalidation_during_storage_read_is_not_lost(self):
+        from unittest import mock
+        from instruments import candles
+        from instruments.candle_cache import invalidate_candles_cache, read_cached_candle_records
+        day = date(2026, 5, 4)
+        self._save(day, ["10:00:00"])
+        real_read = candles.read_candle_records
+
+        def read_then_sync(*args):
+            # Синхронизация дописывает день и инвалидирует кэш, пока
+            # читатель держит старые бары и ещё не записал блок.
+            records = real_read(*args)
+            self._save(day, ["11:00:00"])
+            invalidate_candles_cache("SBER", day, day)
+            return records
+
+        with mock.patch.object(candles, "read_candle_records", side_effect=read_then_sync):
+            self.assertEqual(len(read_cached_candle_records("SBER", day, day)), 1)
+        self.assertEqual(len(read_cached_candle_records("SBER", day, day)), 2)
+
+    def test_rollup_rebuild_drops_closed_blocks(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from instruments.candle_cache import read_cached_candle_records
+        from instruments.candle_storage import get_candle_storage
+        day = date(2026, 5, 4)
+        self._save(day, ["10:00:00", "10:01:00"])
+        storage = get_candle_storage()
+        stale = storage.read("SBER", day, day, 1440).copy()
+        stale["close"] = 0.0
+        storage._write_series("SBER", stale, 1440)
+        self.assertEqual(read_cached_candle_records("SBER", day, day, 1440)["close"].tolist(), [0.0])
+
+        call_command("rebuild_candle_rollups", "--ticker", "SBER", stdout=StringIO())
+        self.assertEqual(read_cached_candle_records("SBER", day, day, 1440)["close"].tolist(), [100.0])
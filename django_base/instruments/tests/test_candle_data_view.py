@@ -0,0 +1,187 @@
+import gzip
+import json
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from instruments.models import Instrument
+
+URL = "/api/instruments/SBER/candles/"
+WINDOW = {"from": "2026-05-04", "till": "2026-05-05"}
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CandleDataViewTestCase(TestCase):
+    def setUp(self):
+        import shutil
+        from pathlib import Path
+        from django.core.cache import cache
+        from instruments.candles import save_candles_to_csv
+        cache.clear()
+        self.root = Path(f"_view_{self._testMethodName}_tmp").resolve()
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.addCleanup(lambda: shutil.rmtree(self.root, ignore_errors=True))
+        settings_ctx = override_settings(CANDLES_ROOT=str(self.root))
+        settings_ctx.enable()
+        self.addCleanup(settings_ctx.disable)
+
+        Instrument.objects.create(
+            ticker="SBER", name="Sber", instrument_type="STOCK",
+            is_active=True, min_price_step="0.01",
+        )
+        save_candles_to_csv("SBER", [
+            {"datetime": f"{day} {t}", "open": 100 + i, "high": 102 + i, "low": 99 + i,
+             "close": 101.5 + i, "volume": 10 + i, "value": 1000}
+            for day in ("2026-05-04", "2026-05-05")
+            for i, t in enumerate(("10:00:00", "10:01:00", "10:07:00"))
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(username="u", password="x"))
+
+    def _get(self, params, **headers):
+        return self.client.get(URL, params, **headers)
+
+
+class CandleStreamTests(CandleDataViewTestCase):
+    def _plain(self, **params):
+        resp = self._get({**WINDOW, **params})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def _streamed(self, encoding, **params):
+        resp = self._get({**WINDOW, "stream": "1", **params}, HTTP_ACCEPT_ENCODING=encoding)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/json")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        return resp, b"".join(resp.streaming_content)
+
+    def test_gzip_matches_plain_json(self):
+        resp, body = self._streamed("gzip")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(body)), self._plain())
+
+    def test_br_matches_plain_json(self):
+        from instruments import candle_stream
+        resp, body = self._streamed("br")
+        if candle_stream.brotli is None:
+            # Без пакета brotli br не предлагается — ответ без сжатия.
+            self.assertFalse(resp.has_header("Content-Encoding"))
+        else:
+            self.assertEqual(resp["Content-Encoding"], "br")
+            body = candle_stream.brotli.decompress(body)
+        self.assertEqual(json.loads(body), self._plain())
+
+    def test_identity_when_no_codec_accepted(self):
+        resp, body = self._streamed("identity")
+        self.assertFalse(resp.has_header("Content-Encoding"))
+        self.assertEqual(json.loads(body), self._plain())
+
+    def test_columns_layout(self):
+        resp, body = self._streamed("gzip", layout="columns")
+        payload = json.loads(gzip.decompress(body))
+        self.assertEqual(payload["layout"], "columns")
+        self.assertEqual(len(payload["candles"]["time"]), 6)
+        self.assertEqual(payload, self._plain(layout="columns"))
+
+    def test_interval_rollup_matches_plain_json(self):
+        resp, body = self._streamed("gzip", interval="5")
+        self.assertEqual(json.loads(gzip.decompress(body)), self._plain(interval="5"))
+
+
+
+class CandleBinaryFormatTests(CandleDataViewTestCase):
+    def _decode(self, resp):
+        from instruments.renderers import unpack_candles
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/vnd.candles")
+        interval, columns = unpack_candles(resp.content)
+        return interval, [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def test_bin_decodes_to_json_bars(self):
+        for interval in ("1", "5"):
+            plain = self._get({**WINDOW, "interval": interval}).json()
+            decoded_interval, bars = self._decode(self._get({**WINDOW, "interval": interval, "format": "bin"}))
+            self.assertEqual(decoded_interval, int(interval))
+            self.assertEqual(bars, plain["candles"])
+
+    def test_accept_header_selects_bin(self):
+        _, bars = self._decode(self._get(WINDOW, HTTP_ACCEPT="application/vnd.candles"))
+        self.assertEqual(len(bars), 6)
+
+    def test_error_under_bin_is_json(self):
+        resp = self.client.get("/api/instruments/ZZZZ/candles/", {**WINDOW, "format": "bin"})
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp["Content-Type"], "application/json")
+        self.assertIn("detail", resp.json())
+
+    def test_stream_with_bin_falls_back_to_binary(self):
+        resp = self._get({**WINDOW, "stream": "1", "format": "bin"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(resp.streaming)
+        self.assertFalse(resp.has_header("Content-Encoding"))
+        _, bars = self._decode(resp)
+        self.assertEqual(len(bars), 6)
+
+    def test_cache_separates_bin_from_json_layouts(self):
+        self._decode(self._get({**WINDOW, "format": "bin"}))
+        rows = self._get(WINDOW)
+        self.assertEqual(rows["Content-Type"], "application/json")
+        self.assertEqual(rows.json()["layout"], "rows")
+        columns = self._get({**WINDOW, "layout": "columns"}).json()
+        self.assertEqual(columns["layout"], "columns")
+        self.assertEqual(len(columns["candles"]["time"]), 6)
+        _, bars = self._decode(self._get({**WINDOW, "format": "bin"}))
+        self.assertEqual(bars, rows.json()["candles"])
+
+
+def _ts(day: date, hour: int, minute: int) -> int:
+    from instruments.candle_storage import day_to_ts
+    return day_to_ts(day) + hour * 3600 + minute * 60
+
+
+class CandleSinceCursorTests(CandleDataViewTestCase):
+    def test_from_defaults_to_cursor_day(self):
+        since = _ts(date(2026, 5, 5), 10, 1)
+        payload = self._get({"till": "2026-05-05", "since": since}).json()
+        self.assertEqual(payload["from"], "2026-05-05")
+        self.assertEqual(payload["since"], since)
+        self.assertEqual([c["time"] for c in payload["candles"]], [since, _ts(date(2026, 5, 5), 10, 7)])
+
+    def test_explicit_from_is_kept(self):
+        since = _ts(date(2026, 5, 5), 10, 7)
+        payload = self._get({**WINDOW, "since": since}).json()
+        self.assertEqual(payload["from"], "2026-05-04")
+        self.assertEqual(payload["count"], 1)
+
+    def test_cursor_response_bypasses_cache(self):
+        from unittest import mock
+        from instruments import views
+        with mock.patch.object(views, "cache") as cache:
+            resp = self._get({**WINDOW, "since": _ts(date(2026, 5, 5), 10, 0)})
+        self.assertEqual(resp.json()["count"], 3)
+        cache.get.assert_not_called()
+        cache.set.assert_not_called()
+
+    def test_rollup_returns_partial_bucket(self):
+        from instruments.candles import save_candles_to_csv
+        since = _ts(date(2026, 5, 5), 10, 5)
+        params = {**WINDOW, "interval": "5", "since": since}
+        bars = self._get(params).json()["candles"]
+        self.assertEqual([(b["time"], b["open"], b["close"]) for b in bars], [(since, 102.0, 103.5)])
+
+        save_candles_to_csv("SBER", [{
+            "datetime": "2026-05-05 10:08:00", "open": 104, "high": 110, "low": 103,
+            "close": 105, "volume": 5, "value": 1000,
+        }])
+        bars = self._get(params).json()["candles"]
+        self.assertEqual(
+            [(b["time"], b["open"], b["high"], b["close"], b["volume"]) for b in bars],
+            [(since, 102.0, 110.0, 105.0, 17.0)],
+        )
+
+    def test_invalid_cursor_is_ignored(self):
+        plain = self._get(WINDOW).json()
+        payload = self._get({**WINDOW, "since": "abc"}).json()
+        self.assertNotIn("since", payload)
+        self.assertEqual(payload, plain)
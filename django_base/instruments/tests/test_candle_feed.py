@@ -0,0 +1,93 @@
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+
+def _stream_candle(uid: str, minute: int, price: float = 100.0):
+    quotation = SimpleNamespace(units=int(price), nano=0)
+    return SimpleNamespace(
+        instrument_uid=uid,
+        time=datetime(2026, 5, 4, 7, minute, tzinfo=timezone.utc),
+        open=quotation, high=quotation, low=quotation, close=quotation, volume=5,
+    )
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CandleFeedTests(SimpleTestCase):
+    def setUp(self):
+        import shutil
+        from pathlib import Path
+        cache.clear()
+        self.root = Path(f"_feed_{self._testMethodName}_tmp").resolve()
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.addCleanup(lambda: shutil.rmtree(self.root, ignore_errors=True))
+        settings_ctx = override_settings(CANDLES_ROOT=str(self.root))
+        settings_ctx.enable()
+        self.addCleanup(settings_ctx.disable)
+        self.layer = MagicMock()
+        self.events = []
+
+        async def group_send(group, event):
+            self.events.append((group, event))
+
+        self.layer.group_send = group_send
+
+    def _feed(self):
+        from instruments.candle_feed import CandleFeed
+        return CandleFeed({"uid-sber": "SBER", "uid-gazp": "GAZP"}, layer=self.layer)
+
+    def test_closed_bars_appended_and_published(self):
+        from instruments.candle_storage import get_candle_storage
+        feed = self._feed()
+        feed.handle(SimpleNamespace(candle=_stream_candle("uid-sber", 0)))
+        feed.handle(SimpleNamespace(candle=_stream_candle("uid-sber", 1, 101.0)))
+        feed.handle(SimpleNamespace(candle=_stream_candle("uid-unknown", 1)))
+        feed.handle(SimpleNamespace(candle=None))
+
+        records = get_candle_storage().read("SBER", date(2026, 5, 4), date(2026, 5, 4))
+        self.assertEqual(records["close"].tolist(), [100.0, 101.0])
+        self.assertEqual(feed.bars, 2)
+        self.assertEqual([group for group, _ in self.events], ["candles_live_SBER"] * 2)
+        group, event = self.events[-1]
+        self.assertEqual(event["type"], "candle.bar")
+        self.assertEqual(event["candle"]["time"], int(records["ts"][-1]))
+        self.assertEqual(event["candle"]["close"], 101.0)
+
+    def test_heartbeat_lists_tickers_and_drops_failed(self):
+        from instruments.candle_feed import live_tickers
+        feed = self._feed()
+        feed.handle(SimpleNamespace(candle=None))
+        self.assertEqual(live_tickers(), {"SBER", "GAZP"})
+
+        with patch("instruments.candle_feed.save_candle_records", side_effect=OSError("disk full")):
+            feed.handle(SimpleNamespace(candle=_stream_candle("uid-gazp", 0)))
+        self.assertEqual(feed.bars, 0)
+        self.assertEqual(live_tickers(), {"SBER"})
+
+
+class StreamCandlesCommandTests(SimpleTestCase):
+    def test_subscribes_resolved_uids_and_backfills_today(self):
+        from django.core.management import call_command
+        from instruments.candles_gaps import SyncTarget
+        from instruments.management.commands import stream_candles
+
+        targets = [SyncTarget("SBER", "SBER", "stock"), SyncTarget("SIU5", "SiU5", "futures")]
+        uids = {"SBER": "uid-sber", "SiU5": None}
+        feeds = []
+
+        def run(feed, token):
+            feeds.append(feed)
+            raise KeyboardInterrupt
+
+        with patch("instruments.tasks._get_admin_token", return_value="token"), \
+             patch("instruments.tasks.sync_candles_round.delay") as backfill_mock, \
+             patch.object(stream_candles, "active_sync_targets", return_value=targets), \
+             patch.object(stream_candles, "resolve_instrument_uid", side_effect=lambda t, ticker, kind: uids[ticker]), \
+             patch.object(stream_candles.CandleFeed, "run", run):
+            call_command("stream_candles", stdout=MagicMock())
+
+        self.assertEqual(feeds[0].tickers_by_uid, {"uid-sber": "SBER"})
+        backfill_mock.assert_called_once_with(force=True)
@@ -0,0 +1,407 @@
+import shutil
+from datetime import date, datetime
+from pathlib import Path
+
+import pandas as pd
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+
+def _candles(day: date, times: list[str], close: float = 100.5) -> list[dict]:
+    return [
+        {
+            "datetime": f"{day.isoformat()} {t}",
+            "open": 100.0, "high": 101.0, "low": 99.0, "close": close,
+            "volume": 10, "value": 1000,
+        }
+        for t in times
+    ]
+
+
+class _StorageTestMixin:
+    backend = "csv"
+
+    def setUp(self):
+        self.root = Path(f"_storage_{self.backend}_{self._testMethodName}_tmp").resolve()
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.root.mkdir(parents=True)
+        self.addCleanup(lambda: shutil.rmtree(self.root, ignore_errors=True))
+        settings_ctx = override_settings(
+            CANDLES_ROOT=str(self.root), CANDLES_STORAGE_BACKEND=self.backend,
+        )
+        settings_ctx.enable()
+        self.addCleanup(settings_ctx.disable)
+
+    def test_roundtrip_across_days_and_months(self):
+        from instruments.candles import read_candles, save_candles_to_csv
+        candles = (
+            _candles(date(2026, 4, 30), ["10:00:00", "10:01:00"])
+            + _candles(date(2026, 5, 4), ["10:00:00"])
+        )
+        save_candles_to_csv("sber", candles)
+        df = read_candles("SBER", date(2026, 4, 30), date(2026, 5, 4))
+        self.assertEqual(len(df), 3)
+        self.assertEqual(df["datetime"].iloc[0], pd.Timestamp("2026-04-30 10:00:00"))
+        self.assertEqual(df["datetime"].iloc[-1], pd.Timestamp("2026-05-04 10:00:00"))
+        self.assertEqual(df["volume"].tolist(), [10, 10, 10])
+
+    def test_range_read_is_day_exact(self):
+        from instruments.candles import read_candles, save_candles_to_csv
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 4), ["10:00:00"]))
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 5), ["10:00:00"]))
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 6), ["10:00:00"]))
+        df = read_candles("SBER", date(2026, 5, 5), date(2026, 5, 5))
+        self.assertEqual(df["datetime"].tolist(), [pd.Timestamp("2026-05-05 10:00:00")])
+
+    def test_merge_replaces_duplicates_and_sorts(self):
+        from instruments.candles import read_candles, save_candles_to_csv
+        day = date(2026, 5, 4)
+        save_candles_to_csv("SBER", _candles(day, ["10:01:00", "10:02:00"]))
+        save_candles_to_csv("SBER", _candles(day, ["10:00:00", "10:02:00"], close=200.0))
+        df = read_candles("SBER", day, day)
+        self.assertEqual(
+            [t.strftime("%H:%M") for t in df["datetime"]], ["10:00", "10:01", "10:02"],
+        )
+        self.assertEqual(df["close"].tolist(), [200.0, 100.5, 200.0])
+
+    def test_days_present_and_last_datetime(self):
+        from instruments.candle_storage import get_candle_storage
+        from instruments.candles import save_candles_to_csv
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 4), ["10:00:00"]))
+        save_candles_to_csv("SBER", _candles(date(2026, 6, 1), ["18:00:00", "23:49:00"]))
+        storage = get_candle_storage()
+        self.assertEqual(
+            storage.days_present("SBER", date(2026, 5, 1), date(2026, 6, 30)),
+            {date(2026, 5, 4), date(2026, 6, 1)},
+        )
+        self.assertEqual(storage.last_datetime("SBER"), datetime(2026, 6, 1, 23, 49))
+        self.assertIsNone(storage.last_datetime("GAZP"))
+
+    def test_rollups_match_resample(self):
+        from instruments.candles import read_candles, resample_candles, save_candles_to_csv
+        times = [f"{h:02d}:{m:02d}:00" for h in (9, 10, 13, 23) for m in (0, 7, 31, 59)]
+        save_candles_to_csv("SBER", _candles(date(2026, 4, 30), times, close=100.0))
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 4), times, close=101.0))
+        minutes = read_candles("SBER", date(2026, 4, 30), date(2026, 5, 4))
+        for interval in (5, 60, 120, 240, 1440, 7):
+            with self.subTest(interval=interval):
+                expected = resample_candles(minutes, interval)
+                actual = read_candles("SBER", date(2026, 4, 30), date(2026, 5, 4), interval)
+                pd.testing.assert_frame_equal(
+                    actual.reset_index(drop=True), expected.reset_index(drop=True),
+                    check_dtype=False,
+                )
+
+    def test_rollups_follow_rewrites(self):
+        from instruments.candles import read_candles, save_candles_to_csv
+        day = date(2026, 5, 4)
+        save_candles_to_csv("SBER", _candles(day, ["10:00:00", "10:01:00"]))
+        save_candles_to_csv("SBER", _candles(day, ["10:01:00"], close=200.0))
+        daily = read_candles("SBER", day, day, 1440)
+        self.assertEqual(daily["close"].tolist(), [200.0])
+        self.assertEqual(daily["volume"].tolist(), [20])
+
+    def test_rollups_used_only_when_complete(self):
+        from io import StringIO
+        from instruments.candle_storage import get_candle_storage
+        from instruments.candles import read_candles, save_candles_to_csv
+        day = date(2026, 5, 4)
+        save_candles_to_csv("SBER", _candles(day, ["10:00:00", "11:00:00"]))
+        storage = get_candle_storage()
+        self.assertTrue(storage.rollups_ready("SBER"))
+
+        # История без свёрток: чтение идёт через ресэмплинг минут.
+        shutil.rmtree(self.root / "SBER" / "rollups")
+        self.assertFalse(storage.rollups_ready("SBER"))
+        save_candles_to_csv("SBER", _candles(day, ["12:00:00"]))
+        self.assertFalse(storage.rollups_ready("SBER"))
+        self.assertEqual(len(read_candles("SBER", day, day, 60)), 3)
+
+        call_command("rebuild_candle_rollups", stdout=StringIO())
+        self.assertTrue(storage.rollups_ready("SBER"))
+        self.assertEqual(len(read_candles("SBER", day, day, 60)), 3)
+        self.assertEqual(storage.tickers(), ["SBER"])
+
+    def test_tail_limit_matches_full_read(self):
+        from instruments.candles import read_candles, save_candles_to_csv
+        times = [f"{h:02d}:{m:02d}:00" for h in (9, 10, 13, 23) for m in (0, 7, 31, 59)]
+        for day in (date(2026, 4, 29), date(2026, 4, 30), date(2026, 5, 4)):
+            save_candles_to_csv("SBER", _candles(day, times))
+        start, end = date(2026, 4, 1), date(2026, 5, 31)
+        for interval in (1, 5, 60, 240, 1440, 7):
+            full = read_candles("SBER", start, end, interval)
+            for limit in (1, 3, 17, 1000):
+                with self.subTest(interval=interval, limit=limit):
+                    tail = read_candles("SBER", start, end, interval, limit=limit)
+                    pd.testing.assert_frame_equal(
+                        tail.reset_index(drop=True),
+                        full.tail(limit).reset_index(drop=True),
+                        check_dtype=False,
+                    )
+
+    def test_tail_limit_stops_at_latest_partition(self):
+        from unittest import mock
+        from instruments.candle_storage import CandleStorage
+        from instruments.candles import read_candle_records, save_candles_to_csv
+        save_candles_to_csv("SBER", _candles(date(2026, 4, 30), ["10:00:00"]))
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 4), ["10:00:00", "10:01:00"]))
+        original = CandleStorage._read_partition
+        with mock.patch.object(
+            CandleStorage, "_read_partition", autospec=True, side_effect=original,
+        ) as read_partition:
+            records = read_candle_records(
+                "SBER", date(2026, 4, 1), date(2026, 5, 31), limit=2,
+            )
+        self.assertEqual(len(records), 2)
+        read_paths = [str(c.args[1]) for c in read_partition.call_args_list]
+        self.assertFalse(any("2026/04" in p for p in read_paths), read_paths)
+
+    def test_since_returns_bars_from_cursor(self):
+        from instruments.candle_storage import day_to_ts
+        from instruments.candles import read_candle_records, save_candles_to_csv
+        day = date(2026, 5, 4)
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 1), ["10:00:00"]))
+        save_candles_to_csv("SBER", _candles(day, ["10:00:00", "10:05:00", "10:07:00"]))
+        cursor = day_to_ts(day) + 10 * 3600 + 5 * 60
+        minutes = read_candle_records("SBER", date(2026, 4, 1), day, since=cursor)
+        self.assertEqual((minutes["ts"] - cursor).tolist(), [0, 120])
+        # Формирующийся 5-мин бар 10:05 включён целиком.
+        bars = read_candle_records("SBER", date(2026, 4, 1), day, 5, since=cursor)
+        self.assertEqual(bars["ts"].tolist(), [cursor])
+        self.assertEqual(bars["volume"].tolist(), [20])
+        self.assertEqual(len(read_candle_records("SBER", day, day, since=cursor + 3600)), 0)
+
+    def test_live_tick_appends_without_rewrite(self):
+        from unittest import mock
+        from instruments.candle_storage import CandleStorage, get_candle_storage
+        from instruments.candles import read_candles, save_candles_to_csv
+        day = date(2026, 5, 4)
+        save_candles_to_csv("SBER", _candles(day, ["10:00:00", "10:01:00"]))
+        storage_cls = type(get_candle_storage())
+        with mock.patch.object(storage_cls, "_dump", autospec=True) as dump, \
+                mock.patch.object(CandleStorage, "_read_partition", autospec=True,
+                                  side_effect=CandleStorage._read_partition) as read:
+            # Пересылка дня: 10:01 обновился, 10:02 новый.
+            save_candles_to_csv(
+                "SBER",
+                _candles(day, ["10:00:00"]) + _candles(day, ["10:01:00", "10:02:00"], close=102.0),
+            )
+            # Тик с последней свечи: ничего не читается целиком.
+            read.reset_mock()
+            save_candles_to_csv("SBER", _candles(day, ["10:02:00", "10:03:00"], close=103.0))
+            self.assertFalse(read.called)
+        self.assertFalse(dump.called)
+
+        df = read_candles("SBER", day, day)
+        self.assertEqual(df["close"].tolist(), [100.5, 102.0, 103.0, 103.0])
+        daily = read_candles("SBER", day, day, 1440)
+        self.assertEqual(daily["volume"].tolist(), [40])
+        self.assertEqual(daily["close"].tolist(), [103.0])
+
+    def test_compact_removes_repeats(self):
+        from instruments.candle_storage import get_candle_storage
+        from instruments.candles import read_candles, save_candles_to_csv
+        day = date(2026, 5, 4)
+        save_candles_to_csv("SBER", _candles(day, ["10:00:00", "10:01:00"]))
+        save_candles_to_csv("SBER", _candles(day, ["10:01:00"], close=200.0))
+        storage = get_candle_storage()
+        self.assertGreater(storage.compact("SBER"), 0)
+        self.assertEqual(storage.compact("SBER"), 0)
+        self.assertEqual(read_candles("SBER", day, day)["close"].tolist(), [100.5, 200.0])
+        self.assertEqual(read_candles("SBER", day, day, 60)["volume"].tolist(), [20])
+
+    def test_failed_rewrite_keeps_previous_file(self):
+        from unittest import mock
+        from instruments.candles import read_candles, save_candles_to_csv
+        day = date(2026, 5, 4)
+        save_candles_to_csv("SBER", _candles(day, ["10:01:00"]))
+        with mock.patch("instruments.candle_storage.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                save_candles_to_csv("SBER", _candles(day, ["10:00:00"]))
+        self.assertEqual(read_candles("SBER", day, day)["close"].tolist(), [100.5])
+        self.assertEqual(list(self.root.rglob("*.tmp")), [])
+
+    def test_lock_file_is_not_a_partition(self):
+        from instruments.candle_storage import get_candle_storage
+        storage = get_candle_storage()
+        with storage.lock("SBER"):
+            pass
+        self.assertEqual(storage.tickers(), [])
+        self.assertFalse(storage.rollups_ready("SBER"))
+
+    def test_manifest_tracks_days_rows_and_last_ts(self):
+        from unittest import mock
+        from instruments.candle_storage import get_candle_storage
+        from instruments.candles import save_candles_to_csv
+        day = date(2026, 5, 4)
+        save_candles_to_csv("SBER", _candles(day, ["10:00:00", "10:01:00"]))
+        save_candles_to_csv("SBER", _candles(day, ["10:01:00", "10:02:00"], close=200.0))
+        save_candles_to_csv("SBER", _candles(day, ["09:59:00"]))
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 6), ["10:00:00"]))
+        storage = get_candle_storage()
+        self.assertEqual(storage.manifest("SBER").days, storage._scan_manifest("SBER").days)
+        self.assertEqual(storage.manifest("SBER").days[day][0], 4)
+        with mock.patch.object(type(storage), "_load", side_effect=AssertionError("partition read")):
+            self.assertEqual(
+                storage.days_present("SBER", date(2026, 5, 4), date(2026, 5, 8)),
+                {date(2026, 5, 4), date(2026, 5, 6)},
+            )
+            self.assertEqual(storage.last_datetime("SBER"), datetime(2026, 5, 6, 10, 0))
+
+    def test_live_tick_leaves_manifest_until_new_day(self):
+        from unittest import mock
+        from instruments import candle_storage
+        from instruments.candles import save_candles_to_csv
+        storage = candle_storage.get_candle_storage()
+        day = date(2026, 5, 4)
+        save_candles_to_csv("SBER", _candles(day, ["10:00:00"]))
+
+        def manifest_writes():
+            return [c for c in atomic.call_args_list if c.args[0] == storage._manifest_path("SBER")]
+
+        with mock.patch.object(candle_storage, "_atomic_write", wraps=candle_storage._atomic_write) as atomic:
+            save_candles_to_csv("SBER", _candles(day, ["10:01:00"]))
+            save_candles_to_csv("SBER", _candles(day, ["10:02:00"]))
+            self.assertEqual(manifest_writes(), [])
+            self.assertEqual(storage.last_datetime("SBER"), datetime(2026, 5, 4, 10, 2))
+            save_candles_to_csv("SBER", _candles(date(2026, 5, 5), ["10:00:00"]))
+            self.assertEqual(len(manifest_writes()), 1)
+
+        storage.compact("SBER")
+        self.assertEqual(storage.manifest("SBER").days, storage._scan_manifest("SBER").days)
+        self.assertEqual(storage.manifest("SBER").days[day][0], 3)
+
+    def test_missing_manifest_rebuilt_from_partitions(self):
+        from instruments.candle_storage import get_candle_storage
+        from instruments.candles import save_candles_to_csv
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 4), ["10:00:00"]))
+        storage = get_candle_storage()
+        storage._manifest_path("SBER").unlink()
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 5), ["10:00:00"]))
+        self.assertEqual(
+            storage.days_present("SBER", date(2026, 5, 4), date(2026, 5, 5)),
+            {date(2026, 5, 4), date(2026, 5, 5)},
+        )
+
+    def test_native_daily_history_read_and_kept_by_rebuild(self):
+        from instruments.candle_storage import get_candle_storage
+        from instruments.candles import read_candle_records, save_candles_to_csv
+        # Дневки из API (время бара — начало сессии) и минуты за последний день.
+        native = [
+            {"datetime": f"2016-03-0{d} 10:00:00", "open": 1, "high": 2, "low": 0.5,
+             "close": float(d), "volume": 100, "value": 0}
+            for d in (1, 2, 3)
+        ]
+        save_candles_to_csv("SBER", native, interval=1440)
+        storage = get_candle_storage()
+        self.assertTrue(storage.rollups_ready("SBER"))
+        self.assertEqual(storage.native_spans("SBER"), {1440: (date(2016, 3, 1), date(2016, 3, 3))})
+
+        save_candles_to_csv("SBER", _candles(date(2016, 3, 3), ["10:00:00", "10:01:00"], close=50.0))
+        daily = read_candle_records("SBER", date(2016, 3, 1), date(2016, 3, 3), 1440)
+        self.assertEqual(daily["ts"].tolist(), [
+            int((datetime(2016, 3, d) - datetime(1970, 1, 1)).total_seconds()) for d in (1, 2, 3)
+        ])
+        self.assertEqual(daily["close"].tolist(), [1.0, 2.0, 50.0])
+
+        storage.rebuild_rollups("SBER")
+        rebuilt = read_candle_records("SBER", date(2016, 3, 1), date(2016, 3, 3), 1440)
+        self.assertEqual(rebuilt["close"].tolist(), [1.0, 2.0, 50.0])
+        self.assertEqual(storage.native_spans("SBER"), {1440: (date(2016, 3, 1), date(2016, 3, 3))})
+
+    def test_native_interval_must_be_rollup(self):
+        from instruments.candles import save_candles_to_csv
+        with self.assertRaises(ValueError):
+            save_candles_to_csv("SBER", _candles(date(2026, 5, 4), ["10:00:00"]), interval=7)
+
+    def test_empty_range(self):
+        from instruments.candles import read_candles
+        df = read_candles("SBER", date(2026, 5, 4), date(2026, 5, 8))
+        self.assertTrue(df.empty)
+
+
+class CsvCandleStorageTests(_StorageTestMixin, SimpleTestCase):
+    backend = "csv"
+
+    def test_layout_is_daily_csv(self):
+        from instruments.candles import save_candles_to_csv
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 4), ["10:00:00"]))
+        self.assertTrue((self.root / "SBER" / "2026" / "05" / "04.csv").exists())
+
+    def test_truncated_last_line_skipped_and_appended_after(self):
+        from instruments.candles import read_candles, save_candles_to_csv
+        day = date(2026, 5, 4)
+        save_candles_to_csv("SBER", _candles(day, ["10:00:00"]))
+        with open(self.root / "SBER" / "2026" / "05" / "04.csv", "ab") as fh:
+            fh.write(b"2026-05-04 10:01:00,100.0,10")
+        self.assertEqual(len(read_candles("SBER", day, day)), 1)
+        save_candles_to_csv("SBER", _candles(day, ["10:02:00"]))
+        df = read_candles("SBER", day, day)
+        self.assertEqual(df["datetime"].dt.strftime("%H:%M").tolist(), ["10:00", "10:02"])
+
+    def test_midnight_only_chunk_appended_keeps_rows(self):
+        from instruments.candles import read_candle_records, save_candles_to_csv
+        # Дозапись из одних полуночных баров не должна терять строки файла.
+        save_candles_to_csv("SBER", _candles(date(2026, 2, 2), ["20:00:00"]), interval=240)
+        save_candles_to_csv("SBER", _candles(date(2026, 2, 3), ["00:00:00"]), interval=240)
+        bars = read_candle_records("SBER", date(2026, 2, 2), date(2026, 2, 3), interval=240)
+        self.assertEqual(len(bars), 2)
+
+        day = date(2026, 2, 4)
+        save_candles_to_csv("SBER", _candles(day, ["00:00:00"]))
+        save_candles_to_csv("SBER", _candles(day, ["00:01:00"]))
+        self.assertEqual(len(read_candle_records("SBER", day, day)), 2)
+        text = (self.root / "SBER" / "2026" / "02" / "04.csv").read_text()
+        self.assertIn("2026-02-04 00:00:00,", text)
+
+
+class BinaryCandleStorageTests(_StorageTestMixin, SimpleTestCase):
+    backend = "binary"
+
+    def test_layout_is_monthly_binary(self):
+        from instruments.candle_storage import CANDLE_DTYPE
+        from instruments.candles import save_candles_to_csv
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 4), ["10:00:00"]))
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 5), ["10:00:00"]))
+        path = self.root / "SBER" / "2026" / "05.bin"
+        self.assertEqual(path.stat().st_size, 2 * CANDLE_DTYPE.itemsize)
+
+    def test_single_month_read_is_memmap_view(self):
+        import numpy as np
+        from instruments.candles import read_candle_records, save_candles_to_csv
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 4), ["10:00:00"]))
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 5), ["10:00:00", "10:01:00"]))
+        records = read_candle_records("SBER", date(2026, 5, 5), date(2026, 5, 5))
+        self.assertEqual(len(records), 2)
+        self.assertIsInstance(records.base, np.memmap)
+        self.assertFalse(records.flags.writeable)
+
+    def test_trailing_partial_record_ignored(self):
+        from instruments.candles import read_candle_records, save_candles_to_csv
+        save_candles_to_csv("SBER", _candles(date(2026, 5, 4), ["10:00:00"]))
+        with open(self.root / "SBER" / "2026" / "05.bin", "ab") as fh:
+            fh.write(b"\x00" * 10)
+        records = read_candle_records("SBER", date(2026, 5, 4), date(2026, 5, 4))
+        self.assertEqual(len(records), 1)
+
+
+class ConvertCandlesStorageCommandTests(SimpleTestCase):
+    def setUp(self):
+        self.root = Path(f"_convert_{self._testMethodName}_tmp").resolve()
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.root.mkdir(parents=True)
+        self.addCleanup(lambda: shutil.rmtree(self.root, ignore_errors=True))
+
+    def test_csv_tree_converted_to_binary(self):
+        from io import StringIO
+        from instruments.candle_storage import get_candle_storage
+        from instruments.candles import save_candles_to_csv
+        with override_settings(CANDLES_ROOT=str(self.root), CANDLES_STORAGE_BACKEND="csv"):
+            save_candles_to_csv("SBER", _candles(date(2026, 4, 30), ["10:00:00"]))
+            save_candles_to_csv("SBER", _candles(date(2026, 5, 4), ["10:00:00", "10:01:00"]))
+            call_command("convert_candles_storage", stdout=StringIO())
+            binary = get_candle_storage("binary")
+            records = binary.read("SBER", date(2026, 4, 1), date(2026, 5, 31))
+        self.assertEqual(len(records), 3)
+        self.assertTrue((self.root / "SBER" / "2026" / "04.bin").exists())
+        self.assertTrue((self.root / "SBER" / "2026" / "05.bin").exists())
@@ -1,6 +1,7 @@
 from datetime import date, datetime
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 from django.test import TestCase, override_settings
 
@@ -115,6 +116,21 @@ class FindMissingRangesTests(TestCase):
         self.assertEqual(tail[0].from_date, date(2026, 5, 22))
         self.assertEqual(tail[0].till_date, date(2026, 5, 25))
 
+    def test_no_tail_on_weekend_after_last_session(self):
+        from datetime import date as _date
+        from unittest.mock import patch
+        from instruments import candles_gaps
+
+        # Пятница сохранена до конца сессии, сегодня воскресенье.
+        _write_csv(self.root, "SBER", _date(2026, 5, 22), ["23:49:00"])
+        with override_settings(CANDLES_ROOT=str(self.root)), \
+             patch("instruments.candles_gaps.date") as mock_date:
+            mock_date.today.return_value = _date(2026, 5, 24)
+            mock_date.side_effect = lambda *a, **kw: _date(*a, **kw)
+            candles_gaps._last_saved_cache_clear()
+            ranges = candles_gaps.find_missing_ranges("SBER", start=_date(2026, 5, 22))
+        self.assertEqual(ranges, [])
+
     def test_no_gap_when_historical_range_fully_covered(self):
         from instruments import candles_gaps
         _write_csv(self.root, "SBER", date(2026, 5, 4), ["23:49:00"])
@@ -148,3 +164,70 @@ class FindMissingRangesTests(TestCase):
         self.assertEqual(len(tail), 1)
         self.assertEqual(tail[0].from_date, fake_today)
         self.assertEqual(tail[0].till_date, fake_today)
+
+
+class PlanMissingRangesTests(TestCase):
+    def setUp(self):
+        self.root = Path(f"_plan_{self._testMethodName}_tmp").resolve()
+        if self.root.exists():
+            import shutil
+            shutil.rmtree(self.root)
+        self.root.mkdir(parents=True)
+        self.addCleanup(lambda: __import__("shutil").rmtree(self.root, ignore_errors=True))
+
+    def test_plan_matches_per_ticker_ranges_and_skips_complete(self):
+        from instruments import candles_gaps
+        for d in (date(2026, 5, 4), date(2026, 5, 5), date(2026, 5, 8)):
+            _write_csv(self.root, "SBER", d, ["23:49:00"])
+        for d in (date(2026, 5, 4), date(2026, 5, 5), date(2026, 5, 6), date(2026, 5, 7), date(2026, 5, 8)):
+            _write_csv(self.root, "GAZP", d, ["23:49:00"])
+        with override_settings(CANDLES_ROOT=str(self.root)):
+            plan = candles_gaps.plan_missing_ranges(
+                ["sber", "GAZP", "LKOH"], start=date(2026, 5, 4), end=date(2026, 5, 8),
+            )
+            single = candles_gaps.find_missing_ranges("SBER", start=date(2026, 5, 4), end=date(2026, 5, 8))
+        self.assertEqual(sorted(plan), ["LKOH", "SBER"])
+        self.assertEqual(plan["SBER"], single)
+        self.assertEqual(
+            [(r.from_date, r.till_date) for r in plan["LKOH"]],
+            [(date(2026, 5, 4), date(2026, 5, 8))],
+        )
+
+
+class TradingCalendarGapsTests(TestCase):
+    def setUp(self):
+        self.root = Path(f"_calendar_gaps_{self._testMethodName}_tmp").resolve()
+        if self.root.exists():
+            import shutil
+            shutil.rmtree(self.root)
+        self.root.mkdir(parents=True)
+        self.addCleanup(lambda: __import__("shutil").rmtree(self.root, ignore_errors=True))
+
+    def test_holidays_and_confirmed_empty_days_are_not_gaps(self):
+        from instruments import candles_gaps
+        from instruments.models import EmptyCandleDay, TradingCalendarDay
+        TradingCalendarDay.objects.create(date=date(2026, 5, 11), is_trading=False)
+        EmptyCandleDay.objects.create(ticker="SBER", date=date(2026, 5, 13))
+        for d in (date(2026, 5, 8), date(2026, 5, 15)):
+            _write_csv(self.root, "SBER", d, ["23:49:00"])
+        with override_settings(CANDLES_ROOT=str(self.root)):
+            ranges = candles_gaps.find_missing_ranges("SBER", start=date(2026, 5, 8), end=date(2026, 5, 15))
+        self.assertEqual(
+            [(r.from_date, r.till_date) for r in ranges],
+            [(date(2026, 5, 12), date(2026, 5, 12)), (date(2026, 5, 14), date(2026, 5, 14))],
+        )
+
+    def test_mark_empty_days_skips_fetched_days_and_today(self):
+        from unittest.mock import patch
+        from instruments import candles_gaps
+        from instruments.candle_storage import CANDLE_DTYPE, day_to_ts
+        from instruments.models import EmptyCandleDay
+        records = np.zeros(1, dtype=CANDLE_DTYPE)
+        records["ts"] = day_to_ts(date(2026, 5, 12)) + 10 * 3600
+        with patch("instruments.candles_gaps.date") as mock_date:
+            mock_date.today.return_value = date(2026, 5, 14)
+            candles_gaps.mark_empty_days("sber", date(2026, 5, 11), date(2026, 5, 14), records)
+        self.assertEqual(
+            list(EmptyCandleDay.objects.values_list("ticker", "date")),
+            [("SBER", date(2026, 5, 11)), ("SBER", date(2026, 5, 13))],
+        )
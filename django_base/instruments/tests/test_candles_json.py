@@ -0,0 +1,122 @@
+import pandas as pd
+from django.test import SimpleTestCase
+
+
+def _frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "datetime": pd.to_datetime(["2026-05-04 10:00:00", "2026-05-04 10:01:00"]),
+        "open": [100, 100.5],
+        "high": [101.25, 101.0],
+        "low": [99.0, 100.0],
+        "close": [100.5, 100.75],
+        "volume": [10.0, 7],
+        "value": [1000, 700],
+    })
+
+
+class CandlesToJsonTests(SimpleTestCase):
+    def test_rows_match_lightweight_charts_format(self):
+        from instruments.candles import candles_to_json
+        self.assertEqual(candles_to_json(_frame()), [
+            {"time": 1777888800, "open": 100.0, "high": 101.25, "low": 99.0, "close": 100.5, "volume": 10},
+            {"time": 1777888860, "open": 100.5, "high": 101.0, "low": 100.0, "close": 100.75, "volume": 7},
+        ])
+
+    def test_value_types(self):
+        from instruments.candles import candles_to_json
+        row = candles_to_json(_frame())[0]
+        self.assertIs(type(row["time"]), int)
+        self.assertIs(type(row["open"]), float)
+        self.assertIs(type(row["volume"]), int)
+
+    def test_columns_match_rows(self):
+        from instruments.candles import candles_to_columns, candles_to_json
+        df = _frame()
+        rows = candles_to_json(df)
+        cols = candles_to_columns(df)
+        for field in ("time", "open", "high", "low", "close", "volume"):
+            self.assertEqual(cols[field], [r[field] for r in rows])
+
+    def test_tz_aware_datetime_uses_wall_time(self):
+        from instruments.candles import candles_to_json
+        df = _frame()
+        df["datetime"] = df["datetime"].dt.tz_localize("Europe/Moscow")
+        self.assertEqual(candles_to_json(df)[0]["time"], 1777888800)
+
+    def test_empty(self):
+        from instruments.candles import candles_to_columns, candles_to_json
+        empty = pd.DataFrame(columns=["datetime", "open", "high", "low", "close", "volume", "value"])
+        self.assertEqual(candles_to_json(empty), [])
+        self.assertEqual(candles_to_columns(empty)["time"], [])
+
+
+class CandleStreamTests(SimpleTestCase):
+    META = {"ticker": "SBER", "interval": 1, "from": "2026-05-04", "till": "2026-05-04"}
+
+    def _records(self):
+        from instruments.candle_storage import frame_to_records
+        return frame_to_records(_frame())
+
+    def _decode(self, chunks) -> dict:
+        import json
+        return json.loads(b"".join(chunks))
+
+    def test_rows_stream_matches_candles_to_json(self):
+        from instruments.candle_stream import iter_candles_json
+        from instruments.candles import candles_to_json
+        payload = self._decode(iter_candles_json(self.META, self._records(), chunk_bars=1))
+        self.assertEqual(payload["candles"], candles_to_json(_frame()))
+        self.assertEqual(payload["count"], 2)
+        self.assertEqual(payload["ticker"], "SBER")
+
+    def test_columns_stream_matches_candles_to_columns(self):
+        from instruments.candle_stream import iter_candles_json
+        from instruments.candles import candles_to_columns
+        payload = self._decode(
+            iter_candles_json(self.META, self._records(), layout="columns", chunk_bars=1),
+        )
+        self.assertEqual(payload["candles"], candles_to_columns(_frame()))
+        self.assertEqual(payload["layout"], "columns")
+
+    def test_empty_stream(self):
+        from instruments.candle_storage import empty_records
+        from instruments.candle_stream import iter_candles_json
+        for layout in ("rows", "columns"):
+            payload = self._decode(iter_candles_json(self.META, empty_records(), layout=layout))
+            self.assertEqual(payload["count"], 0)
+            self.assertFalse(payload["candles"] if layout == "rows" else payload["candles"]["time"])
+
+    def test_gzip_stream_roundtrip(self):
+        import gzip
+        from instruments.candle_stream import compress_stream, iter_candles_json
+        chunks = list(iter_candles_json(self.META, self._records(), chunk_bars=1))
+        compressed = b"".join(compress_stream(iter(chunks), "gzip"))
+        self.assertEqual(gzip.decompress(compressed), b"".join(chunks))
+
+    def test_negotiate_encoding(self):
+        from unittest import mock
+        from instruments import candle_stream
+        with mock.patch.object(candle_stream, "brotli", None):
+            self.assertEqual(candle_stream.negotiate_encoding("gzip, deflate, br"), "gzip")
+        self.assertEqual(candle_stream.negotiate_encoding("gzip;q=0, identity"), None)
+        self.assertEqual(candle_stream.negotiate_encoding(""), None)
+
+
+class CandleBinaryFormatTests(SimpleTestCase):
+    def test_pack_roundtrip_matches_columns(self):
+        from instruments.candle_storage import frame_to_records
+        from instruments.candles import candles_to_columns
+        from instruments.renderers import pack_candles, unpack_candles
+        payload = pack_candles(frame_to_records(_frame()), 5)
+        self.assertEqual(len(payload), 16 + 6 * 8 * 2)
+        interval, columns = unpack_candles(payload)
+        self.assertEqual(interval, 5)
+        expected = candles_to_columns(_frame())
+        for field, values in columns.items():
+            self.assertEqual(values.tolist(), expected[field])
+
+    def test_renderer_falls_back_to_json_for_errors(self):
+        from instruments.renderers import CandleBinaryRenderer
+        renderer = CandleBinaryRenderer()
+        self.assertEqual(renderer.render(b"CNDL"), b"CNDL")
+        self.assertEqual(renderer.render({"detail": "x"}), b'{"detail":"x"}')
@@ -1,8 +1,10 @@
 import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
 
 from channels.testing import WebsocketCommunicator
 from django.contrib.auth import get_user_model
-from django.test import TransactionTestCase, override_settings
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
 
 
 def _build_app():
@@ -89,3 +91,75 @@ class CandleSyncConsumerTests(TransactionTestCase):
         received = _run(flow())
         self.assertEqual(received["type"], "sync.progress")
         self.assertEqual(received["task_id"], "t1")
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
+class CandleStreamConsumerTests(SimpleTestCase):
+    async def _connect(self, user):
+        from instruments.consumers import CandleStreamConsumer
+        comm = WebsocketCommunicator(CandleStreamConsumer.as_asgi(), "/ws/candles/")
+        comm.scope["user"] = user
+        connected, code = await comm.connect()
+        return comm, connected, code
+
+    def test_anonymous_closed_4403(self):
+        from django.contrib.auth.models import AnonymousUser
+
+        async def flow():
+            _, connected, code = await self._connect(AnonymousUser())
+            return connected, code
+
+        self.assertEqual(_run(flow()), (False, 4403))
+
+    def test_subscribe_several_tickers_and_receive_bars(self):
+        from channels.layers import get_channel_layer
+        from instruments.candle_feed import live_group
+
+        user = SimpleNamespace(is_authenticated=True)
+        bar = {"type": "candle.bar", "ticker": "SBER", "candle": {"time": 1, "close": 100.0}}
+
+        async def flow():
+            comm, connected, _ = await self._connect(user)
+            assert connected, "should connect"
+            await comm.send_json_to({"action": "subscribe", "tickers": ["sber", "GAZP", "ZZZZ"]})
+            subscribed = await comm.receive_json_from()
+
+            layer = get_channel_layer()
+            await layer.group_send(live_group("SBER"), bar)
+            received = await comm.receive_json_from()
+
+            await comm.send_json_to({"action": "unsubscribe", "tickers": ["SBER"]})
+            unsubscribed = await comm.receive_json_from()
+            await layer.group_send(live_group("SBER"), bar)
+            silent = await comm.receive_nothing()
+
+            await comm.send_json_to({"action": "subscribe", "tickers": "SBER"})
+            error = await comm.receive_json_from()
+            await comm.disconnect()
+            return subscribed, received, unsubscribed, silent, error
+
+        with patch("instruments.consumers._active_tickers", side_effect=lambda t: t & {"SBER", "GAZP"}):
+            subscribed, received, unsubscribed, silent, error = _run(flow())
+
+        self.assertEqual(subscribed, {"type": "candle.subscribed", "tickers": ["GAZP", "SBER"], "unknown": ["ZZZZ"]})
+        self.assertEqual(received, bar)
+        self.assertEqual(unsubscribed["tickers"], ["GAZP"])
+        self.assertTrue(silent)
+        self.assertEqual(error, {"type": "candle.error", "message": "bad_request"})
+
+    def test_too_many_tickers(self):
+        from instruments.consumers import CandleStreamConsumer
+        user = SimpleNamespace(is_authenticated=True)
+        tickers = [f"T{i}" for i in range(CandleStreamConsumer.MAX_TICKERS + 1)]
+
+        async def flow():
+            comm, _, _ = await self._connect(user)
+            await comm.send_json_to({"action": "subscribe", "tickers": tickers})
+            reply = await comm.receive_json_from()
+            await comm.disconnect()
+            return reply
+
+        with patch("instruments.consumers._active_tickers", side_effect=lambda t: t):
+            self.assertEqual(_run(flow())["message"], "too_many_tickers")
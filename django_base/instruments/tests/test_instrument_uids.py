@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class ResolveAllInstrumentUidsTests(TestCase):
+    def setUp(self):
+        from instruments.models import Futures, Instrument
+        cache.clear()
+        self.sber = Instrument.objects.create(
+            ticker="SBER", name="Sber", instrument_type="STOCK", is_active=True, min_price_step="0.01",
+        )
+        self.gazp = Instrument.objects.create(
+            ticker="GAZP", name="Gazprom", instrument_type="STOCK", is_active=True,
+            min_price_step="0.01", tinkoff_uid="uid-gazp",
+        )
+        Instrument.objects.create(
+            ticker="ZZZZ", name="Gone", instrument_type="STOCK", is_active=True, min_price_step="0.01",
+        )
+        self.si = Futures.objects.create(ticker="SIU5", name="Si", secid="SiU5", is_active=True, base_asset=self.sber)
+
+    def _resolve(self):
+        from instruments.tinkoff_candles import resolve_all_instrument_uids
+        share_uids = {"SBER": "uid-sber", "GAZP": "uid-gazp"}
+        future_uids = {"SIU5": "uid-si"}
+        with patch("instruments.tinkoff_candles.fetch_instrument_uids", return_value=(share_uids, future_uids)):
+            return resolve_all_instrument_uids("token")
+
+    def test_bulk_update_and_cache_warmup(self):
+        from instruments.tinkoff_candles import resolve_instrument_uid
+        result = self._resolve()
+        self.assertEqual(result, {"stocks": 1, "futures": 1, "missing": 1})
+
+        self.sber.refresh_from_db()
+        self.si.refresh_from_db()
+        self.assertEqual(self.sber.tinkoff_uid, "uid-sber")
+        self.assertEqual(self.si.tinkoff_uid, "uid-si")
+
+        with patch("instruments.tinkoff_candles._fetch_uid_from_api") as api_mock, self.assertNumQueries(0):
+            self.assertEqual(resolve_instrument_uid("token", "SBER"), "uid-sber")
+            self.assertEqual(resolve_instrument_uid("token", "SiU5", "FUTURES"), "uid-si")
+        api_mock.assert_not_called()
+
+    def test_second_run_writes_nothing(self):
+        self._resolve()
+        self.assertEqual(self._resolve(), {"stocks": 0, "futures": 0, "missing": 1})
+
+    def test_futures_uid_found_in_db_by_secid(self):
+        from instruments.tinkoff_candles import resolve_instrument_uid
+        from instruments.models import Futures
+        Futures.objects.filter(pk=self.si.pk).update(tinkoff_uid="uid-si")
+        with patch("instruments.tinkoff_candles._fetch_uid_from_api") as api_mock:
+            self.assertEqual(resolve_instrument_uid("token", "SiU5", "FUTURES"), "uid-si")
+        api_mock.assert_not_called()
+
+
+class FetchInstrumentUidsTests(TestCase):
+    def test_filters_by_class_code(self):
+        from instruments import tinkoff_candles
+        services = MagicMock()
+        services.instruments.shares.return_value = SimpleNamespace(instruments=[
+            SimpleNamespace(ticker="SBER", uid="uid-sber", class_code="TQBR"),
+            SimpleNamespace(ticker="SBER", uid="uid-spb", class_code="SPBXM"),
+        ])
+        services.instruments.futures.return_value = SimpleNamespace(instruments=[
+            SimpleNamespace(ticker="SiU5", uid="uid-si", class_code="SPBFUT"),
+        ])
+        client = MagicMock()
+        client.__enter__.return_value = services
+        limiter = MagicMock()
+        with patch.object(tinkoff_candles, "tinkoff_client", return_value=client), \
+             patch.object(tinkoff_candles, "get_rate_limiter", return_value=limiter):
+            shares, futures = tinkoff_candles.fetch_instrument_uids("token")
+        self.assertEqual(shares, {"SBER": "uid-sber"})
+        self.assertEqual(futures, {"SIU5": "uid-si"})
+        self.assertEqual(limiter.acquire.call_count, 2)
@@ -44,7 +44,9 @@ class UpdateTodayCandlesWrapperTests(TestCase):
             base_asset=base,
         )
 
-        with patch.object(tasks.sync_candles_for_instrument, "apply_async") as apply_mock:
+        gap = [MagicMock()]
+        with patch.object(tasks, "plan_missing_ranges", return_value={"SBER": gap, "SIU5": gap}), \
+             patch.object(tasks.sync_candles_for_instrument, "apply_async") as apply_mock:
             tasks.update_today_candles.run()
         called_tickers = sorted([c.kwargs["kwargs"]["ticker"] for c in apply_mock.call_args_list])
         self.assertIn("SBER", called_tickers)
@@ -53,3 +55,32 @@ class UpdateTodayCandlesWrapperTests(TestCase):
         for c in apply_mock.call_args_list:
             self.assertEqual(c.kwargs["kwargs"]["start"], today_iso)
             self.assertEqual(c.kwargs["kwargs"]["end"], today_iso)
+
+    def test_tickers_without_gaps_not_enqueued(self):
+        from instruments import tasks
+        from instruments.candles_gaps import SyncTarget
+
+        targets = [SyncTarget("SBER", "SBER", "stock"), SyncTarget("GAZP", "GAZP", "stock")]
+        with patch.object(tasks, "active_sync_targets", return_value=targets), \
+             patch.object(tasks, "plan_missing_ranges", return_value={"GAZP": [MagicMock()]}) as plan_mock, \
+             patch.object(tasks.sync_candles_for_instrument, "apply_async") as apply_mock:
+            result = tasks.update_today_candles.run()
+        self.assertEqual(plan_mock.call_args.args[0], ["SBER", "GAZP"])
+        self.assertEqual([c.kwargs["kwargs"]["ticker"] for c in apply_mock.call_args_list], ["GAZP"])
+        self.assertEqual(result["skipped"], 1)
+
+    def test_live_stream_tickers_skipped_unless_forced(self):
+        from instruments import tasks
+        from instruments.candles_gaps import SyncTarget
+
+        targets = [SyncTarget("SBER", "SBER", "stock"), SyncTarget("GAZP", "GAZP", "stock")]
+        with patch.object(tasks, "active_sync_targets", return_value=targets), \
+             patch.object(tasks, "live_tickers", return_value={"SBER"}), \
+             patch.object(tasks, "plan_missing_ranges", return_value={}) as plan_mock, \
+             patch.object(tasks.sync_candles_for_instrument, "apply_async"):
+            result = tasks.update_today_candles.run()
+            self.assertEqual(plan_mock.call_args.args[0], ["GAZP"])
+            self.assertEqual(result["live"], 1)
+
+            tasks.update_today_candles.run(force=True)
+            self.assertEqual(plan_mock.call_args.args[0], ["SBER", "GAZP"])
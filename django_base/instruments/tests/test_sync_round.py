@@ -0,0 +1,109 @@
+from datetime import date
+from unittest.mock import patch
+
+import numpy as np
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from instruments.candle_storage import CANDLE_DTYPE
+from instruments.candles_gaps import GapRange, SyncTarget
+from instruments.tinkoff_candles import CandleChunk
+
+TARGETS = [
+    SyncTarget("SBER", "SBER", "stock"),
+    SyncTarget("GAZP", "GAZP", "stock"),
+    SyncTarget("SIU5", "SiU5", "futures"),
+]
+CHUNK = CandleChunk(date(2026, 5, 4), date(2026, 5, 4), np.zeros(1, dtype=CANDLE_DTYPE))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class SyncCandlesRoundTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _run(self, plan, *, fetch=None, clock=None, live=(), resolve=None):
+        from instruments import tasks
+        with patch.object(tasks, "_get_admin_token", return_value="token") as token_mock, \
+             patch.object(tasks, "active_sync_targets", return_value=TARGETS), \
+             patch.object(tasks, "live_tickers", return_value=set(live)), \
+             patch.object(tasks, "plan_missing_ranges", return_value=plan), \
+             patch.object(tasks, "resolve_instrument_uid", side_effect=resolve or (lambda t, ticker, kind: f"uid-{ticker}")), \
+             patch.object(tasks, "iter_tinkoff_candles", side_effect=fetch or (lambda *a, **kw: iter([CHUNK]))) as fetch_mock, \
+             patch.object(tasks, "save_candle_records", return_value=1), \
+             patch.object(tasks, "mark_empty_days"), \
+             patch.object(tasks, "time") as time_mock:
+            time_mock.monotonic.side_effect = clock or (lambda: 0.0)
+            result = tasks.sync_candles_round.run()
+        return result, fetch_mock, token_mock
+
+    def _gap(self):
+        today = date.today()
+        return [GapRange(today, today, "tail")]
+
+    def test_round_syncs_pending_tickers_with_shared_token(self):
+        plan = {"SBER": self._gap(), "SIU5": self._gap()}
+        result, fetch_mock, token_mock = self._run(plan)
+        self.assertEqual([c.args[1] for c in fetch_mock.call_args_list], ["uid-SBER", "uid-SiU5"])
+        token_mock.assert_called_once()
+        self.assertEqual(result["pending"], 2)
+        self.assertEqual(result["synced"], 2)
+        self.assertEqual(result["backlog"], 0)
+        self.assertEqual(result["candles"], 2)
+        from instruments.tasks import ROUND_STATS_KEY
+        self.assertEqual(cache.get(ROUND_STATS_KEY), result)
+
+    @override_settings(CANDLES_SYNC_ROUND_BUDGET=10)
+    def test_budget_leaves_backlog_for_next_round(self):
+        plan = {t.ticker: self._gap() for t in TARGETS}
+        ticks = iter([0.0, 0.0, 5.0, 11.0, 11.0, 11.0])
+        result, fetch_mock, _ = self._run(plan, clock=lambda: next(ticks))
+        self.assertEqual(result["synced"], 2)
+        self.assertEqual(result["backlog"], 1)
+
+        result, fetch_mock, _ = self._run(plan)
+        self.assertEqual(fetch_mock.call_args_list[0].args[1], "uid-SiU5")
+        self.assertEqual(result["backlog"], 0)
+
+    def test_tick_skipped_while_previous_round_runs(self):
+        from instruments import tasks
+        cache.add(tasks._ROUND_LOCK_KEY, "other-task")
+        result, fetch_mock, _ = self._run({"SBER": self._gap()})
+        self.assertEqual(result, {"status": "skipped"})
+        fetch_mock.assert_not_called()
+
+    def test_failed_ticker_counted_and_lock_released(self):
+        from instruments import tasks
+        plan = {"SBER": self._gap(), "GAZP": self._gap()}
+
+        def fetch(token, uid, frm, till, interval):
+            if uid == "uid-SBER":
+                raise RuntimeError("boom")
+            return iter([CHUNK])
+
+        result, _, _ = self._run(plan, fetch=fetch, live={"SIU5"})
+        self.assertEqual(result["errors"], 1)
+        self.assertEqual(result["candles"], 1)
+        self.assertEqual(result["live"], 1)
+        self.assertIsNone(cache.get(tasks._ROUND_LOCK_KEY))
+
+    def test_manually_locked_ticker_left_in_backlog(self):
+        from instruments import tasks
+        plan = {"SBER": self._gap(), "GAZP": self._gap()}
+        cache.set(tasks._lock_key("SBER"), "manual-task")
+        result, fetch_mock, _ = self._run(plan)
+        self.assertEqual([c.args[1] for c in fetch_mock.call_args_list], ["uid-GAZP"])
+        self.assertEqual(result["synced"], 1)
+        self.assertEqual(result["locked"], 1)
+        self.assertEqual(result["backlog"], 1)
+
+    def test_unresolved_uid_not_counted_as_synced(self):
+        plan = {"SBER": self._gap(), "GAZP": self._gap()}
+        result, fetch_mock, _ = self._run(
+            plan, resolve=lambda t, ticker, kind: None if ticker == "SBER" else f"uid-{ticker}",
+        )
+        self.assertEqual([c.args[1] for c in fetch_mock.call_args_list], ["uid-GAZP"])
+        self.assertEqual(result["synced"], 1)
+        self.assertEqual(result["unresolved"], 1)
+        self.assertEqual(result["errors"], 1)
+        self.assertEqual(result["backlog"], 0)
@@ -1,10 +1,19 @@
-from datetime import date
+from datetime import date, timedelta
 from unittest.mock import patch, MagicMock
 
+import numpy as np
 from channels.layers import get_channel_layer
 from django.test import TestCase, override_settings
 
 
+def _chunk(day: date, bars: int = 1):
+    from instruments.candle_storage import CANDLE_DTYPE, day_to_ts
+    from instruments.tinkoff_candles import CandleChunk
+    records = np.zeros(bars, dtype=CANDLE_DTYPE)
+    records["ts"] = day_to_ts(day) + 10 * 3600 + 60 * np.arange(bars)
+    return CandleChunk(day, day, records)
+
+
 class _AsyncNoop:
     def __await__(self):
         if False:
@@ -24,9 +33,6 @@ class SyncCandlesTaskHappyPathTests(TestCase):
             GapRange(date(2026, 5, 4), date(2026, 5, 4), "missing_days"),
             GapRange(date(2026, 5, 5), date(2026, 5, 5), "tail"),
         ]
-        fake_candles = [
-            {"datetime": "2026-05-04 10:00:00", "open": 100, "high": 101, "low": 99, "close": 100.5, "volume": 10, "value": 0},
-        ]
 
         events: list[dict] = []
         layer = get_channel_layer()
@@ -34,8 +40,8 @@ class SyncCandlesTaskHappyPathTests(TestCase):
         with patch.object(tasks, "_get_admin_token", return_value="fake-token"), \
              patch("instruments.tasks.resolve_instrument_uid", return_value="uid-xyz"), \
              patch("instruments.tasks.find_missing_ranges", return_value=ranges), \
-             patch("instruments.tasks.fetch_tinkoff_candles", return_value=fake_candles), \
-             patch("instruments.tasks.save_candles_to_csv", return_value=1):
+             patch("instruments.tasks.iter_tinkoff_candles", side_effect=lambda token, uid, frm, till, interval: iter([_chunk(frm)])), \
+             patch("instruments.tasks.save_candle_records", return_value=1):
 
             with patch.object(layer, "group_send") as group_send:
                 group_send.side_effect = lambda group, event: events.append(event) or _AsyncNoop()
@@ -98,12 +104,12 @@ class SyncCandlesTaskErrorPathsTests(TestCase):
         def fetch_side_effect(token, uid, frm, till, interval):
             if frm == date(2026, 5, 4):
                 raise RuntimeError("boom")
-            return [{"datetime": "2026-05-05 10:00:00", "open": 1, "high": 1, "low": 1, "close": 1, "volume": 1, "value": 0}]
+            return iter([_chunk(frm)])
         with patch.object(tasks, "_get_admin_token", return_value="t"), \
              patch("instruments.tasks.resolve_instrument_uid", return_value="uid"), \
              patch("instruments.tasks.find_missing_ranges", return_value=ranges), \
-             patch("instruments.tasks.fetch_tinkoff_candles", side_effect=fetch_side_effect), \
-             patch("instruments.tasks.save_candles_to_csv", return_value=1):
+             patch("instruments.tasks.iter_tinkoff_candles", side_effect=fetch_side_effect), \
+             patch("instruments.tasks.save_candle_records", return_value=1):
             events = self._run()
         done = [e for e in events if e["type"] == "sync.done"][0]
         self.assertEqual(done["errors"], 1)
@@ -119,7 +125,61 @@ class SyncCandlesTaskErrorPathsTests(TestCase):
         with patch.object(tasks, "_get_admin_token", return_value="t"), \
              patch("instruments.tasks.resolve_instrument_uid", return_value="uid"), \
              patch("instruments.tasks.find_missing_ranges", return_value=ranges), \
-             patch("instruments.tasks.fetch_tinkoff_candles", side_effect=boom):
+             patch("instruments.tasks.iter_tinkoff_candles", side_effect=boom):
             events = self._run()
         self.assertEqual(events[-1]["type"], "sync.error")
         self.assertEqual(events[-1]["message"], "timeout")
+
+    def test_windows_saved_and_marked_before_failed_window(self):
+        from instruments import tasks
+        from instruments.candles_gaps import GapRange
+        from instruments.tinkoff_candles import CandleFetchError
+        ranges = [GapRange(date(2026, 5, 4), date(2026, 5, 6), "missing_days")]
+        first = _chunk(date(2026, 5, 4), bars=2)
+
+        def fetch(token, uid, frm, till, interval):
+            yield first
+            raise CandleFetchError("unavailable")
+
+        with patch.object(tasks, "_get_admin_token", return_value="t"), \
+             patch("instruments.tasks.resolve_instrument_uid", return_value="uid"), \
+             patch("instruments.tasks.find_missing_ranges", return_value=ranges), \
+             patch("instruments.tasks.iter_tinkoff_candles", side_effect=fetch), \
+             patch("instruments.tasks.save_candle_records", return_value=1) as save_mock, \
+             patch("instruments.tasks.mark_empty_days") as mark_mock:
+            events = self._run()
+        save_mock.assert_called_once_with("SBER", first.records)
+        # Пустые дни помечаются только в полученном окне, упавшее догрузит следующий sync.
+        mark_mock.assert_called_once_with("SBER", date(2026, 5, 4), date(2026, 5, 4), first.records)
+        done = [e for e in events if e["type"] == "sync.done"][0]
+        self.assertEqual(done["errors"], 1)
+        self.assertEqual(done["cumulative_candles"], 2)
+
+
+class FetchAndSaveBroadcastTests(TestCase):
+    def test_new_bars_of_today_published(self):
+        from datetime import datetime
+        from instruments import tasks
+        from instruments.candles_gaps import GapRange
+        today = date.today()
+        chunk = _chunk(today, bars=3)
+        last = datetime(1970, 1, 1) + timedelta(seconds=int(chunk.records["ts"][1]))
+        with patch("instruments.tasks.iter_tinkoff_candles", return_value=iter([chunk])), \
+             patch("instruments.tasks.save_candle_records", return_value=1), \
+             patch("instruments.tasks.last_saved_candle_dt", return_value=last), \
+             patch("instruments.tasks.publish_bars") as publish_mock:
+            count, complete = tasks._fetch_and_save("t", "uid", "SBER", GapRange(today, today, "tail"))
+        self.assertEqual((count, complete), (3, True))
+        ticker, published = publish_mock.call_args.args
+        self.assertEqual(ticker, "SBER")
+        self.assertEqual(published["ts"].tolist(), chunk.records["ts"][1:].tolist())
+
+    def test_past_windows_not_published(self):
+        from instruments import tasks
+        from instruments.candles_gaps import GapRange
+        chunk = _chunk(date(2026, 5, 4))
+        with patch("instruments.tasks.iter_tinkoff_candles", return_value=iter([chunk])), \
+             patch("instruments.tasks.save_candle_records", return_value=1), \
+             patch("instruments.tasks.publish_bars") as publish_mock:
+            tasks._fetch_and_save("t", "uid", "SBER", GapRange(date(2026, 5, 4), date(2026, 5, 4), "missing_days"))
+        publish_mock.assert_not_called()
@@ -0,0 +1,160 @@
+import asyncio
+from datetime import date, datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+
+def _candle(dt: datetime, price: float = 100.0):
+    quotation = SimpleNamespace(units=int(price), nano=0)
+    return SimpleNamespace(time=dt, open=quotation, high=quotation, low=quotation, close=quotation, volume=1)
+
+
+class _RateLimited(Exception):
+    code = SimpleNamespace(name="RESOURCE_EXHAUSTED")
+    metadata = SimpleNamespace(ratelimit_reset=0)
+
+
+class _InvalidArgument(Exception):
+    code = SimpleNamespace(name="INVALID_ARGUMENT")
+
+
+class _FakeMarketData:
+    def __init__(self, fail_days=(), rate_limited_once=(), invalid_days=()):
+        self.fail_days = set(fail_days)
+        self.invalid_days = set(invalid_days)
+        self.rate_limited = set(rate_limited_once)
+        self.calls = []
+        self.in_flight = self.max_in_flight = 0
+
+    async def get_candles(self, instrument_id, from_, to, interval):
+        self.calls.append(from_.date())
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if from_.date() in self.rate_limited:
+                self.rate_limited.discard(from_.date())
+                raise _RateLimited()
+            if from_.date() in self.fail_days:
+                raise ConnectionError("reset by peer")
+            if from_.date() in self.invalid_days:
+                raise _InvalidArgument()
+            return SimpleNamespace(candles=[_candle(from_.replace(hour=7))])
+        finally:
+            self.in_flight -= 1
+
+
+class _FakeAsyncClient:
+    market_data = None
+
+    def __init__(self, token):
+        pass
+
+    async def __aenter__(self):
+        return SimpleNamespace(market_data=self.market_data)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class CandleWindowsTests(SimpleTestCase):
+    def test_windows_within_api_limits(self):
+        from datetime import timedelta
+        from instruments.tinkoff_candles import CANDLE_WINDOWS, INTERVAL_MAP
+        self.assertEqual(set(CANDLE_WINDOWS), set(INTERVAL_MAP))
+        self.assertEqual(CANDLE_WINDOWS[1], timedelta(days=1))
+        self.assertEqual(CANDLE_WINDOWS[5], timedelta(weeks=1))
+        self.assertEqual(CANDLE_WINDOWS[15], timedelta(weeks=3))
+        self.assertEqual(CANDLE_WINDOWS[30], timedelta(weeks=3))
+        self.assertEqual(CANDLE_WINDOWS[60], timedelta(days=90))
+        self.assertEqual(CANDLE_WINDOWS[240], timedelta(days=30))
+        self.assertEqual(CANDLE_WINDOWS[1440], timedelta(days=365))
+
+
+@override_settings(TINKOFF_RATE_LIMITS={"market_data": 60_000}, TINKOFF_CANDLES_CONCURRENCY=3)
+class DownloadCandlesTests(SimpleTestCase):
+    def setUp(self):
+        from instruments import tinkoff_async, tinkoff_ratelimit
+        tinkoff_async._clients.clear()
+        tinkoff_ratelimit._limiters.clear()
+        self.addCleanup(tinkoff_ratelimit._limiters.clear)
+        redis_patch = patch.object(tinkoff_ratelimit, "_redis_connection", return_value=None)
+        redis_patch.start()
+        self.addCleanup(redis_patch.stop)
+
+    def _fetch(self, market_data, from_date, till_date, interval=1, take=None):
+        from instruments import tinkoff_async
+        from instruments.tinkoff_candles import iter_tinkoff_candles
+        client_cls = type("Client", (_FakeAsyncClient,), {"market_data": market_data})
+        chunks = []
+        with patch.object(tinkoff_async, "AsyncClient", client_cls):
+            try:
+                stream = iter_tinkoff_candles("token", "uid", from_date, till_date, interval=interval)
+                for chunk in stream:
+                    chunks.append(chunk)
+                    if len(chunks) == take:
+                        stream.close()
+                        break
+            finally:
+                tinkoff_async._clients.clear()
+        return chunks
+
+    def test_windows_fetched_concurrently_in_order_with_rate_limit_retry(self):
+        from instruments.candle_storage import day_to_ts
+        market_data = _FakeMarketData(rate_limited_once={date(2026, 5, 5)})
+        chunks = self._fetch(market_data, date(2026, 5, 4), date(2026, 5, 10))
+        days = [date(2026, 5, d) for d in range(4, 11)]
+        self.assertEqual([c.from_date for c in chunks], days)
+        self.assertEqual([c.till_date for c in chunks], days)
+        self.assertEqual(
+            [c.records["ts"].tolist() for c in chunks],
+            [[day_to_ts(d) + 10 * 3600] for d in days],
+        )
+        self.assertEqual(market_data.calls.count(date(2026, 5, 5)), 2)
+        self.assertEqual(market_data.max_in_flight, 3)
+
+    def test_daily_interval_uses_year_windows(self):
+        market_data = _FakeMarketData()
+        chunks = self._fetch(market_data, date(2015, 1, 1), date(2024, 12, 31), interval=1440)
+        # 3653 дня окнами по 365 — 11 запросов вместо 3653 суточных.
+        self.assertEqual(len(market_data.calls), 11)
+        self.assertEqual(len(chunks), 11)
+        self.assertEqual((chunks[0].from_date, chunks[0].till_date), (date(2015, 1, 1), date(2015, 12, 31)))
+        self.assertEqual(chunks[-1].till_date, date(2024, 12, 31))
+
+    def _received_until_error(self, market_data, from_date, till_date):
+        from instruments import tinkoff_async
+        from instruments.tinkoff_candles import CandleFetchError, iter_tinkoff_candles
+        client_cls = type("Client", (_FakeAsyncClient,), {"market_data": market_data})
+        received = []
+        with patch.object(tinkoff_async, "AsyncClient", client_cls), self.assertRaises(CandleFetchError):
+            for chunk in iter_tinkoff_candles("token", "uid", from_date, till_date):
+                received.append(chunk.from_date)
+        tinkoff_async._clients.clear()
+        return received
+
+    def test_failed_window_raises_after_other_windows(self):
+        market_data = _FakeMarketData(fail_days={date(2026, 5, 5)})
+        received = self._received_until_error(market_data, date(2026, 5, 4), date(2026, 5, 6))
+        self.assertEqual(received, [date(2026, 5, 4), date(2026, 5, 6)])
+
+    def test_channel_failure_stops_new_windows(self):
+        market_data = _FakeMarketData(fail_days={date(2026, 5, 5)})
+        received = self._received_until_error(market_data, date(2026, 5, 4), date(2026, 5, 20))
+        # Окна 6 и 7 уже были в полёте — дочитаны; новые не запрашивались.
+        self.assertEqual(received, [date(2026, 5, 4), date(2026, 5, 6), date(2026, 5, 7)])
+        self.assertEqual(sorted(market_data.calls), [date(2026, 5, d) for d in range(4, 8)])
+
+    def test_request_level_failure_keeps_fetching(self):
+        market_data = _FakeMarketData(invalid_days={date(2026, 5, 5)})
+        received = self._received_until_error(market_data, date(2026, 5, 4), date(2026, 5, 10))
+        self.assertEqual(received, [date(2026, 5, d) for d in range(4, 11) if d != 5])
+
+    def test_stopped_consumer_cancels_remaining_windows(self):
+        market_data = _FakeMarketData()
+        chunks = self._fetch(market_data, date(2026, 1, 1), date(2026, 3, 31), take=1)
+        self.assertEqual(len(chunks), 1)
+        # Вперёд запрашивается не больше TINKOFF_CANDLES_CONCURRENCY окон.
+        self.assertLessEqual(len(market_data.calls), 4)
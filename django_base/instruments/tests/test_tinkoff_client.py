@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+
+class TinkoffClientPoolTests(SimpleTestCase):
+    def setUp(self):
+        from instruments import tinkoff_candles
+        tinkoff_candles.close_tinkoff_clients()
+        self.addCleanup(tinkoff_candles.close_tinkoff_clients)
+        patcher = patch.object(tinkoff_candles, "Client", side_effect=lambda token: MagicMock(name=token))
+        self.client_cls = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_client_reused_across_calls(self):
+        from instruments.tinkoff_candles import tinkoff_client, validate_token
+        self.assertTrue(validate_token("t1"))
+        with tinkoff_client("t1") as first:
+            pass
+        with tinkoff_client("t1") as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(self.client_cls.call_count, 1)
+        with tinkoff_client("t2"):
+            pass
+        self.assertEqual(self.client_cls.call_count, 2)
+
+    def test_broken_client_discarded_request_errors_keep_it(self):
+        from instruments.tinkoff_candles import tinkoff_client
+        not_found = RuntimeError("not found")
+        not_found.code = SimpleNamespace(name="NOT_FOUND")
+        with self.assertRaises(RuntimeError):
+            with tinkoff_client("t1"):
+                raise not_found
+        self.assertEqual(self.client_cls.call_count, 1)
+
+        with self.assertRaises(ConnectionError):
+            with tinkoff_client("t1"):
+                raise ConnectionError("reset by peer")
+        with tinkoff_client("t1"):
+            pass
+        self.assertEqual(self.client_cls.call_count, 2)
+
+    def test_idle_client_reopened(self):
+        from instruments import tinkoff_candles
+        with tinkoff_candles.tinkoff_client("t1"):
+            pass
+        with patch.object(tinkoff_candles.time, "monotonic", return_value=10 ** 9):
+            with tinkoff_candles.tinkoff_client("t1"):
+                pass
+        self.assertEqual(self.client_cls.call_count, 2)
+
+    def test_pool_forgotten_after_fork(self):
+        from instruments import tinkoff_candles
+        with tinkoff_candles.tinkoff_client("t1"):
+            pass
+        tinkoff_candles._reset_pool_after_fork()
+        with tinkoff_candles.tinkoff_client("t1"):
+            pass
+        self.assertEqual(self.client_cls.call_count, 2)
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, override_settings
+
+
+class LocalRateLimiterTests(SimpleTestCase):
+    def test_rate_and_pause(self):
+        from instruments.tinkoff_ratelimit import LocalRateLimiter
+
+        async def scenario():
+            limiter = LocalRateLimiter(rate_per_minute=6000)  # 100/с, ёмкость 100
+            limiter._tokens = 1.0
+            started = time.monotonic()
+            for _ in range(6):
+                await limiter.acquire_async()
+            paced = time.monotonic() - started
+            limiter.pause(0.1)
+            started = time.monotonic()
+            await limiter.acquire_async()
+            return paced, time.monotonic() - started
+
+        paced, paused = asyncio.run(scenario())
+        self.assertGreaterEqual(paced, 0.045)
+        self.assertGreaterEqual(paused, 0.09)
+
+
+class RedisRateLimiterTests(SimpleTestCase):
+    def _limiter(self, script_results):
+        from instruments.tinkoff_ratelimit import RedisRateLimiter
+        connection = MagicMock()
+        connection.register_script.return_value = MagicMock(side_effect=script_results)
+        return RedisRateLimiter(connection, "tinvest:rl:market_data:abc", 600), connection
+
+    def test_acquire_waits_for_script_delay(self):
+        limiter, connection = self._limiter([250, 0])
+        with patch("instruments.tinkoff_ratelimit.time.sleep") as sleep_mock:
+            limiter.acquire()
+        sleep_mock.assert_called_once_with(0.25)
+        script = connection.register_script.return_value
+        self.assertEqual(
+            script.call_args.kwargs["keys"],
+            ["tinvest:rl:market_data:abc", "tinvest:rl:market_data:abc:pause"],
+        )
+        self.assertEqual(script.call_args.kwargs["args"], [10.0, 10])
+
+    def test_async_acquire_calls_redis_off_the_event_loop(self):
+        import threading
+        limiter, connection = self._limiter([0])
+        threads = []
+        connection.register_script.return_value.side_effect = (
+            lambda **kw: threads.append(threading.current_thread()) or 0
+        )
+
+        async def acquire():
+            await limiter.acquire_async()
+            return threading.current_thread()
+
+        loop_thread = asyncio.run(acquire())
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], loop_thread)
+
+    def test_async_pause_calls_redis_off_the_event_loop(self):
+        import threading
+        limiter, connection = self._limiter([])
+        threads = []
+        connection.set.side_effect = lambda *a, **kw: threads.append(threading.current_thread())
+
+        async def pause():
+            await limiter.pause_async(1.5)
+            return threading.current_thread()
+
+        loop_thread = asyncio.run(pause())
+        connection.set.assert_called_once_with("tinvest:rl:market_data:abc:pause", 1, px=1500)
+        self.assertIsNot(threads[0], loop_thread)
+
+    def test_pause_sets_shared_key(self):
+        limiter, connection = self._limiter([])
+        limiter.pause(1.5)
+        connection.set.assert_called_once_with("tinvest:rl:market_data:abc:pause", 1, px=1500)
+
+    def test_redis_error_falls_back_to_local(self):
+        from redis.exceptions import ConnectionError
+        limiter, _ = self._limiter(ConnectionError("down"))
+        self.assertEqual(limiter.reserve(), 0.0)
+        self.assertEqual(limiter._fallback._tokens, 9.0)
+
+
+@override_settings(TINKOFF_RATE_LIMITS={"market_data": 600, "users": 100})
+class GetRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        from instruments import tinkoff_ratelimit
+        tinkoff_ratelimit._limiters.clear()
+        self.addCleanup(tinkoff_ratelimit._limiters.clear)
+
+    def test_shared_key_hashes_token(self):
+        from instruments import tinkoff_ratelimit
+        connection = MagicMock()
+        with patch.object(tinkoff_ratelimit, "_redis_connection", return_value=connection):
+            limiter = tinkoff_ratelimit.get_rate_limiter("secret-token", "users")
+            self.assertIs(tinkoff_ratelimit.get_rate_limiter("secret-token", "users"), limiter)
+        self.assertIsInstance(limiter, tinkoff_ratelimit.RedisRateLimiter)
+        self.assertTrue(limiter._keys[0].startswith("tinvest:rl:users:"))
+        self.assertNotIn("secret-token", limiter._keys[0])
+        self.assertEqual(limiter.rate, 100 / 60)
+
+    def test_without_redis_uses_local(self):
+        from instruments import tinkoff_ratelimit
+        with patch.object(tinkoff_ratelimit, "_redis_connection", return_value=None):
+            limiter = tinkoff_ratelimit.get_rate_limiter("token", "market_data")
+        self.assertIsInstance(limiter, tinkoff_ratelimit.LocalRateLimiter)
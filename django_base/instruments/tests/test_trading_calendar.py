@@ -0,0 +1,45 @@
+from datetime import date
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase
+
+
+class TradingDaysTests(TestCase):
+    def test_weekdays_minus_holidays_plus_working_weekends(self):
+        from instruments.models import TradingCalendarDay
+        from instruments.trading_calendar import trading_days
+        TradingCalendarDay.objects.create(date=date(2026, 6, 12), is_trading=False, note="День России")
+        TradingCalendarDay.objects.create(date=date(2026, 6, 13), is_trading=True)
+        days = trading_days(date(2026, 6, 10), date(2026, 6, 15)).tolist()
+        self.assertEqual(days, [date(2026, 6, 10), date(2026, 6, 11), date(2026, 6, 13), date(2026, 6, 15)])
+
+    def test_empty_when_start_after_end(self):
+        from instruments.trading_calendar import trading_days
+        self.assertEqual(len(trading_days(date(2026, 6, 15), date(2026, 6, 10))), 0)
+
+
+class LoadTradingCalendarCommandTests(TestCase):
+    def setUp(self):
+        self.path = Path(f"_calendar_{self._testMethodName}.csv").resolve()
+        self.addCleanup(lambda: self.path.unlink(missing_ok=True))
+
+    def test_upserts_days(self):
+        from instruments.models import TradingCalendarDay
+        TradingCalendarDay.objects.create(date=date(2026, 6, 12), is_trading=True)
+        self.path.write_text(
+            "date,is_trading,note\n2026-06-12,0,День России\n2026-06-13,1,\n", encoding="utf-8",
+        )
+        call_command("load_trading_calendar", csv_path=str(self.path), stdout=StringIO())
+        rows = list(TradingCalendarDay.objects.values_list("date", "is_trading", "note"))
+        self.assertEqual(rows, [
+            (date(2026, 6, 12), False, "День России"),
+            (date(2026, 6, 13), True, ""),
+        ])
+
+    def test_bad_flag_rejected(self):
+        from django.core.management.base import CommandError
+        self.path.write_text("date,is_trading\n2026-06-12,maybe\n", encoding="utf-8")
+        with self.assertRaises(CommandError):
+            call_command("load_trading_calendar", csv_path=str(self.path))
@@ -0,0 +1,236 @@
+"""
+Конкурентная загрузка свечей T-Invest через ``AsyncClient`` SDK.
+
+Диапазон режется на запросы GetCandles по окнам ``CANDLE_WINDOWS`` (наибольшее
+окно для интервала), которые выполняются параллельно (до ``settings.TINKOFF_CANDLES_CONCURRENCY``) под общим для всех
+воркеров ограничителем квоты MarketData (``instruments.tinkoff_ratelimit``).
+Окна выдаются по мере готовности, по возрастанию времени — весь диапазон в
+памяти не собирается.
+Ответ RESOURCE_EXHAUSTED останавливает ограничитель до сброса окна из
+заголовка ``x-ratelimit-reset``, и запрос повторяется — фиксированных пауз
+между запросами нет.
+
+Корутины выполняются в фоновом event loop процесса (отдельный поток):
+AsyncClient на токен живёт в нём между вызовами, как синхронные клиенты
+``tinkoff_client``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Coroutine, Iterator
+
+import numpy as np
+from django.conf import settings
+from tinkoff.invest import AsyncClient, CandleInterval
+
+from instruments.candle_storage import CANDLE_DTYPE
+from instruments.tinkoff_candles import (
+    _CLIENT_MAX_IDLE,
+    CANDLE_WINDOWS,
+    INTERVAL_MAP,
+    CandleChunk,
+    CandleFetchError,
+    _is_request_level,
+    _q,
+)
+from instruments.tinkoff_ratelimit import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Повторов одного запроса окна после RESOURCE_EXHAUSTED.
+_MAX_RATE_LIMIT_RETRIES = 5
+# ts хранилища — московское время в секундах (см. candle_storage).
+_MSK_OFFSET = 3 * 3600
+
+
+# ---------------------------------------------------------------------------
+# Фоновый event loop процесса
+# ---------------------------------------------------------------------------
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+# Доступны только из потока _loop.
+_clients: dict[str, tuple[AsyncClient, Any, float]] = {}
+_client_locks: dict[str, asyncio.Lock] = {}
+
+
+def _reset_after_fork() -> None:
+    # Поток event loop не переживает fork — в дочернем процессе начинаем с нуля.
+    global _loop, _loop_lock
+    _loop = None
+    _loop_lock = threading.Lock()
+    _clients.clear()
+    _client_locks.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="tinkoff-async", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def _submit(coro: Coroutine) -> Future:
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """Выполнить корутину в фоновом loop; прерывание вызывающего (SoftTimeLimitExceeded) отменяет её."""
+    future = _submit(coro)
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+
+async def _client(token: str) -> Any:
+    loop = asyncio.get_running_loop()
+    # Параллельные запросы не должны открыть по клиенту каждый.
+    async with _client_locks.setdefault(token, asyncio.Lock()):
+        entry = _clients.get(token)
+        if entry is not None and loop.time() - entry[2] > _CLIENT_MAX_IDLE:
+            await _discard_client(token)
+            entry = None
+        if entry is None:
+            client = AsyncClient(token)
+            entry = (client, await client.__aenter__(), loop.time())
+        _clients[token] = (entry[0], entry[1], loop.time())
+        return entry[1]
+
+
+async def _discard_client(token: str) -> None:
+    entry = _clients.pop(token, None)
+    if entry is None:
+        return
+    try:
+        await entry[0].__aexit__(None, None, None)
+    except Exception as exc:
+        logger.debug("T-Invest async client close failed: %s", exc)
+
+
+# ---------------------------------------------------------------------------
+# Загрузка
+# ---------------------------------------------------------------------------
+
+def _ratelimit_reset(exc: Exception) -> float | None:
+    """Секунды до сброса квоты, если ``exc`` — RESOURCE_EXHAUSTED, иначе None."""
+    if getattr(getattr(exc, "code", None), "name", None) != "RESOURCE_EXHAUSTED":
+        return None
+    reset = getattr(getattr(exc, "metadata", None), "ratelimit_reset", None)
+    return float(reset) if reset else 1.0
+
+
+def candle_records(candles) -> np.ndarray:
+    """Свечи SDK (ответ GetCandles, бар стрима) → массив CANDLE_DTYPE, без промежуточных dict."""
+    return np.array(
+        [
+            (int(c.time.timestamp()) + _MSK_OFFSET, _q(c.open), _q(c.high), _q(c.low), _q(c.close), c.volume, 0.0)
+            for c in candles
+        ],
+        dtype=CANDLE_DTYPE,
+    )
+
+
+async def _fetch_chunk(
+    token: str, uid: str, start: datetime, end: datetime, interval: CandleInterval,
+) -> np.ndarray:
+    limiter = get_rate_limiter(token, "market_data")
+    retries = 0
+    while True:
+        await limiter.acquire_async()
+        client = await _client(token)
+        try:
+            resp = await client.market_data.get_candles(
+                instrument_id=uid, from_=start, to=end, interval=interval,
+            )
+            return candle_records(resp.candles)
+        except Exception as exc:
+            reset = _ratelimit_reset(exc)
+            if reset is not None and retries < _MAX_RATE_LIMIT_RETRIES:
+                retries += 1
+                logger.info("T-Invest rate limit hit, pausing %.1fs", reset)
+                await limiter.pause_async(reset)
+                continue
+            if not _is_request_level(exc):
+                await _discard_client(token)
+            raise
+
+
+def _windows(from_date: date, till_date: date, window: timedelta) -> Iterator[tuple[datetime, datetime]]:
+    cursor = datetime.combine(from_date, datetime.min.time(), tzinfo=timezone.utc)
+    to_dt = datetime.combine(till_date + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+    while cursor < to_dt:
+        chunk_end = min(cursor + window, to_dt)
+        yield cursor, chunk_end
+        cursor = chunk_end
+
+
+async def iter_candle_chunks(
+    token: str,
+    uid: str,
+    from_date: date,
+    till_date: date,
+    interval: int = 1,
+) -> AsyncIterator[CandleChunk]:
+    """
+    Свечи [from_date, till_date] по окнам ``CANDLE_WINDOWS``, по возрастанию
+    времени. Вперёд запрошено не больше ``TINKOFF_CANDLES_CONCURRENCY`` окон,
+    пока потребитель пишет текущее. Ошибка части запросов — ``CandleFetchError``
+    после окон, полученных без ошибки. После сбоя канала (сеть, UNAVAILABLE,
+    UNAUTHENTICATED, …) новые окна не запрашиваются: уже отправленные
+    дочитываются, и генератор падает.
+    """
+    if interval not in INTERVAL_MAP:
+        interval = 1
+    candle_interval = INTERVAL_MAP[interval]
+    windows = _windows(from_date, till_date, CANDLE_WINDOWS[interval])
+    pending: deque[tuple[datetime, datetime, asyncio.Task]] = deque()
+    error: BaseException | None = None
+    broken = False
+    try:
+        while True:
+            while not broken and len(pending) < settings.TINKOFF_CANDLES_CONCURRENCY:
+                window = next(windows, None)
+                if window is None:
+                    break
+                task = asyncio.ensure_future(_fetch_chunk(token, uid, *window, candle_interval))
+                pending.append((*window, task))
+            if not pending:
+                break
+            start, end, task = pending.popleft()
+            try:
+                records = await task
+            except Exception as exc:
+                error = error or exc
+                broken = broken or not _is_request_level(exc)
+                continue
+            yield CandleChunk(start.date(), (end - timedelta(days=1)).date(), records)
+    finally:
+        for *_, task in pending:
+            task.cancel()
+    if error is not None:
+        logger.error("T-Invest candles failed for uid=%s: %s", uid, error)
+        raise CandleFetchError(str(error)) from error
+
+
+async def _next_chunk(chunks: AsyncIterator[CandleChunk]) -> CandleChunk | None:
+    """Следующее окно ``iter_candle_chunks`` или None в конце — шаг для ``run_sync``."""
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
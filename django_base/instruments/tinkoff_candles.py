@@ -1,14 +1,26 @@
 """
 Получение свечей и разрешение инструментов через T-Invest API (gRPC SDK).
+
+Все запросы идут через ``tinkoff_client(token)`` — общий на процесс gRPC-клиент
+на токен: канал и TLS-рукопожатие переиспользуются между вызовами и задачами
+воркера, а не открываются на каждый запрос. Перед каждым запросом берётся
+квота общего для кластера ограничителя (``instruments.tinkoff_ratelimit``).
 """
 
 from __future__ import annotations
 
 import logging
-from datetime import date, datetime, timedelta, timezone
-from typing import Any
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Any, Iterator, NamedTuple
+
+import numpy as np
 
 from django.core.cache import cache
+from django.db.models import Q
 from tinkoff.invest import (
     CandleInterval,
     Client,
@@ -16,6 +28,8 @@ from tinkoff.invest import (
 )
 from tinkoff.invest.schemas import Quotation
 
+from instruments.tinkoff_ratelimit import get_rate_limiter
+
 logger = logging.getLogger(__name__)
 
 INTERVAL_MAP: dict[int, CandleInterval] = {
@@ -28,18 +42,141 @@ INTERVAL_MAP: dict[int, CandleInterval] = {
     1440: CandleInterval.CANDLE_INTERVAL_DAY,
 }
 
+# Наибольшее окно одного запроса GetCandles для интервала. Лимиты T-Invest
+# (MarketDataService.GetCandles): 1m — 1 день, 5m — 1 неделя, 15m и 30m —
+# 3 недели, 1h — 3 месяца, 4h — 1 месяц, 1D — 6 лет. Окно шире лимита —
+# INVALID_ARGUMENT; для 1h и 1D берём с запасом по числу свечей в ответе.
+CANDLE_WINDOWS: dict[int, timedelta] = {
+    1: timedelta(days=1),
+    5: timedelta(weeks=1),
+    15: timedelta(weeks=3),
+    30: timedelta(weeks=3),
+    60: timedelta(days=90),
+    240: timedelta(days=30),
+    1440: timedelta(days=365),
+}
+
 _UID_CACHE_TTL = 86400  # 24 часа
 
+# Простаивающий дольше клиент переоткрывается: соединение могли молча
+# оборвать балансировщик или NAT.
+_CLIENT_MAX_IDLE = 300  # секунд
+# Клиентов (токенов) на процесс; самый давно использованный закрывается.
+_CLIENT_POOL_SIZE = 8
+# Ошибки конкретного запроса: канал исправен, клиент остаётся в пуле.
+_REQUEST_LEVEL_CODES = frozenset({
+    "NOT_FOUND", "INVALID_ARGUMENT", "RESOURCE_EXHAUSTED", "FAILED_PRECONDITION", "OUT_OF_RANGE",
+})
+
 
 def _q(quotation: Quotation) -> float:
     """Quotation (units + nano) → float."""
     return quotation.units + quotation.nano / 1_000_000_000
 
 
+# ---------------------------------------------------------------------------
+# Пул клиентов
+# ---------------------------------------------------------------------------
+
+class _PooledClient:
+    def __init__(self, token: str):
+        self.client = Client(token)
+        self.services = self.client.__enter__()
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+    def close(self) -> None:
+        try:
+            self.client.__exit__(None, None, None)
+        except Exception as exc:
+            logger.debug("T-Invest client close failed: %s", exc)
+
+
+_pool: dict[str, _PooledClient] = {}
+_pool_lock = threading.Lock()
+
+
+def _reset_pool_after_fork() -> None:
+    # gRPC-каналы родителя в дочернем процессе непригодны (prefork Celery):
+    # просто забываем их, не закрывая.
+    global _pool_lock
+    _pool.clear()
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def _acquire(token: str) -> _PooledClient:
+    with _pool_lock:
+        entry = _pool.pop(token, None)
+        idle = entry is not None and not entry.in_use and time.monotonic() - entry.last_used > _CLIENT_MAX_IDLE
+        if idle:
+            entry.close()
+        if entry is None or idle:
+            entry = _PooledClient(token)
+        _pool[token] = entry  # в конец — порядок dict служит LRU
+        entry.in_use += 1
+        excess = len(_pool) - _CLIENT_POOL_SIZE
+        for stale in [t for t, e in _pool.items() if not e.in_use][:max(excess, 0)]:
+            _pool.pop(stale).close()
+        return entry
+
+
+def _release(entry: _PooledClient) -> None:
+    with _pool_lock:
+        entry.in_use -= 1
+        entry.last_used = time.monotonic()
+
+
+def _discard(token: str, entry: _PooledClient) -> None:
+    with _pool_lock:
+        if _pool.get(token) is entry:
+            del _pool[token]
+    entry.close()
+
+
+def _is_request_level(exc: Exception) -> bool:
+    code = getattr(exc, "code", None)
+    return getattr(code, "name", None) in _REQUEST_LEVEL_CODES
+
+
+@contextmanager
+def tinkoff_client(token: str) -> Iterator[Any]:
+    """
+    Сервисы SDK (``client.market_data``, ``client.instruments`` …) общего
+    клиента процесса для ``token``.
+
+    Клиент, на котором запрос упал не по своей вине (сеть, UNAVAILABLE,
+    UNAUTHENTICATED, …), выбрасывается из пула — следующий вызов откроет
+    новый канал.
+    """
+    entry = _acquire(token)
+    try:
+        yield entry.services
+    except Exception as exc:
+        if not _is_request_level(exc):
+            _discard(token, entry)
+        raise
+    finally:
+        _release(entry)
+
+
+def close_tinkoff_clients() -> None:
+    """Закрыть все клиенты пула (завершение процесса, тесты)."""
+    with _pool_lock:
+        entries = list(_pool.values())
+        _pool.clear()
+    for entry in entries:
+        entry.close()
+
+
 def validate_token(token: str) -> bool:
     """Проверить токен лёгким запросом GetAccounts."""
     try:
-        with Client(token) as client:
+        get_rate_limiter(token, "users").acquire()
+        with tinkoff_client(token) as client:
             client.users.get_accounts()
         return True
     except Exception:
@@ -67,7 +204,8 @@ def resolve_instrument_uid(
     from instruments.models import Futures, Instrument
 
     if instrument_type == "FUTURES":
-        obj = Futures.objects.filter(ticker=ticker).first()
+        # Для фьючерсов в API уходит SECID (SyncTarget.api_ticker).
+        obj = Futures.objects.filter(Q(secid=ticker) | Q(ticker=ticker)).first()
     else:
         obj = Instrument.objects.filter(ticker=ticker).first()
 
@@ -83,6 +221,69 @@ def resolve_instrument_uid(
     return uid
 
 
+def fetch_instrument_uids(token: str) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    UID всех торгуемых акций (TQBR) и фьючерсов (SPBFUT) T-Invest двумя
+    запросами списков: ({тикер: uid}, {тикер фьючерса: uid}), тикеры в
+    верхнем регистре.
+    """
+    limiter = get_rate_limiter(token, "instruments")
+    with tinkoff_client(token) as client:
+        limiter.acquire()
+        shares = client.instruments.shares().instruments
+        limiter.acquire()
+        futures = client.instruments.futures().instruments
+    return (
+        {s.ticker.upper(): s.uid for s in shares if s.class_code == "TQBR"},
+        {f.ticker.upper(): f.uid for f in futures if f.class_code == "SPBFUT"},
+    )
+
+
+def resolve_all_instrument_uids(token: str) -> dict[str, int]:
+    """
+    Массово проставить ``tinkoff_uid`` акциям (по тикеру) и фьючерсам (по
+    SECID) справочника и прогреть кеш ``resolve_instrument_uid``.
+
+    Все изменения пишутся одним ``bulk_update`` на модель в транзакции.
+    Возвращает {"stocks": обновлено, "futures": обновлено, "missing":
+    активных без UID}.
+    """
+    from django.db import transaction
+
+    from instruments.models import Futures, Instrument
+
+    share_uids, future_uids = fetch_instrument_uids(token)
+
+    stocks_changed, futures_changed, warm = [], [], {}
+    missing = 0
+    for obj in Instrument.objects.filter(instrument_type="STOCK").only("pk", "ticker", "tinkoff_uid", "is_active"):
+        uid = share_uids.get(obj.ticker.upper())
+        if uid is None:
+            missing += obj.is_active
+            continue
+        warm[f"tinvest:uid:{obj.ticker}"] = uid
+        if obj.tinkoff_uid != uid:
+            obj.tinkoff_uid = uid
+            stocks_changed.append(obj)
+    for obj in Futures.objects.only("pk", "ticker", "secid", "tinkoff_uid", "is_active"):
+        api_ticker = obj.secid or obj.ticker
+        uid = future_uids.get(api_ticker.upper())
+        if uid is None:
+            missing += obj.is_active
+            continue
+        warm[f"tinvest:uid:{api_ticker}"] = uid
+        if obj.tinkoff_uid != uid:
+            obj.tinkoff_uid = uid
+            futures_changed.append(obj)
+
+    with transaction.atomic():
+        Instrument.objects.bulk_update(stocks_changed, ["tinkoff_uid"], batch_size=500)
+        Futures.objects.bulk_update(futures_changed, ["tinkoff_uid"], batch_size=500)
+    cache.set_many(warm, _UID_CACHE_TTL)
+
+    return {"stocks": len(stocks_changed), "futures": len(futures_changed), "missing": missing}
+
+
 def _fetch_uid_from_api(
     token: str,
     ticker: str,
@@ -91,7 +292,8 @@ def _fetch_uid_from_api(
 ) -> str | None:
     """Запрос UID через T-Invest SDK."""
     try:
-        with Client(token) as client:
+        get_rate_limiter(token, "instruments").acquire()
+        with tinkoff_client(token) as client:
             if instrument_type == "FUTURES":
                 resp = client.instruments.future_by(
                     id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_TICKER,
@@ -111,49 +313,46 @@ def _fetch_uid_from_api(
         return None
 
 
-def fetch_tinkoff_candles(
+class CandleChunk(NamedTuple):
+    """Свечи одного окна запроса: дни [from_date, till_date] и массив CANDLE_DTYPE."""
+
+    from_date: date
+    till_date: date  # включительно
+    records: np.ndarray
+
+
+class CandleFetchError(Exception):
+    """Загрузка свечей прервана ошибкой API; полученные окна уже выданы итератору."""
+
+
+def iter_tinkoff_candles(
     token: str,
     uid: str,
     from_date: date,
     till_date: date,
     interval: int = 1,
-) -> list[dict[str, Any]]:
-    """
-    Загрузить свечи через T-Invest API.
-
-    Возвращает list[dict] в формате, совместимом с save_candles_to_csv:
-    {datetime, open, high, low, close, volume, value}
+) -> Iterator[CandleChunk]:
     """
-    candle_interval = INTERVAL_MAP.get(interval, CandleInterval.CANDLE_INTERVAL_1_MIN)
+    Свечи через T-Invest API по окнам запроса (``CandleChunk``), по
+    возрастанию времени — массивы CANDLE_DTYPE для ``save_candle_records``.
 
-    from_dt = datetime.combine(from_date, datetime.min.time(), tzinfo=timezone.utc)
-    to_dt = datetime.combine(till_date + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+    Диапазон режется на окна наибольшей для интервала ширины
+    (``CANDLE_WINDOWS``: сутки для минут, год для дневных свечей), запросы
+    идут параллельно под ограничителем частоты (``instruments.tinkoff_async``).
+    В памяти — только окна в полёте: каждое окно стоит записать сразу, тогда
+    память воркера не зависит от длины диапазона, а прерванная загрузка не
+    теряет уже записанное.
 
-    result: list[dict[str, Any]] = []
-    try:
-        with Client(token) as client:
-            cursor = from_dt
-            while cursor < to_dt:
-                chunk_end = min(cursor + timedelta(days=1), to_dt)
-                resp = client.market_data.get_candles(
-                    instrument_id=uid,
-                    from_=cursor,
-                    to=chunk_end,
-                    interval=candle_interval,
-                )
-                for c in resp.candles:
-                    msk_time = c.time + timedelta(hours=3)
-                    result.append({
-                        "datetime": msk_time.strftime("%Y-%m-%d %H:%M:%S"),
-                        "open": _q(c.open),
-                        "high": _q(c.high),
-                        "low": _q(c.low),
-                        "close": _q(c.close),
-                        "volume": c.volume,
-                        "value": 0,
-                    })
-                cursor = chunk_end
-    except Exception as exc:
-        logger.error("T-Invest candles failed for uid=%s: %s", uid, exc)
+    Ошибка API — ``CandleFetchError`` после всех полученных окон: неполный
+    ответ нельзя принимать за отсутствие торгов. Остановка потребителя
+    отменяет запросы в полёте.
+    """
+    from instruments.tinkoff_async import _next_chunk, iter_candle_chunks, run_sync
 
-    return result
+    chunks = iter_candle_chunks(token, uid, from_date, till_date, interval)
+    while (chunk := run_sync(_next_chunk(chunks))) is not None:
+        try:
+            yield chunk
+        except BaseException:
+            run_sync(chunks.aclose())
+            raise
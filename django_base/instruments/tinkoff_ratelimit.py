@@ -0,0 +1,172 @@
+"""
+Общий для всех воркеров ограничитель частоты запросов к T-Invest.
+
+Квоты T-Invest считаются на токен и сервис (``settings.TINKOFF_RATE_LIMITS``,
+запросов в минуту). Состояние token bucket хранится в Redis и обновляется
+одним Lua-скриптом, поэтому любое число процессов Celery и веб-запросов вместе
+не выходят за квоту — fan-out задачи ставятся в очередь сразу, без
+разнесения по countdown.
+
+Ответ RESOURCE_EXHAUSTED (``pause``) останавливает выдачу для всех процессов
+до сброса окна. Без Redis (другой бэкенд кэша, Redis недоступен) ограничитель
+работает в пределах процесса.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] — состояние ведра (tokens, ts), KEYS[2] — пауза после RESOURCE_EXHAUSTED.
+# ARGV[1] — токенов в секунду, ARGV[2] — ёмкость. Возвращает 0 (квота выдана)
+# или миллисекунды до следующей попытки. Время — часы Redis, общие для всех.
+_ACQUIRE_SCRIPT = """
+local pause = redis.call('PTTL', KEYS[2])
+if pause > 0 then
+    return pause
+end
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local rate = tonumber(ARGV[1]) / 1000
+local capacity = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate) + 1000)
+return wait
+"""
+
+
+class _RateLimiter:
+    """Общий интерфейс: ``reserve`` не блокирует, ``acquire*`` ждут квоту."""
+
+    def __init__(self, rate_per_minute: int):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1, rate_per_minute // 60)
+
+    def reserve(self) -> float:
+        """Взять квоту: 0 — выдана, иначе секунды до следующей попытки."""
+        raise NotImplementedError
+
+    def pause(self, seconds: float) -> None:
+        """Сервер исчерпал квоту: не выдавать её ``seconds`` секунд."""
+        raise NotImplementedError
+
+    def acquire(self) -> None:
+        while (wait := self.reserve()) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        while (wait := self.reserve()) > 0:
+            await asyncio.sleep(wait)
+
+    async def pause_async(self, seconds: float) -> None:
+        self.pause(seconds)
+
+
+class LocalRateLimiter(_RateLimiter):
+    """Token bucket в памяти процесса."""
+
+    def __init__(self, rate_per_minute: int):
+        super().__init__(rate_per_minute)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class RedisRateLimiter(_RateLimiter):
+    """Token bucket в Redis, общий для всех процессов; при ошибке Redis — локальный."""
+
+    def __init__(self, connection, key: str, rate_per_minute: int):
+        super().__init__(rate_per_minute)
+        self._connection = connection
+        self._script = connection.register_script(_ACQUIRE_SCRIPT)
+        self._keys = [key, f"{key}:pause"]
+        self._fallback = LocalRateLimiter(rate_per_minute)
+
+    def reserve(self) -> float:
+        from redis.exceptions import RedisError
+
+        try:
+            return int(self._script(keys=self._keys, args=[self.rate, self.capacity])) / 1000
+        except RedisError as exc:
+            logger.warning("Redis rate limiter unavailable, using local: %s", exc)
+            return self._fallback.reserve()
+
+    async def acquire_async(self) -> None:
+        # EVALSHA блокирует: в event loop загрузчика он стопорил бы все окна в полёте.
+        while (wait := await asyncio.to_thread(self.reserve)) > 0:
+            await asyncio.sleep(wait)
+
+    async def pause_async(self, seconds: float) -> None:
+        await asyncio.to_thread(self.pause, seconds)
+
+    def pause(self, seconds: float) -> None:
+        from redis.exceptions import RedisError
+
+        try:
+            self._connection.set(self._keys[1], 1, px=max(1, int(seconds * 1000)))
+        except RedisError as exc:
+            logger.warning("Redis rate limiter unavailable, using local: %s", exc)
+            self._fallback.pause(seconds)
+
+
+_limiters: dict[tuple[str, str], _RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _redis_connection():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def get_rate_limiter(token: str, service: str) -> _RateLimiter:
+    """Ограничитель квоты ``service`` (ключ ``TINKOFF_RATE_LIMITS``) для токена."""
+    with _limiters_lock:
+        limiter = _limiters.get((token, service))
+        if limiter is None:
+            rate = settings.TINKOFF_RATE_LIMITS[service]
+            connection = _redis_connection()
+            if connection is None:
+                limiter = LocalRateLimiter(rate)
+            else:
+                digest = hashlib.sha256(token.encode()).hexdigest()[:16]
+                limiter = RedisRateLimiter(connection, f"tinvest:rl:{service}:{digest}", rate)
+            _limiters[(token, service)] = limiter
+        return limiter
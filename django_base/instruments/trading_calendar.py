@@ -0,0 +1,37 @@
+"""
+Торговый календарь Мосбиржи для поиска пропусков свечей.
+
+Базовое правило — торги идут Пн-Пт. Исключения (праздники в будни и рабочие
+выходные) хранятся в ``TradingCalendarDay`` и загружаются командой
+``manage.py load_trading_calendar``.
+"""
+
+from __future__ import annotations
+
+from datetime import date
+
+import numpy as np
+
+
+def _exceptions(start: date, end: date) -> tuple[list[date], list[date]]:
+    """(праздники, рабочие выходные) из [start, end]."""
+    from instruments.models import TradingCalendarDay
+
+    holidays: list[date] = []
+    workdays: list[date] = []
+    rows = TradingCalendarDay.objects.filter(date__range=(start, end)).values_list("date", "is_trading")
+    for day, is_trading in rows:
+        (workdays if is_trading else holidays).append(day)
+    return holidays, workdays
+
+
+def trading_days(start: date, end: date) -> np.ndarray:
+    """Торговые дни из [start, end] по возрастанию — массив datetime64[D]."""
+    if start > end:
+        return np.array([], dtype="datetime64[D]")
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+    holidays, workdays = _exceptions(start, end)
+    mask = np.is_busday(days, holidays=np.array(holidays, dtype="datetime64[D]"))
+    if workdays:
+        mask |= np.isin(days, np.array(workdays, dtype="datetime64[D]"))
+    return days[mask]
@@ -3,10 +3,14 @@ from datetime import date, timedelta
 from django.conf import settings
 from django.core.cache import cache
 from django.db.models import Count, Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from rest_framework import status
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 from instruments.tasks import sync_candles_for_instrument
@@ -18,6 +22,9 @@ from .list_query import (
     normalize_search_param,
 )
 from .models import Futures, Instrument
+from .candle_cache import candles_cache_key
+from .candle_storage import ts_to_day
+from .renderers import CandleBinaryRenderer, pack_candles
 from .serializers import (
     FuturesListSerializer,
     InstrumentDetailSerializer,
@@ -141,15 +148,37 @@ class InstrumentStatsView(APIView):
 
 
 class CandleDataView(APIView):
-    """OHLCV candle data for charting."""
+    """OHLCV candle data for charting.
+
+    ``?layout=columns`` — колоночная форма ``candles: {time: [...], open: [...], …}``
+    вместо списка объектов (значения те же).
+
+    ``?stream=1`` — потоковый ответ: JSON кодируется кусками прямо из массива
+    свечей и сжимается по Accept-Encoding (br/gzip); лимит баров —
+    STREAM_MAX_CANDLES, кэш не используется.
+
+    ``?format=bin`` или ``Accept: application/vnd.candles`` — компактный
+    бинарный формат (колонки float64, см. ``instruments.renderers``);
+    JSON остаётся форматом по умолчанию.
+
+    ``?since=<unix_ts>`` — инкрементальное обновление live-графика: только бары
+    с ``time >= since`` (клиент передаёт ``time`` своего последнего бара и
+    получает его актуальную версию плюс новые). Без ``from`` окно начинается
+    с дня курсора; такие ответы не кэшируются.
+    """
 
     MAX_CANDLES = 5000
+    STREAM_MAX_CANDLES = 200_000
+    LAYOUTS = ("rows", "columns")
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CandleBinaryRenderer]
 
     def get(self, request, ticker):
+        from instruments.candle_cache import read_cached_candle_records
+        from instruments.candle_storage import records_to_frame
         from instruments.candles import (
+            candles_to_columns,
             candles_to_json,
-            read_candles,
-            resample_candles,
+            read_candle_records,
         )
 
         is_instrument = Instrument.objects.filter(ticker=ticker, is_active=True).exists()
@@ -168,6 +197,9 @@ class CandleDataView(APIView):
         from_date = request.GET.get("from")
         till_date = request.GET.get("till")
         interval = request.GET.get("interval", "1")
+        layout = request.GET.get("layout", "rows")
+        if layout not in self.LAYOUTS:
+            layout = "rows"
 
         try:
             interval = int(interval)
@@ -184,37 +216,108 @@ class CandleDataView(APIView):
         except ValueError:
             till_date = today
 
+        since = request.GET.get("since")
+        try:
+            since = int(since) if since else None
+        except ValueError:
+            since = None
+        if since is not None and not request.GET.get("from"):
+            from_date = min(ts_to_day(since), till_date)
+
         if from_date > till_date:
             from_date, till_date = till_date, from_date
 
-        cache_key = f"candles:{ticker}:{from_date}:{till_date}:{interval}"
-        cached = cache.get(cache_key)
-        if cached is not None:
-            return Response(cached)
-
-        df = read_candles(ticker, from_date, till_date)
-        if not df.empty and interval > 1:
-            df = resample_candles(df, interval)
-
-        candles = candles_to_json(df)
+        binary = isinstance(request.accepted_renderer, CandleBinaryRenderer)
+        if request.GET.get("stream") in ("1", "true") and not binary:
+            return self._stream(request, ticker, from_date, till_date, interval, layout, since)
+
+        # Ответы по курсору малы и уникальны — кэшировать их незачем.
+        wire = "bin" if binary else layout
+        cache_key = None
+        if since is None:
+            cache_key = candles_cache_key(ticker, from_date, till_date, interval, wire)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return Response(cached)
+
+        # Читается только хвост диапазона: не больше MAX_CANDLES баров. Окна
+        # собираются из кэша дневных/месячных блоков; курсор читает напрямую.
+        if since is None:
+            records = read_cached_candle_records(
+                ticker, from_date, till_date, interval, limit=self.MAX_CANDLES,
+            )
+        else:
+            records = read_candle_records(
+                ticker, from_date, till_date, interval, limit=self.MAX_CANDLES, since=since,
+            )
 
-        if len(candles) > self.MAX_CANDLES:
-            candles = candles[-self.MAX_CANDLES:]
+        ttl = 300 if till_date >= today else 86400
+        if binary:
+            payload = pack_candles(records, interval)
+            if cache_key is not None:
+                cache.set(cache_key, payload, ttl)
+            return Response(payload)
+
+        df = records_to_frame(records)
+        if layout == "columns":
+            candles = candles_to_columns(df)
+        else:
+            candles = candles_to_json(df)
+        count = len(df)
 
         result = {
             "ticker": ticker,
             "interval": interval,
             "from": from_date.isoformat(),
             "till": till_date.isoformat(),
-            "count": len(candles),
+            "layout": layout,
+            "count": count,
             "candles": candles,
         }
-
-        ttl = 300 if till_date >= today else 86400
-        cache.set(cache_key, result, ttl)
+        if since is not None:
+            result["since"] = since
+        if cache_key is not None:
+            cache.set(cache_key, result, ttl)
 
         return Response(result)
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Ошибки (404, 401, …) всегда отдаются JSON, даже при format=bin.
+        if response.status_code >= 400 and isinstance(
+            getattr(response, "accepted_renderer", None), CandleBinaryRenderer,
+        ):
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+        return response
+
+    def _stream(self, request, ticker, from_date, till_date, interval, layout, since):
+        from instruments.candle_stream import (
+            compress_stream,
+            iter_candles_json,
+            negotiate_encoding,
+        )
+        from instruments.candles import read_candle_records
+
+        records = read_candle_records(
+            ticker, from_date, till_date, interval, limit=self.STREAM_MAX_CANDLES, since=since,
+        )
+        meta = {
+            "ticker": ticker,
+            "interval": interval,
+            "from": from_date.isoformat(),
+            "till": till_date.isoformat(),
+        }
+        encoding = negotiate_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        response = StreamingHttpResponse(
+            compress_stream(iter_candles_json(meta, records, layout), encoding),
+            content_type="application/json",
+        )
+        if encoding:
+            response["Content-Encoding"] = encoding
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
 
 def _resolve_market(ticker: str):
     """Возвращает (market, api_ticker) либо (None, None) если тикер не найден."""